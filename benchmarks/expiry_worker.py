@@ -0,0 +1,67 @@
+"""Expiry-wave worker: runs lab-manager's scheduler pass in its own process.
+
+Services use flat module names (main, database, models, ...), so each one
+has to be imported in a separate interpreter. Prints one JSON result line.
+"""
+from datetime import datetime, timedelta
+import argparse
+import json
+import time
+import sys
+import os
+
+from harness import summarize
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--labs", type=int, default=200)
+    parser.add_argument("--database-url", required=True)
+    parser.add_argument("--container-url", required=True)
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ["CONTAINER_SERVICE_URL"] = args.container_url
+    services_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "services")
+    sys.path[:0] = [os.path.join(services_dir, "lab-manager", "app"), os.path.join(services_dir, "shared")]
+
+    from database import Base, engine, SessionLocal
+    from models import Lab, ScheduledTask
+    from scheduler import Scheduler
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    due = datetime.utcnow() - timedelta(minutes=1)
+    labs = [Lab(user_id=index % 50, name=f"bench-{index}", container_id=f"{index + 1:064x}", expires_at=due, status="running")
+            for index in range(args.labs)]
+    db.add_all(labs)
+    db.commit()
+    db.add_all([ScheduledTask(task_type="expire_lab", target_id=lab.id, execute_at=due) for lab in labs])
+    db.commit()
+    db.close()
+
+    scheduler = Scheduler()
+    latencies = []
+    expire_lab = scheduler.lab_service.expire_lab
+
+    async def timed_expire_lab(*call_args, **call_kwargs):
+        started = time.perf_counter()
+        try:
+            return await expire_lab(*call_args, **call_kwargs)
+        finally:
+            latencies.append(time.perf_counter() - started)
+
+    scheduler.lab_service.expire_lab = timed_expire_lab
+
+    started = time.perf_counter()
+    scheduler.check_expired_labs()
+    elapsed = time.perf_counter() - started
+
+    db = SessionLocal()
+    failed = db.query(ScheduledTask).filter(ScheduledTask.status != "completed").count()
+    db.close()
+    print(json.dumps(summarize("expiry_wave", latencies, failed, elapsed, labs=args.labs)))
+
+
+if __name__ == "__main__":
+    main()
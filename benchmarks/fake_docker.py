@@ -0,0 +1,368 @@
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
+from typing import Optional, List, Dict, Any
+from datetime import datetime, timezone
+import tarfile
+import asyncio
+import hashlib
+import base64
+import io
+import struct
+import json
+import re
+import uuid
+
+# Simulated per-operation latency in seconds, overridable per engine
+DEFAULT_LATENCIES = {
+    "ping": 0.0,
+    "info": 0.001,
+    "create": 0.05,
+    "start": 0.03,
+    "stop": 0.02,
+    "remove": 0.02,
+    "inspect": 0.002,
+    "list": 0.005,
+    "stats": 0.1,
+    "top": 0.01,
+    "logs": 0.005,
+    "images": 0.002,
+    "volume": 0.002,
+    "archive": 0.005
+}
+
+API_VERSION = "1.41"
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def _not_found(what: str) -> JSONResponse:
+    return JSONResponse({"message": f"No such {what}"}, status_code=404)
+
+
+class _StripApiVersion:
+    """docker-py prefixes every path with /v1.xx; route on the bare path"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            scope = dict(scope, path=re.sub(r"^/v[0-9.]+", "", scope["path"]))
+        await self.app(scope, receive, send)
+
+
+class FakeDockerEngine:
+    """In-memory Docker Engine API good enough for docker-py's container, image and volume calls.
+
+    Exec start and attach (which hijack the connection) are not supported.
+    """
+
+    def __init__(self, latencies: Optional[Dict[str, float]] = None, ncpu: int = 16,
+                 mem_total: int = 64 * 1024 ** 3, images: Optional[List[str]] = None):
+        self.latencies = {**DEFAULT_LATENCIES, **(latencies or {})}
+        self.ncpu = ncpu
+        self.mem_total = mem_total
+        self.containers: Dict[str, Dict[str, Any]] = {}
+        self.names: Dict[str, str] = {}
+        self.images: Dict[str, Dict[str, Any]] = {}
+        self.volumes: Dict[str, Dict[str, Any]] = {}
+        self.calls: Dict[str, int] = {}
+        for tag in images or ["ubuntu:22.04", "python:3.11", "node:18", "nginx:latest"]:
+            self._add_image(tag)
+        self.app = _StripApiVersion(self._build_app())
+
+    def _add_image(self, tag: str) -> Dict[str, Any]:
+        image_id = "sha256:" + hashlib.sha256(tag.encode()).hexdigest()
+        image = {"Id": image_id, "RepoTags": [tag], "Size": 100 * 1024 ** 2, "Created": 0}
+        self.images[image_id] = image
+        return image
+
+    def _find_image(self, ref: str) -> Optional[Dict[str, Any]]:
+        ref = ref if ":" in ref.rsplit("/", 1)[-1] or ref.startswith("sha256:") else f"{ref}:latest"
+        for image in self.images.values():
+            if ref in image["RepoTags"] or image["Id"] == ref or image["Id"].split(":")[1].startswith(ref):
+                return image
+        return None
+
+    def _find(self, ref: str) -> Optional[Dict[str, Any]]:
+        if ref in self.containers:
+            return self.containers[ref]
+        if ref.lstrip("/") in self.names:
+            return self.containers[self.names[ref.lstrip("/")]]
+        for container_id, container in self.containers.items():
+            if container_id.startswith(ref):
+                return container
+        return None
+
+    async def _delay(self, operation: str):
+        self.calls[operation] = self.calls.get(operation, 0) + 1
+        latency = self.latencies.get(operation, 0)
+        if latency:
+            await asyncio.sleep(latency)
+
+    def seed(self, count: int, labels: Dict[str, str], image: str = "ubuntu:22.04", name_prefix: str = "seed"):
+        """Create running containers directly, without simulated latency"""
+        for index in range(count):
+            self._create(f"{name_prefix}-{uuid.uuid4().hex[:8]}-{index}", {"Image": image, "Labels": dict(labels)})["State"].update(
+                Status="running", Running=True, StartedAt=_now()
+            )
+
+    def _create(self, name: Optional[str], config: Dict[str, Any]) -> Dict[str, Any]:
+        container_id = uuid.uuid4().hex + uuid.uuid4().hex
+        name = name or f"fake_{container_id[:12]}"
+        image = self._find_image(config.get("Image", "")) or self._add_image(config.get("Image", "unknown"))
+        host_config = config.get("HostConfig") or {}
+        ports = {}
+        for container_port, bindings in (host_config.get("PortBindings") or {}).items():
+            ports[container_port] = [{"HostIp": "0.0.0.0", "HostPort": str(b.get("HostPort", ""))} for b in bindings]
+        container = {
+            "Id": container_id,
+            "Name": f"/{name}",
+            "Created": _now(),
+            "Image": image["Id"],
+            "Config": {"Image": config.get("Image"), "Labels": config.get("Labels") or {}, "Tty": bool(config.get("Tty"))},
+            "HostConfig": host_config,
+            "State": {"Status": "created", "Running": False, "Paused": False, "StartedAt": "", "FinishedAt": ""},
+            "NetworkSettings": {"Ports": ports},
+            "_logs": [f"{_now()} container {name} created\n"]
+        }
+        self.containers[container_id] = container
+        self.names[name] = container_id
+        return container
+
+    def _inspect(self, container: Dict[str, Any]) -> Dict[str, Any]:
+        return {k: v for k, v in container.items() if not k.startswith("_")}
+
+    def _summary(self, container: Dict[str, Any]) -> Dict[str, Any]:
+        ports = []
+        for container_port, bindings in container["NetworkSettings"]["Ports"].items():
+            number, proto = container_port.split("/")
+            for binding in bindings or []:
+                ports.append({"PrivatePort": int(number), "PublicPort": int(binding["HostPort"] or 0),
+                              "Type": proto, "IP": binding["HostIp"]})
+        return {
+            "Id": container["Id"],
+            "Names": [container["Name"]],
+            "Image": container["Config"]["Image"],
+            "ImageID": container["Image"],
+            "Created": 0,
+            "State": container["State"]["Status"],
+            "Status": container["State"]["Status"],
+            "Ports": ports,
+            "Labels": container["Config"]["Labels"]
+        }
+
+    def _matches(self, container: Dict[str, Any], filters: Dict[str, List[str]], include_all: bool) -> bool:
+        state = container["State"]["Status"]
+        if not include_all and state != "running":
+            return False
+        # Several status values match any of them, like Docker
+        if filters.get("status") and state not in filters["status"]:
+            return False
+        labels = container["Config"]["Labels"]
+        for selector in filters.get("label", []):
+            key, _, value = selector.partition("=")
+            if key not in labels or (value and labels[key] != value):
+                return False
+        for name in filters.get("name", []):
+            if name not in container["Name"]:
+                return False
+        return True
+
+    def _stats(self, container: Dict[str, Any]) -> Dict[str, Any]:
+        seed = int(container["Id"][:8], 16)
+        total = 10 ** 9 + seed % 10 ** 6
+        return {
+            "read": _now(),
+            "cpu_stats": {"cpu_usage": {"total_usage": total + 5 * 10 ** 6}, "system_cpu_usage": 10 ** 12 + 10 ** 9,
+                          "online_cpus": self.ncpu},
+            "precpu_stats": {"cpu_usage": {"total_usage": total}, "system_cpu_usage": 10 ** 12},
+            "memory_stats": {"usage": 64 * 1024 ** 2, "limit": self.mem_total, "stats": {"inactive_file": 0}},
+            "networks": {"eth0": {"rx_bytes": seed % 10 ** 6, "tx_bytes": seed % 10 ** 5}},
+            "blkio_stats": {"io_service_bytes_recursive": [{"op": "read", "value": 4096}, {"op": "write", "value": 8192}]},
+            "pids_stats": {"current": 3}
+        }
+
+    def _build_app(self) -> FastAPI:
+        app = FastAPI()
+        engine = self
+
+        @app.get("/_ping")
+        async def ping():
+            await engine._delay("ping")
+            return Response("OK", media_type="text/plain")
+
+        @app.get("/version")
+        async def version():
+            return {"ApiVersion": API_VERSION, "MinAPIVersion": "1.12", "Version": "24.0.0-fake", "Os": "linux"}
+
+        @app.get("/info")
+        async def info():
+            await engine._delay("info")
+            return {"NCPU": engine.ncpu, "MemTotal": engine.mem_total, "Containers": len(engine.containers),
+                    "Name": "fake-docker", "Driver": "overlay2"}
+
+        @app.get("/images/json")
+        async def list_images():
+            await engine._delay("images")
+            return list(engine.images.values())
+
+        @app.get("/images/{ref:path}/json")
+        async def inspect_image(ref: str):
+            await engine._delay("inspect")
+            image = engine._find_image(ref)
+            return image if image else _not_found("image")
+
+        @app.post("/images/create")
+        async def pull_image(request: Request):
+            await engine._delay("create")
+            tag = request.query_params.get("tag") or "latest"
+            engine._add_image(f"{request.query_params.get('fromImage')}:{tag}")
+            return Response(json.dumps({"status": "Downloaded"}) + "\n", media_type="application/json")
+
+        @app.post("/containers/create")
+        async def create_container(request: Request):
+            await engine._delay("create")
+            config = await request.json()
+            name = request.query_params.get("name")
+            if name and name in engine.names:
+                return JSONResponse({"message": f"Conflict. The container name \"/{name}\" is already in use"},
+                                    status_code=409)
+            container = engine._create(name, config)
+            return JSONResponse({"Id": container["Id"], "Warnings": []}, status_code=201)
+
+        @app.get("/containers/json")
+        async def list_containers(request: Request):
+            await engine._delay("list")
+            filters = json.loads(request.query_params.get("filters") or "{}")
+            # docker-py sends filters as {"key": ["value", ...]}
+            filters = {key: value if isinstance(value, list) else list(value) for key, value in filters.items()}
+            include_all = request.query_params.get("all") in ("1", "true", "True")
+            return [engine._summary(c) for c in engine.containers.values() if engine._matches(c, filters, include_all)]
+
+        @app.get("/containers/{ref}/json")
+        async def inspect_container(ref: str):
+            await engine._delay("inspect")
+            container = engine._find(ref)
+            return engine._inspect(container) if container else _not_found("container")
+
+        def transition(operation: str, status: str, running: bool):
+            async def handler(ref: str):
+                await engine._delay(operation)
+                container = engine._find(ref)
+                if not container:
+                    return _not_found("container")
+                container["State"].update(Status=status, Running=running, Paused=status == "paused")
+                if running:
+                    container["State"]["StartedAt"] = _now()
+                else:
+                    container["State"]["FinishedAt"] = _now()
+                return Response(status_code=204)
+            return handler
+
+        app.post("/containers/{ref}/start")(transition("start", "running", True))
+        app.post("/containers/{ref}/restart")(transition("start", "running", True))
+        app.post("/containers/{ref}/unpause")(transition("start", "running", True))
+        app.post("/containers/{ref}/stop")(transition("stop", "exited", False))
+        app.post("/containers/{ref}/kill")(transition("stop", "exited", False))
+        app.post("/containers/{ref}/pause")(transition("stop", "paused", False))
+
+        @app.delete("/containers/{ref}")
+        async def remove_container(ref: str):
+            await engine._delay("remove")
+            container = engine._find(ref)
+            if not container:
+                return _not_found("container")
+            engine.containers.pop(container["Id"], None)
+            engine.names.pop(container["Name"].lstrip("/"), None)
+            return Response(status_code=204)
+
+        @app.post("/containers/{ref}/wait")
+        async def wait_container(ref: str):
+            await engine._delay("start")
+            container = engine._find(ref)
+            if not container:
+                return _not_found("container")
+            container["State"].update(Status="exited", Running=False, ExitCode=0, FinishedAt=_now())
+            return {"StatusCode": 0}
+
+        @app.get("/containers/{ref}/archive")
+        async def get_archive(ref: str, path: str):
+            await engine._delay("archive")
+            if not engine._find(ref):
+                return _not_found("container")
+            # An empty directory named after the requested path
+            buffer = io.BytesIO()
+            with tarfile.open(fileobj=buffer, mode="w") as archive:
+                entry = tarfile.TarInfo(path.rstrip("/").rsplit("/", 1)[-1] or "root")
+                entry.type = tarfile.DIRTYPE
+                archive.addfile(entry)
+            stat = base64.b64encode(json.dumps({"name": entry.name, "size": 0, "mode": 2147484141}).encode())
+            return Response(buffer.getvalue(), media_type="application/x-tar",
+                            headers={"X-Docker-Container-Path-Stat": stat.decode()})
+
+        @app.put("/containers/{ref}/archive")
+        async def put_archive(ref: str, request: Request):
+            await engine._delay("archive")
+            if not engine._find(ref):
+                return _not_found("container")
+            async for _ in request.stream():
+                pass
+            return Response(status_code=200)
+
+        @app.post("/volumes/create")
+        async def create_volume(request: Request):
+            await engine._delay("volume")
+            config = await request.json()
+            name = config.get("Name") or uuid.uuid4().hex
+            volume = engine.volumes.setdefault(name, {
+                "Name": name,
+                "Driver": config.get("Driver") or "local",
+                "Mountpoint": f"/var/lib/docker/volumes/{name}/_data",
+                "Labels": config.get("Labels") or {},
+                "Options": config.get("DriverOpts") or {},
+                "Scope": "local",
+                "CreatedAt": _now()
+            })
+            return JSONResponse(volume, status_code=201)
+
+        @app.get("/volumes/{name}")
+        async def inspect_volume(name: str):
+            await engine._delay("volume")
+            return engine.volumes[name] if name in engine.volumes else _not_found("volume")
+
+        @app.delete("/volumes/{name}")
+        async def remove_volume(name: str):
+            await engine._delay("volume")
+            if engine.volumes.pop(name, None) is None:
+                return _not_found("volume")
+            return Response(status_code=204)
+
+        @app.get("/containers/{ref}/stats")
+        async def container_stats(ref: str):
+            await engine._delay("stats")
+            container = engine._find(ref)
+            return engine._stats(container) if container else _not_found("container")
+
+        @app.get("/containers/{ref}/top")
+        async def container_top(ref: str):
+            await engine._delay("top")
+            if not engine._find(ref):
+                return _not_found("container")
+            return {"Titles": ["UID", "PID", "PPID", "C", "STIME", "TTY", "TIME", "CMD"],
+                    "Processes": [["root", "1", "0", "0", "00:00", "?", "00:00:00", "/bin/sh"]]}
+
+        @app.get("/containers/{ref}/logs")
+        async def container_logs(ref: str):
+            await engine._delay("logs")
+            container = engine._find(ref)
+            if not container:
+                return _not_found("container")
+            # Non-TTY containers use the multiplexed stream format
+            body = b"".join(struct.pack(">BxxxL", 1, len(line.encode())) + line.encode()
+                            for line in container["_logs"])
+            return Response(body, media_type="application/vnd.docker.raw-stream")
+
+        return app
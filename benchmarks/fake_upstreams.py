@@ -0,0 +1,52 @@
+from fastapi import FastAPI, Request, Header, HTTPException
+from typing import Optional
+import asyncio
+
+
+def fake_auth_service(latency: float = 0.002) -> FastAPI:
+    """Auth service stand-in: every bearer token "user-<n>" verifies as user-<n>@bench.local"""
+    app = FastAPI()
+
+    @app.post("/verify")
+    async def verify(authorization: Optional[str] = Header(None)):
+        await asyncio.sleep(latency)
+        if not authorization or not authorization.startswith("Bearer "):
+            raise HTTPException(status_code=401, detail="Could not validate credentials")
+        return {"email": f"{authorization.split(' ', 1)[1]}@bench.local", "valid": True}
+
+    @app.post("/login")
+    async def login(request: Request):
+        await asyncio.sleep(latency)
+        body = await request.json()
+        return {"access_token": body.get("email", "user-0").split("@")[0], "token_type": "bearer"}
+
+    @app.get("/health")
+    async def health():
+        return {"status": "healthy"}
+
+    return app
+
+
+def fake_container_service(latency: float = 0.02) -> FastAPI:
+    """Container-manager stand-in for lab-manager scenarios; accepts any create/delete"""
+    app = FastAPI()
+    app.state.calls = {"create": 0, "delete": 0}
+
+    @app.post("/{path:path}")
+    async def create(path: str):
+        await asyncio.sleep(latency)
+        app.state.calls["create"] += 1
+        return {"id": "0", "data": {"id": "0", "container_id": "0"}}
+
+    @app.delete("/{path:path}")
+    async def delete(path: str):
+        await asyncio.sleep(latency)
+        app.state.calls["delete"] += 1
+        return {"message": "Lab deleted successfully"}
+
+    @app.get("/{path:path}")
+    async def get(path: str):
+        await asyncio.sleep(latency)
+        return {"data": []}
+
+    return app
@@ -0,0 +1,204 @@
+from typing import Optional, List, Dict, Any, Callable, Awaitable
+import subprocess
+import math
+import threading
+import asyncio
+import socket
+import time
+import json
+import sys
+import os
+
+import httpx
+import uvicorn
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVICES_DIR = os.path.join(REPO_ROOT, "services")
+# Modules every image gets copied next to its app (see the Dockerfiles)
+SHARED_DIR = os.path.join(SERVICES_DIR, "shared")
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_http(url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f"{url} did not become ready within {timeout}s")
+
+
+class InProcessServer:
+    """Serve an ASGI app (fake engine or upstream) from a background thread"""
+
+    def __init__(self, app, port: Optional[int] = None):
+        self.port = port or free_port()
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def __enter__(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join(timeout=5)
+
+
+class ServiceProcess:
+    """Run one FluxLabs service locally with uvicorn (or gunicorn for several workers), the same way its Dockerfile does"""
+
+    def __init__(self, service: str, env: Optional[Dict[str, str]] = None, port: Optional[int] = None,
+                 workers: int = 1, gunicorn: bool = False):
+        self.service = service
+        self.port = port or free_port()
+        self.env = {**os.environ, **(env or {})}
+        self.env["PYTHONPATH"] = os.pathsep.join(filter(None, [SHARED_DIR, self.env.get("PYTHONPATH")]))
+        self.workers = workers
+        self.gunicorn = gunicorn
+        self.process: Optional[subprocess.Popen] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def __enter__(self):
+        app_dir = os.path.join(SERVICES_DIR, self.service, "app")
+        if (self.gunicorn or self.workers > 1) and os.path.exists(os.path.join(app_dir, "gunicorn.conf.py")):
+            # Multi-worker services run under gunicorn like their Dockerfile
+            command = [
+                sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "main:app",
+                "--bind", f"127.0.0.1:{self.port}", "--workers", str(self.workers), "--log-level", "warning"
+            ]
+            self.env["GATEWAY_WORKERS"] = str(self.workers)
+        else:
+            command = [
+                sys.executable, "-m", "uvicorn", "main:app",
+                "--app-dir", app_dir,
+                "--host", "127.0.0.1", "--port", str(self.port),
+                "--log-level", "warning", "--no-access-log"
+            ]
+            if self.workers > 1:
+                command += ["--workers", str(self.workers)]
+        self.process = subprocess.Popen(command, env=self.env, cwd=app_dir)
+        try:
+            wait_for_http(f"{self.url}/health")
+        except Exception:
+            self.__exit__()
+            raise
+        return self
+
+    def __exit__(self, *exc):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, math.ceil(p / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(name: str, latencies: List[float], errors: int, elapsed: float, **extra) -> Dict[str, Any]:
+    ordered = sorted(latencies)
+    total = len(latencies) + errors
+    return {
+        "scenario": name,
+        "requests": total,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(ordered, 50) * 1000, 2),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 2),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 2),
+        "max_ms": round((ordered[-1] if ordered else 0.0) * 1000, 2),
+        **extra
+    }
+
+
+async def run_load(name: str, request: Callable[[httpx.AsyncClient, int], Awaitable[httpx.Response]],
+                   total: int, concurrency: int, **extra) -> Dict[str, Any]:
+    """Issue `total` requests with at most `concurrency` in flight and summarize latencies"""
+    latencies: List[float] = []
+    errors = 0
+    next_index = 0
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=60.0, limits=limits) as client:
+        async def worker():
+            nonlocal errors, next_index
+            while next_index < total:
+                index = next_index
+                next_index += 1
+                started = time.perf_counter()
+                try:
+                    response = await request(client, index)
+                    failed = response.status_code >= 400
+                except httpx.HTTPError:
+                    failed = True
+                if failed:
+                    errors += 1
+                else:
+                    latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return summarize(name, latencies, errors, elapsed, concurrency=concurrency, **extra)
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+def save_baseline(path: str, results: List[Dict[str, Any]]):
+    with open(path, "w") as baseline_file:
+        json.dump({
+            "revision": git_revision(),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": sys.version.split()[0],
+            "results": {result["scenario"]: result for result in results}
+        }, baseline_file, indent=2)
+
+
+def compare_to_baseline(path: str, results: List[Dict[str, Any]], tolerance: float = 0.10) -> List[str]:
+    """Return regressions: p95 or throughput worse than baseline by more than tolerance"""
+    with open(path) as baseline_file:
+        baseline = json.load(baseline_file)["results"]
+
+    regressions = []
+    for result in results:
+        before = baseline.get(result["scenario"])
+        if not before:
+            continue
+        if before["p95_ms"] and result["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{result['scenario']}: p95 {before['p95_ms']}ms -> {result['p95_ms']}ms")
+        if before["throughput_rps"] and result["throughput_rps"] < before["throughput_rps"] * (1 - tolerance):
+            regressions.append(
+                f"{result['scenario']}: throughput {before['throughput_rps']} -> {result['throughput_rps']} req/s"
+            )
+    return regressions
@@ -0,0 +1,69 @@
+"""Run FluxLabs benchmark scenarios and optionally save or compare a JSON baseline.
+
+    python benchmarks/run.py --scenario all --save benchmarks/baseline.json
+    python benchmarks/run.py --scenario dashboard_polling --compare benchmarks/baseline.json
+"""
+from typing import Dict
+import argparse
+import asyncio
+import sys
+
+from harness import save_baseline, compare_to_baseline
+from scenarios import SCENARIOS
+
+
+def parse_latencies(value: str) -> Dict[str, float]:
+    """Parse "create=0.2,stats=0.5" into per-operation fake Docker latencies"""
+    latencies = {}
+    for item in filter(None, value.split(",")):
+        operation, _, seconds = item.partition("=")
+        latencies[operation.strip()] = float(seconds)
+    return latencies
+
+
+def print_result(result: Dict):
+    print(f"{result['scenario']:<20} {result['requests']:>6} req  {result['errors']:>4} err  "
+          f"{result['throughput_rps']:>9.2f} req/s  p50 {result['p50_ms']:>8.2f}ms  "
+          f"p95 {result['p95_ms']:>8.2f}ms  p99 {result['p99_ms']:>8.2f}ms")
+
+
+async def main(args) -> int:
+    names = list(SCENARIOS) if args.scenario == "all" else args.scenario.split(",")
+    options = {"docker_latencies": parse_latencies(args.docker_latency), "gateway_workers": args.gateway_workers}
+    if args.requests:
+        options["requests"] = args.requests
+    if args.concurrency:
+        options["concurrency"] = args.concurrency
+
+    results = []
+    for name in names:
+        result = await SCENARIOS[name](**options)
+        print_result(result)
+        for workers, run in result.get("scaling", {}).items():
+            print(f"  {workers} workers: {run['throughput_rps']:>9.2f} req/s  efficiency {run['efficiency']:.2f}")
+        results.append(result)
+
+    if args.save:
+        save_baseline(args.save, results)
+        print(f"Baseline saved to {args.save}")
+
+    if args.compare:
+        regressions = compare_to_baseline(args.compare, results, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="FluxLabs benchmark suite")
+    parser.add_argument("--scenario", default="all", help=f"all or a comma-separated list of: {', '.join(SCENARIOS)}")
+    parser.add_argument("--requests", type=int, help="Override the scenario's request count")
+    parser.add_argument("--concurrency", type=int, help="Override the scenario's concurrency")
+    parser.add_argument("--docker-latency", default="", help="Fake Docker latencies, e.g. create=0.2,stats=0.5")
+    parser.add_argument("--gateway-workers", type=int, default=1)
+    parser.add_argument("--save", help="Write results to this baseline file")
+    parser.add_argument("--compare", help="Compare results against this baseline file")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed regression ratio (default 0.10)")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,179 @@
+from contextlib import contextmanager, ExitStack
+from datetime import datetime
+from typing import Optional, Dict, Any
+import subprocess
+import tempfile
+import asyncio
+import json
+import sys
+import os
+
+import httpx
+
+from harness import InProcessServer, ServiceProcess, run_load
+from fake_docker import FakeDockerEngine
+from fake_upstreams import fake_auth_service, fake_container_service
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Environment shared by every service under test
+BASE_ENV = {
+    "TRACING_EXPORTER": "none",
+    "SECRET_KEY": "benchmark-secret",
+    # Measure the services, not the gateway's per-user limits
+    "RATE_LIMITS": "default=0:0",
+    "CONCURRENCY_LIMITS": "",
+    # The fake engine has no log endpoint
+    "LOG_ARCHIVE_INTERVAL_SECONDS": "0",
+    # Nor image and volume endpoints to collect garbage from
+    "GC_INTERVAL_SECONDS": "0"
+}
+
+
+def _lab_labels(user_id: str, index: int) -> Dict[str, str]:
+    return {
+        "fluxlabs.user_id": user_id,
+        "fluxlabs.name": f"bench-lab-{index}",
+        "fluxlabs.template": "ubuntu",
+        "fluxlabs.created_at": datetime.now().isoformat(),
+        "fluxlabs.duration_hours": "24",
+        "fluxlabs.created_by": "FluxLabs",
+        "fluxlabs.host": "fake"
+    }
+
+
+@contextmanager
+def lab_stack(docker_latencies: Optional[Dict[str, float]] = None, gateway_workers: int = 1,
+              ncpu: int = 16, mem_total: int = 64 * 1024 ** 3):
+    """Gateway -> container-manager -> fake Docker engine, with a fake auth service"""
+    with ExitStack() as stack:
+        engine = FakeDockerEngine(latencies=docker_latencies, ncpu=ncpu, mem_total=mem_total)
+        docker_server = stack.enter_context(InProcessServer(engine.app))
+        auth = stack.enter_context(InProcessServer(fake_auth_service()))
+        container_manager = stack.enter_context(ServiceProcess("container-manager", env={
+            **BASE_ENV,
+            "DOCKER_HOSTS": f"fake=tcp://127.0.0.1:{docker_server.port}",
+            # Keep background suspension out of the measurements
+            "IDLE_ACTION": "none"
+        }))
+        gateway = stack.enter_context(ServiceProcess("api-gateway", workers=gateway_workers, env={
+            **BASE_ENV,
+            "AUTH_SERVICE_URL": auth.url,
+            "CONTAINER_SERVICE_URL": container_manager.url
+        }))
+        yield engine, gateway
+
+
+def _bearer(user_id: str) -> Dict[str, str]:
+    return {"Authorization": f"Bearer {user_id}"}
+
+
+async def login_storm(requests: int = 500, concurrency: int = 50, users: int = 20, **_) -> Dict[str, Any]:
+    """Bursts of logins through the gateway against the real auth service (bcrypt + SQLite)"""
+    with tempfile.TemporaryDirectory() as workdir, ExitStack() as stack:
+        auth = stack.enter_context(ServiceProcess("auth-service", env={
+            **BASE_ENV, "DATABASE_URL": f"sqlite:///{workdir}/auth.db"
+        }))
+        gateway = stack.enter_context(ServiceProcess("api-gateway", env={**BASE_ENV, "AUTH_SERVICE_URL": auth.url}))
+
+        async with httpx.AsyncClient(timeout=60.0) as client:
+            for index in range(users):
+                await client.post(f"{gateway.url}/api/v1/auth/register",
+                                  json={"email": f"user-{index}@bench.local", "password": "benchmark"})
+
+        return await run_load(
+            "login_storm",
+            lambda client, index: client.post(f"{gateway.url}/api/v1/auth/login", json={
+                "email": f"user-{index % users}@bench.local", "password": "benchmark"
+            }),
+            total=requests, concurrency=concurrency, users=users
+        )
+
+
+async def dashboard_polling(requests: int = 2000, concurrency: int = 100, users: int = 50, labs_per_user: int = 5,
+                            docker_latencies: Optional[Dict[str, float]] = None, gateway_workers: int = 1,
+                            **_) -> Dict[str, Any]:
+    """Many dashboards polling GET /labs while labs already exist"""
+    with lab_stack(docker_latencies, gateway_workers) as (engine, gateway):
+        for index in range(users):
+            engine.seed(labs_per_user, _lab_labels(f"user-{index}", index), name_prefix=f"user-{index}")
+
+        def poll(client: httpx.AsyncClient, index: int):
+            user_id = f"user-{index % users}"
+            return client.get(f"{gateway.url}/api/v1/labs", params={"user_id": user_id}, headers=_bearer(user_id))
+
+        return await run_load("dashboard_polling", poll, total=requests, concurrency=concurrency,
+                              users=users, labs=users * labs_per_user)
+
+
+async def bulk_lab_creation(requests: int = 200, concurrency: int = 20, users: int = 20,
+                            docker_latencies: Optional[Dict[str, float]] = None, gateway_workers: int = 1,
+                            **_) -> Dict[str, Any]:
+    """A classroom creating labs at the same time; any failed create fails the scenario"""
+    # Room for every "small" lab (0.5 CPU, 512 MB) twice over, so admission never rejects and
+    # the scenario measures create throughput rather than how fast a full host says no
+    with lab_stack(docker_latencies, gateway_workers, ncpu=max(16, requests),
+                   mem_total=max(64 * 1024 ** 3, requests * 1024 ** 3)) as (engine, gateway):
+        def create(client: httpx.AsyncClient, index: int):
+            user_id = f"user-{index % users}"
+            return client.post(f"{gateway.url}/api/v1/create-lab", headers=_bearer(user_id), json={
+                "name": f"bench-{index}", "template_id": "ubuntu", "user_id": user_id, "resource_profile": "small"
+            })
+
+        result = await run_load("bulk_lab_creation", create, total=requests, concurrency=concurrency)
+        result["containers_created"] = engine.calls.get("create", 0)
+        if result["errors"]:
+            raise RuntimeError(f"bulk_lab_creation: {result['errors']} of {requests} creates failed")
+        return result
+
+
+async def expiry_wave(labs: int = 200, container_latency: float = 0.02, **_) -> Dict[str, Any]:
+    """Lab-manager scheduler pass over a backlog of due expiry tasks"""
+    with tempfile.TemporaryDirectory() as workdir, InProcessServer(fake_container_service(container_latency)) as upstream:
+        command = [
+            sys.executable, os.path.join(BENCHMARKS_DIR, "expiry_worker.py"),
+            "--labs", str(labs),
+            "--database-url", f"sqlite:///{workdir}/lab-manager.db",
+            "--container-url", upstream.url
+        ]
+        env = {**os.environ, **BASE_ENV}
+        output = await asyncio.to_thread(subprocess.check_output, command, env=env, text=True)
+        return json.loads(output.strip().splitlines()[-1])
+
+
+async def gateway_scaling(requests: int = 5000, concurrency: int = 200, worker_counts=(1, 2, 4),
+                          **_) -> Dict[str, Any]:
+    """Gateway throughput on a cached route at 1, 2 and 4 workers, to check scaling with cores"""
+    runs = {}
+    with InProcessServer(fake_container_service(latency=0)) as upstream:
+        for workers in worker_counts:
+            with ServiceProcess("api-gateway", workers=workers, gunicorn=True, env={
+                **BASE_ENV, "CONTAINER_SERVICE_URL": upstream.url
+            }) as gateway:
+                runs[workers] = await run_load(
+                    f"gateway_scaling_{workers}w",
+                    lambda client, index: client.get(f"{gateway.url}/api/v1/templates"),
+                    total=requests, concurrency=concurrency
+                )
+
+    single = runs[worker_counts[0]]["throughput_rps"] or 1
+    result = dict(runs[worker_counts[-1]], scenario="gateway_scaling")
+    result["scaling"] = {
+        str(workers): {
+            "throughput_rps": run["throughput_rps"],
+            "p95_ms": run["p95_ms"],
+            # 1.0 = perfectly linear in worker count
+            "efficiency": round(run["throughput_rps"] / (single * workers / worker_counts[0]), 3)
+        }
+        for workers, run in runs.items()
+    }
+    return result
+
+
+SCENARIOS = {
+    "login_storm": login_storm,
+    "dashboard_polling": dashboard_polling,
+    "bulk_lab_creation": bulk_lab_creation,
+    "expiry_wave": expiry_wave,
+    "gateway_scaling": gateway_scaling
+}
@@ -48,12 +48,16 @@ export const userAPI = {
 
 // Simple Docker-only lab API - Direct endpoints, no database
 export const labAPI = {
-  // Get all labs for a user (Docker containers with user label)
-  getUserLabs: (userId) => api.get(`/labs?user_id=${userId}`),
+  // One page of a user's labs (Docker containers with user label); params: status, template_id,
+  // created_after/before, expires_after/before, sort, order, limit, cursor (next_cursor of the previous page)
+  getUserLabs: (userId, params = {}) => api.get('/labs', { params: { user_id: userId, ...params } }),
   
   // Get specific lab by container ID
   getLab: (containerId) => api.get(`/lab/${containerId}`),
   
+  // Lab details with log tail, stats and processes in one request; failed sections are listed in `errors`
+  getLabOverview: (containerId, tail = 100) => api.get(`/lab/${containerId}/overview`, { params: { tail } }),
+  
   // Create lab (creates Docker container with user label)
   createLab: (data) => api.post('/create-lab', {
     ...data,
@@ -90,6 +94,15 @@ export const dockerAPI = {
   // Execute command in container
   execCommand: (containerId, command) => api.post(`/lab/${containerId}/exec`, { command }),
   
+  // Open an interactive exec session (WebSocket, streamed stdin/stdout)
+  openExecSession: (containerId, { cmd = '/bin/sh', rows = 24, cols = 80 } = {}) => {
+    const wsBase = API_BASE_URL.replace(/^http/, 'ws');
+    const params = new URLSearchParams({ cmd, tty: 'true', rows, cols, token: localStorage.getItem('token') || '' });
+    const socket = new WebSocket(`${wsBase}/api/v1/lab/${containerId}/exec?${params}`);
+    socket.binaryType = 'arraybuffer';
+    return socket;
+  },
+  
   // Restart container
   restartContainer: (containerId) => api.post(`/lab/${containerId}/restart`),
   
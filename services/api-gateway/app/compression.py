@@ -0,0 +1,178 @@
+from typing import Optional
+import zlib
+import os
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Responses smaller than this go out uncompressed
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "5"))
+BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+ZSTD_LEVEL = int(os.getenv("COMPRESSION_ZSTD_LEVEL", "3"))
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "application/xml")
+
+
+class _GzipEncoder:
+    def __init__(self):
+        self.compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self.compressor.flush(zlib.Z_FINISH)
+
+
+class _BrotliEncoder:
+    def __init__(self):
+        self.compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self.compressor.flush()
+
+    def finish(self) -> bytes:
+        return self.compressor.finish()
+
+
+class _ZstdEncoder:
+    def __init__(self):
+        self.compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+# Server preference order; only encodings whose library is installed are offered
+ENCODERS = {"zstd": _ZstdEncoder if zstandard else None, "br": _BrotliEncoder if brotli else None,
+            "gzip": _GzipEncoder}
+ENCODERS = {name: encoder for name, encoder in ENCODERS.items() if encoder}
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick the preferred encoding the client accepts (q > 0)"""
+    accepted = set()
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.strip().partition(";")
+        quality = params.strip()
+        if quality.startswith("q="):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(name.strip())
+    for name in ENCODERS:
+        if name in accepted or "*" in accepted:
+            return name
+    return None
+
+
+class CompressionMiddleware:
+    """Negotiated zstd/br/gzip compression for text and JSON responses above a size threshold.
+
+    Single-body responses are compressed in one shot; streamed responses are compressed
+    chunk by chunk with a flush after each so clients see output as it is produced.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        encoding = negotiate_encoding(headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if not encoding:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        encoder = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, encoder, passthrough
+            if message["type"] == "http.response.start":
+                response_headers = dict(message.get("headers", []))
+                content_type = response_headers.get(b"content-type", b"").decode("latin-1")
+                passthrough = (
+                    b"content-encoding" in response_headers
+                    or message["status"] in (204, 304)
+                    or not content_type.startswith(COMPRESSIBLE_TYPES)
+                )
+                if passthrough:
+                    await send(message)
+                else:
+                    # Hold the start until we know the body size
+                    start_message = message
+                return
+
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if start_message is not None:
+                if not more_body and len(body) < self.minimum_size:
+                    await send(start_message)
+                    start_message = None
+                    passthrough = True
+                    await send(message)
+                    return
+                encoder = ENCODERS[encoding]()
+                if not more_body:
+                    compressed = encoder.compress(body) + encoder.finish()
+                    await send(self._compressed_start(start_message, encoding, len(compressed)))
+                    await send({"type": "http.response.body", "body": compressed})
+                    return
+                await send(self._compressed_start(start_message, encoding))
+                start_message = None
+
+            if more_body:
+                await send({"type": "http.response.body", "body": encoder.compress(body) + encoder.flush(),
+                            "more_body": True})
+            else:
+                await send({"type": "http.response.body", "body": encoder.compress(body) + encoder.finish()})
+
+        await self.app(scope, receive, send_compressed)
+
+    @staticmethod
+    def _compressed_start(message, encoding: str, content_length: Optional[int] = None):
+        headers = []
+        vary = []
+        for key, value in message.get("headers", []):
+            if key.lower() == b"vary":
+                vary.append(value)
+            elif key.lower() != b"content-length":
+                headers.append((key, value))
+        headers.append((b"content-encoding", encoding.encode()))
+        headers.append((b"vary", b", ".join(vary + [b"Accept-Encoding"])))
+        if content_length is not None:
+            headers.append((b"content-length", str(content_length).encode()))
+        return {**message, "headers": headers}
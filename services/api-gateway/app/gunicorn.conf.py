@@ -0,0 +1,56 @@
+# Gunicorn settings for the multi-worker gateway: gunicorn -c gunicorn.conf.py main:app
+#
+# Each worker is a separate process with its own route table, response cache,
+# upstream connection pool and circuit breakers. Rate limits are shared through
+# shared memory (rate_limit.SharedMemoryRateLimitBackend) and Prometheus metrics
+# are aggregated across workers through PROMETHEUS_MULTIPROC_DIR.
+#
+# `kill -HUP <master pid>` reloads gracefully: new workers start, old workers stop
+# accepting connections and finish in-flight requests and streamed responses for up
+# to GATEWAY_GRACEFUL_TIMEOUT seconds. Exec WebSocket sessions on old workers are
+# closed with code 1012 (service restart) so clients reconnect to a new worker.
+import multiprocessing
+import tempfile
+import shutil
+import os
+
+bind = f"0.0.0.0:{os.getenv('GATEWAY_PORT', '8080')}"
+workers = int(os.getenv("GATEWAY_WORKERS", "0")) or multiprocessing.cpu_count()
+worker_class = "uvicorn.workers.UvicornWorker"
+# Each worker binds its own socket and the kernel spreads connections across them
+reuse_port = True
+graceful_timeout = int(os.getenv("GATEWAY_GRACEFUL_TIMEOUT", "30"))
+timeout = int(os.getenv("GATEWAY_WORKER_TIMEOUT", "120"))
+keepalive = int(os.getenv("GATEWAY_KEEPALIVE_SECONDS", "5"))
+# Recycle workers now and then; jitter keeps them from restarting together
+max_requests = int(os.getenv("GATEWAY_MAX_REQUESTS", "0"))
+max_requests_jitter = max_requests // 10
+accesslog = None
+
+# Settings below must be in the environment before workers import the app
+os.environ.setdefault("GATEWAY_WORKERS", str(workers))
+# Compose passes unset variables through as empty strings, so empty counts as unset
+if workers > 1:
+    if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="fluxlabs-gateway-metrics-")
+    if not os.environ.get("RATE_LIMIT_BACKEND_URL"):
+        os.environ["RATE_LIMIT_BACKEND_URL"] = "shm:///dev/shm/fluxlabs-gateway-ratelimit"
+
+
+def on_starting(server):
+    # Start every deployment with empty rate-limit state; HUP reloads keep it
+    backend_url = os.environ.get("RATE_LIMIT_BACKEND_URL", "")
+    if backend_url.startswith("shm://") and os.path.exists(backend_url[len("shm://"):]):
+        os.remove(backend_url[len("shm://"):])
+
+
+def child_exit(server, worker):
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
+
+
+def on_exit(server):
+    metrics_dir = os.environ.get("PROMETHEUS_MULTIPROC_DIR", "")
+    if metrics_dir.startswith(tempfile.gettempdir()):
+        shutil.rmtree(metrics_dir, ignore_errors=True)
@@ -1,21 +1,22 @@
 from fastapi import FastAPI
+from responses import OrjsonResponse
 from fastapi.middleware.cors import CORSMiddleware
-from routes import router
+from routes import router, close_http_client
+from metrics import setup_metrics
+from log_config import setup_logging
+from tracing import setup_tracing
+from compression import CompressionMiddleware
+from resilience import upstream_health, degraded
 import uvicorn
 import logging
-import sys
 
 # Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+setup_logging("api-gateway")
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="FluxLabs API Gateway", version="1.0.0")
+app = FastAPI(title="FluxLabs API Gateway", version="1.0.0", default_response_class=OrjsonResponse)
+setup_metrics(app, "api-gateway")
+setup_tracing(app, "api-gateway", httpx_client=True)
 
 logger.info("API Gateway starting up...")
 
@@ -30,13 +31,29 @@ app.add_middleware(
 
 logger.info("CORS configured to allow all origins for self-hosted deployment")
 
+# Negotiated zstd/br/gzip for large JSON and text responses
+app.add_middleware(CompressionMiddleware)
+
 # Include routes
 app.include_router(router, prefix="/api/v1")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    await close_http_client()
+
 @app.get("/health")
 def health_check():
-    logger.info("Health check requested")
-    return {"status": "healthy", "service": "api-gateway"}
+    return {"status": "degraded" if degraded() else "healthy", "service": "api-gateway", "upstreams": upstream_health()}
+
+@app.get("/health/live")
+def liveness_check():
+    """The process is up and serving; never touches upstreams"""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+def readiness_check():
+    """The gateway has no hard dependencies; open breakers only degrade it"""
+    return {"status": "ready"}
 
 @app.get("/")
 def root():
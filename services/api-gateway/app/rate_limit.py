@@ -0,0 +1,296 @@
+from contextlib import asynccontextmanager
+from typing import Dict, Tuple, Callable, Awaitable
+from fastapi import HTTPException
+from metrics import RATE_LIMITED
+import hashlib
+import asyncio
+import logging
+import struct
+import fcntl
+import math
+import mmap
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+# Token buckets per route class as "class=rate_per_second:burst,..."
+RATE_LIMITS = os.getenv("RATE_LIMITS", "default=20:60,auth=1:10,create=0.2:5,exec=2:10,stats=5:20")
+# Concurrent in-flight expensive operations per user as "class=limit,..."
+CONCURRENCY_LIMITS = os.getenv("CONCURRENCY_LIMITS", "create=2,exec=4,stats=4")
+# Entries in the shared-memory table (32 bytes each)
+RATE_LIMIT_SHM_ENTRIES = int(os.getenv("RATE_LIMIT_SHM_ENTRIES", "65536"))
+# Optional shared backend: redis://redis:6379/0 across gateway replicas, or
+# shm:///dev/shm/<name> across the workers of one gateway (set by gunicorn.conf.py)
+RATE_LIMIT_BACKEND_URL = os.getenv("RATE_LIMIT_BACKEND_URL", "")
+# How long a concurrency slot survives in the shared backend if a gateway dies holding it
+RATE_LIMIT_SLOT_TTL_SECONDS = int(os.getenv("RATE_LIMIT_SLOT_TTL_SECONDS", "600"))
+
+
+def _parse_limits(value: str) -> Dict[str, str]:
+    limits = {}
+    for item in filter(None, value.split(",")):
+        name, _, limit = item.partition("=")
+        limits[name.strip()] = limit.strip()
+    return limits
+
+
+class MemoryRateLimitBackend:
+    """Token buckets and slot counters held in this process"""
+
+    def __init__(self):
+        self.buckets: Dict[str, Tuple[float, float]] = {}
+        self.slots: Dict[str, int] = {}
+
+    async def take(self, key: str, rate: float, burst: float) -> float:
+        """Take one token; return 0 if allowed, otherwise seconds until a token is available"""
+        now = time.monotonic()
+        tokens, updated = self.buckets.get(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        if tokens >= 1:
+            self.buckets[key] = (tokens - 1, now)
+            return 0.0
+        self.buckets[key] = (tokens, now)
+        return (1 - tokens) / rate if rate > 0 else float("inf")
+
+    async def acquire(self, key: str, limit: int) -> bool:
+        if self.slots.get(key, 0) >= limit:
+            return False
+        self.slots[key] = self.slots.get(key, 0) + 1
+        return True
+
+    async def release(self, key: str):
+        remaining = self.slots.get(key, 0) - 1
+        if remaining > 0:
+            self.slots[key] = remaining
+        else:
+            self.slots.pop(key, None)
+
+    def prune(self, max_idle_seconds: float = 3600):
+        """Drop buckets untouched for an hour so the dict does not grow with every principal"""
+        cutoff = time.monotonic() - max_idle_seconds
+        for key in [k for k, (_, updated) in self.buckets.items() if updated < cutoff]:
+            del self.buckets[key]
+
+
+class SharedMemoryRateLimitBackend:
+    """Token buckets and slot counters in an mmap'd file shared by the workers of one host.
+
+    The file is a fixed open-addressing table of (key hash, tokens, updated, in-flight)
+    entries; every read-modify-write happens under an exclusive flock, which costs a
+    couple of syscalls and never waits on the network.
+    """
+
+    ENTRY = struct.Struct("<QddI4x")
+    PROBES = 8
+
+    def __init__(self, path: str, entries: int = RATE_LIMIT_SHM_ENTRIES):
+        self.path = path
+        self.entries = entries
+        self._pid = None
+        self._fd = None
+        self._map = None
+
+    def _open(self):
+        # Opened per process: flock does not exclude processes sharing one inherited descriptor
+        if self._pid == os.getpid():
+            return
+        size = self.entries * self.ENTRY.size
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self._fd).st_size < size:
+            os.ftruncate(self._fd, size)
+        self._map = mmap.mmap(self._fd, size)
+        self._pid = os.getpid()
+
+    def _update(self, key: str, change):
+        """Run change(tokens, updated, in_flight) -> (result, tokens, updated, in_flight) on key's entry"""
+        self._open()
+        key_hash = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little") or 1
+        start = key_hash % self.entries
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            victim, victim_updated = start, float("inf")
+            for probe in range(self.PROBES):
+                index = (start + probe) % self.entries
+                stored_hash, tokens, updated, in_flight = self.ENTRY.unpack_from(self._map, index * self.ENTRY.size)
+                if stored_hash == key_hash:
+                    break
+                if stored_hash == 0:
+                    tokens, updated, in_flight = None, None, 0
+                    break
+                if updated < victim_updated:
+                    victim, victim_updated = index, updated
+            else:
+                # Probe window full: reuse the least recently touched entry
+                index, tokens, updated, in_flight = victim, None, None, 0
+            result, tokens, updated, in_flight = change(tokens, updated, in_flight)
+            self.ENTRY.pack_into(self._map, index * self.ENTRY.size, key_hash, tokens, updated, in_flight)
+            return result
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    async def take(self, key: str, rate: float, burst: float) -> float:
+        now = time.time()
+
+        def change(tokens, updated, in_flight):
+            tokens = burst if tokens is None else min(burst, tokens + max(0.0, now - updated) * rate)
+            if tokens >= 1:
+                return 0.0, tokens - 1, now, in_flight
+            return (1 - tokens) / rate if rate > 0 else float("inf"), tokens, now, in_flight
+
+        return self._update(f"bucket:{key}", change)
+
+    async def acquire(self, key: str, limit: int) -> bool:
+        now = time.time()
+
+        def change(tokens, updated, in_flight):
+            # Slots held by a worker that died are forgotten after the TTL
+            if updated is not None and now - updated > RATE_LIMIT_SLOT_TTL_SECONDS:
+                in_flight = 0
+            if in_flight >= limit:
+                return False, 0.0, updated or now, in_flight
+            return True, 0.0, now, in_flight + 1
+
+        return self._update(f"slots:{key}", change)
+
+    async def release(self, key: str):
+        def change(tokens, updated, in_flight):
+            return None, 0.0, updated or time.time(), max(0, in_flight - 1)
+
+        self._update(f"slots:{key}", change)
+
+    def prune(self, max_idle_seconds: float = 3600):
+        # Fixed-size table; stale entries are overwritten
+        pass
+
+
+# Atomic token bucket: KEYS[1]=bucket, ARGV=rate, burst, now; returns wait time in ms (0 = allowed)
+_TAKE_SCRIPT = """
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local tokens = tonumber(bucket[1]) or burst
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = math.ceil((1 - tokens) / rate * 1000)
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return wait
+"""
+
+
+class RedisRateLimitBackend:
+    """Token buckets and slot counters in Redis (or anything speaking its protocol)"""
+
+    def __init__(self, url: str):
+        import redis.asyncio as redis
+        self.redis = redis.from_url(url)
+        self.take_script = self.redis.register_script(_TAKE_SCRIPT)
+
+    async def take(self, key: str, rate: float, burst: float) -> float:
+        wait_ms = await self.take_script(keys=[f"fluxlabs:rl:{key}"], args=[rate, burst, time.time()])
+        return int(wait_ms) / 1000.0
+
+    async def acquire(self, key: str, limit: int) -> bool:
+        slot_key = f"fluxlabs:slots:{key}"
+        count = await self.redis.incr(slot_key)
+        await self.redis.expire(slot_key, RATE_LIMIT_SLOT_TTL_SECONDS)
+        if count > limit:
+            await self.redis.decr(slot_key)
+            return False
+        return True
+
+    async def release(self, key: str):
+        await self.redis.decr(f"fluxlabs:slots:{key}")
+
+    def prune(self, max_idle_seconds: float = 3600):
+        # Keys expire on their own
+        pass
+
+
+class RateLimiter:
+    """Per-principal token buckets by route class, plus per-user caps on in-flight expensive calls"""
+
+    def __init__(self, backend=None):
+        self.backend = backend or MemoryRateLimitBackend()
+        self.rates: Dict[str, Tuple[float, float]] = {}
+        for route_class, limit in _parse_limits(RATE_LIMITS).items():
+            rate, _, burst = limit.partition(":")
+            self.rates[route_class] = (float(rate), float(burst or rate))
+        self.concurrency = {name: int(limit) for name, limit in _parse_limits(CONCURRENCY_LIMITS).items()}
+        self._checks = 0
+
+    def _reject(self, route_class: str, reason: str, retry_after: float):
+        RATE_LIMITED.labels("api-gateway", route_class, reason).inc()
+        raise HTTPException(
+            status_code=429,
+            detail="Too many concurrent requests" if reason == "concurrency" else "Rate limit exceeded",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+        )
+
+    async def admit(self, principal: str, route_class: str = "default") -> Callable[[], Awaitable[None]]:
+        """Charge one request to the principal's bucket and take a concurrency slot.
+
+        Returns the coroutine function that frees the slot; it may be called more than
+        once. Responses that outlive the handler, such as streams, call it when their
+        body is done.
+        """
+        rate, burst = self.rates.get(route_class) or self.rates.get("default", (0, 0))
+        if rate > 0:
+            wait = await self.backend.take(f"{route_class}:{principal}", rate, burst)
+            if wait > 0:
+                self._reject(route_class, "rate", wait)
+
+        self._checks += 1
+        if self._checks % 10000 == 0:
+            self.backend.prune()
+
+        slots = self.concurrency.get(route_class)
+        if not slots:
+            return _no_slot
+
+        slot_key = f"{route_class}:{principal}"
+        if not await self.backend.acquire(slot_key, slots):
+            self._reject(route_class, "concurrency", 1)
+        released = False
+
+        async def release():
+            nonlocal released
+            if released:
+                return
+            released = True
+            # Release even if the request was cancelled mid-flight
+            await asyncio.shield(self.backend.release(slot_key))
+
+        return release
+
+    @asynccontextmanager
+    async def limit(self, principal: str, route_class: str = "default"):
+        """Admit a request and hold its concurrency slot while the block runs"""
+        release = await self.admit(principal, route_class)
+        try:
+            yield
+        finally:
+            await release()
+
+
+async def _no_slot():
+    pass
+
+
+def _build_backend():
+    if RATE_LIMIT_BACKEND_URL.startswith("shm://"):
+        return SharedMemoryRateLimitBackend(RATE_LIMIT_BACKEND_URL[len("shm://"):])
+    if RATE_LIMIT_BACKEND_URL:
+        logger.info(f"Rate limits shared through {RATE_LIMIT_BACKEND_URL.split('@')[-1]}")
+        return RedisRateLimitBackend(RATE_LIMIT_BACKEND_URL)
+    return MemoryRateLimitBackend()
+
+
+rate_limiter = RateLimiter(_build_backend())
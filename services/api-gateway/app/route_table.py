@@ -0,0 +1,172 @@
+from dataclasses import dataclass
+from typing import Optional, Dict, List, Tuple
+import threading
+import logging
+import json
+import time
+import re
+import os
+
+logger = logging.getLogger(__name__)
+
+ROUTE_TABLE_PATH = os.getenv("ROUTE_TABLE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "route_table.json"))
+# How often the file's mtime is checked for hot reload; 0 disables reloading
+ROUTE_TABLE_RELOAD_SECONDS = float(os.getenv("ROUTE_TABLE_RELOAD_SECONDS", "5"))
+
+# Path parameter converters: {name} and {name:str} match one segment, {name:int} digits, {name:path} the rest
+_CONVERTERS = {"str": r"[^/]+", "int": r"[0-9]+", "path": r".+"}
+_PARAM = re.compile(r"{([a-zA-Z_][a-zA-Z0-9_]*)(?::([a-z]+))?}")
+
+
+@dataclass(frozen=True)
+class Route:
+    method: str
+    path: str
+    upstream: str
+    target: str
+    auth: bool = True
+    route_class: str = "default"
+    timeout: Optional[float] = None
+    cache_seconds: float = 0
+    stream: bool = False
+
+
+@dataclass(frozen=True)
+class RouteMatch:
+    route: Route
+    target_path: str
+
+
+class _CompiledRoute:
+    def __init__(self, route: Route):
+        self.route = route
+        pattern = ""
+        position = 0
+        for param in _PARAM.finditer(route.path):
+            converter = param.group(2) or "str"
+            if converter not in _CONVERTERS:
+                raise ValueError(f"Unknown converter '{converter}' in {route.path}")
+            pattern += re.escape(route.path[position:param.start()]) + f"(?P<{param.group(1)}>{_CONVERTERS[converter]})"
+            position = param.end()
+        pattern += re.escape(route.path[position:])
+        self.regex = re.compile(f"^{pattern}$")
+        self.target = route.target
+        missing = set(re.findall(r"{([a-zA-Z_][a-zA-Z0-9_]*)}", route.target)) - set(self.regex.groupindex)
+        if missing:
+            raise ValueError(f"Target {route.target} uses parameters not in {route.path}: {', '.join(sorted(missing))}")
+
+    def match(self, path: str) -> Optional[RouteMatch]:
+        found = self.regex.match(path)
+        if not found:
+            return None
+        return RouteMatch(self.route, self.target.format(**found.groupdict()))
+
+
+class CompiledTable:
+    """Routes indexed for dispatch: exact paths in a dict, templated paths bucketed by first segment"""
+
+    def __init__(self, routes: List[Route]):
+        self.routes = routes
+        self.static: Dict[Tuple[str, str], RouteMatch] = {}
+        self.dynamic: Dict[Tuple[str, str], List[_CompiledRoute]] = {}
+        self.dynamic_any: Dict[str, List[_CompiledRoute]] = {}
+        for route in routes:
+            if not _PARAM.search(route.path):
+                self.static[(route.method, route.path)] = RouteMatch(route, route.target)
+                continue
+            compiled = _CompiledRoute(route)
+            first = route.path.lstrip("/").split("/", 1)[0]
+            if _PARAM.search(first):
+                self.dynamic_any.setdefault(route.method, []).append(compiled)
+            else:
+                self.dynamic.setdefault((route.method, first), []).append(compiled)
+
+    def match(self, method: str, path: str) -> Optional[RouteMatch]:
+        found = self.static.get((method, path))
+        if found:
+            return found
+        first = path.lstrip("/").split("/", 1)[0]
+        for compiled in self.dynamic.get((method, first), []) + self.dynamic_any.get(method, []):
+            found = compiled.match(path)
+            if found:
+                return found
+        return None
+
+
+def load_routes(path: str) -> List[Route]:
+    with open(path) as table_file:
+        table = json.load(table_file)
+    defaults = table.get("defaults", {})
+    routes = []
+    for entry in table["routes"]:
+        entry = {**defaults, **entry}
+        entry["method"] = entry["method"].upper()
+        routes.append(Route(**entry))
+    return routes
+
+
+class RouteTable:
+    """The gateway's routing table, compiled once and recompiled when the file changes"""
+
+    def __init__(self, path: str = ROUTE_TABLE_PATH, reload_seconds: float = ROUTE_TABLE_RELOAD_SECONDS):
+        self.path = path
+        self.reload_seconds = reload_seconds
+        self._lock = threading.Lock()
+        self._mtime = os.path.getmtime(path)
+        self._checked_at = time.monotonic()
+        self.compiled = CompiledTable(load_routes(path))
+        logger.info(f"Loaded {len(self.compiled.routes)} gateway routes from {path}")
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if not self.reload_seconds or now - self._checked_at < self.reload_seconds:
+            return
+        with self._lock:
+            if now - self._checked_at < self.reload_seconds:
+                return
+            self._checked_at = now
+            try:
+                mtime = os.path.getmtime(self.path)
+                if mtime == self._mtime:
+                    return
+                compiled = CompiledTable(load_routes(self.path))
+            except Exception as e:
+                # Keep serving the last good table
+                logger.error(f"Failed to reload route table {self.path}: {e}")
+                return
+            self._mtime = mtime
+            self.compiled = compiled
+            logger.info(f"Reloaded {len(compiled.routes)} gateway routes from {self.path}")
+
+    def match(self, method: str, path: str) -> Optional[RouteMatch]:
+        self._maybe_reload()
+        return self.compiled.match(method, path)
+
+    def allowed_methods(self, path: str) -> List[str]:
+        """Methods that would match this path, for 405 responses"""
+        return sorted({route.method for route in self.compiled.routes
+                       if self.compiled.match(route.method, path) is not None})
+
+
+class ResponseCache:
+    """Short-lived cache for GET routes with cache_seconds, bounded to max_entries"""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self.entries: Dict[tuple, Tuple[float, object]] = {}
+
+    def get(self, key: tuple):
+        entry = self.entries.get(key)
+        if not entry:
+            return None
+        expires_at, response = entry
+        if expires_at < time.monotonic():
+            self.entries.pop(key, None)
+            return None
+        return response
+
+    def put(self, key: tuple, response, ttl: float):
+        if len(self.entries) >= self.max_entries:
+            # Oldest insertion goes first
+            self.entries.pop(next(iter(self.entries)))
+        self.entries[key] = (time.monotonic() + ttl, response)
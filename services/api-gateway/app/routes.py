@@ -1,8 +1,20 @@
-from fastapi import APIRouter, Request, HTTPException, Depends, Header
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Request, HTTPException, Header, WebSocket
+from typing import Optional
+from fastapi.responses import Response, StreamingResponse
+from responses import OrjsonResponse
+from starlette.background import BackgroundTask
+from urllib.parse import urlencode
+from tracing import tracer
+from log_config import SAMPLED, truncate_body
+from rate_limit import rate_limiter
+from resilience import get_upstream, UpstreamUnavailable, UPSTREAM_CONNECT_TIMEOUT_SECONDS
+from route_table import RouteTable, ResponseCache
+import websockets
+import asyncio
 import httpx
 import os
 import logging
+import time
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -14,6 +26,41 @@ AUTH_SERVICE_URL = os.getenv("AUTH_SERVICE_URL", "http://auth-service:8001")
 USER_SERVICE_URL = os.getenv("USER_SERVICE_URL", "http://user-service:8002")
 CONTAINER_SERVICE_URL = os.getenv("CONTAINER_SERVICE_URL", "http://container-manager:8003")
 
+UPSTREAM_URLS = {
+    "auth-service": AUTH_SERVICE_URL,
+    "user-service": USER_SERVICE_URL,
+    "container-manager": CONTAINER_SERVICE_URL
+}
+UPSTREAM_NAMES = {url: name for name, url in UPSTREAM_URLS.items()}
+
+route_table = RouteTable()
+response_cache = ResponseCache()
+# One pooled client for all upstream calls instead of a new connection per request.
+# Created on first use so tracing's httpx instrumentation (set up after import) applies to it.
+_http_client: Optional[httpx.AsyncClient] = None
+
+def get_http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient()
+    return _http_client
+
+# Not forwarded from upstream responses: hop-by-hop headers, and framing that no longer
+# matches once httpx has decoded the body and the gateway re-encodes it
+EXCLUDED_RESPONSE_HEADERS = {"connection", "keep-alive", "transfer-encoding", "content-length", "content-encoding",
+                             "date", "server"}
+
+BODILESS_STATUS_CODES = {204, 304}
+
+def _response_headers(response: httpx.Response) -> dict:
+    return {k: v for k, v in response.headers.items() if k.lower() not in EXCLUDED_RESPONSE_HEADERS}
+
+def _upstream_name(url: str) -> str:
+    for base_url, name in UPSTREAM_NAMES.items():
+        if url.startswith(base_url):
+            return name
+    return "other"
+
 logger.info(f"Service URLs configured - AUTH: {AUTH_SERVICE_URL}, USER: {USER_SERVICE_URL}, CONTAINER: {CONTAINER_SERVICE_URL}")
 
 async def verify_token(authorization: str = Header(None)):
@@ -23,172 +70,239 @@ async def verify_token(authorization: str = Header(None)):
         raise HTTPException(status_code=401, detail="Invalid authorization header")
     
     token = authorization.split(" ")[1]
-    logger.info(f"Verifying token with auth service")
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(
-                f"{AUTH_SERVICE_URL}/verify",
-                headers={"Authorization": f"Bearer {token}"}
-            )
-            if response.status_code != 200:
-                logger.warning(f"Token verification failed with status: {response.status_code}")
-                raise HTTPException(status_code=401, detail="Invalid token")
-            
-            data = response.json()
-            logger.info(f"Token verified successfully for user: {data.get('email', 'unknown')}")
-            return data["email"]
-        except Exception:
-            raise HTTPException(status_code=401, detail="Token verification failed")
-
-async def proxy_request(request: Request, target_url: str, auth_required: bool = True):
+    with tracer.start_as_current_span("gateway.verify_token"):
+        return await _verify_with_auth_service(token)
+
+async def _verify_with_auth_service(token: str):
+    try:
+        response = await get_upstream("api-gateway", "auth-service").request(
+            get_http_client(), "POST", f"{AUTH_SERVICE_URL}/verify",
+            headers={"Authorization": f"Bearer {token}"}
+        )
+        if response.status_code != 200:
+            logger.warning(f"Token verification failed with status: {response.status_code}")
+            raise HTTPException(status_code=401, detail="Invalid token")
+        
+        return response.json()["email"]
+    except UpstreamUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(int(e.retry_after) + 1)})
+    except HTTPException:
+        raise
+    except Exception:
+        raise HTTPException(status_code=401, detail="Token verification failed")
+
+async def proxy_request(request: Request, target_url: str, auth_required: bool = True, route_class: str = "default",
+                        timeout: Optional[float] = None, cache_seconds: float = 0, stream: bool = False):
     """Proxy request to target service"""
-    logger.info(f"Proxying {request.method} request to: {target_url}")
-    
     headers = dict(request.headers)
     
     # Verify authentication if required
     if auth_required:
-        logger.info("Verifying authentication for protected route")
-        await verify_token(headers.get("authorization"))
+        principal = await verify_token(headers.get("authorization"))
     else:
-        logger.info("Skipping authentication for public route")
+        # Unauthenticated routes are limited per client address
+        principal = request.client.host if request.client else "anonymous"
     
     # Remove host header to avoid conflicts
     headers.pop("host", None)
+    # Compression is negotiated with the client by the gateway, not forwarded upstream
+    headers.pop("accept-encoding", None)
+
+    cache_key = None
+    if cache_seconds and request.method == "GET":
+        cache_key = (target_url, str(request.query_params), principal if auth_required else "")
+        cached = response_cache.get(cache_key)
+        if cached:
+            return cached
     
     # Get request body
     body = await request.body()
-    if body:
-        logger.info(f"Request body size: {len(body)} bytes")
     
-    async with httpx.AsyncClient() as client:
+    release = await rate_limiter.admit(principal, route_class)
+    streaming = False
+    try:
         try:
-            logger.info(f"Sending request to: {target_url}")
-            response = await client.request(
-                method=request.method,
-                url=target_url,
+            upstream = _upstream_name(target_url)
+            started = time.perf_counter()
+            response = await get_upstream("api-gateway", upstream).request(
+                get_http_client(), request.method, target_url,
                 headers=headers,
                 content=body,
-                params=request.query_params
+                params=request.query_params,
+                timeout=timeout,
+                stream=stream
+            )
+            elapsed = time.perf_counter() - started
+
+            logger.info(
+                f"{request.method} {target_url} -> {response.status_code}",
+                extra={**SAMPLED, "upstream": upstream, "status": response.status_code,
+                       "duration_ms": round(elapsed * 1000, 2), "request_bytes": len(body)}
             )
-            
-            logger.info(f"Received response from {target_url}: status={response.status_code}")
-            
+
+            if stream:
+                # The concurrency slot stays taken until the whole body has been sent
+                streaming = True
+                return StreamingResponse(
+                    _stream_body(response, release),
+                    status_code=response.status_code,
+                    headers=_response_headers(response),
+                    background=BackgroundTask(_finish_stream, response, release)
+                )
+        
+            # Bodiless statuses (304 for conditional GETs, 204) must not get a body added
+            if response.status_code in BODILESS_STATUS_CODES:
+                return Response(status_code=response.status_code, headers=_response_headers(response))
+
+            # JSON bodies are passed through as-is instead of being parsed and re-serialized
+            if response.content and response.headers.get("content-type", "").startswith("application/json"):
+                proxied = Response(
+                    content=response.content,
+                    status_code=response.status_code,
+                    headers=_response_headers(response)
+                )
+                if cache_key and response.status_code == 200:
+                    response_cache.put(cache_key, proxied, cache_seconds)
+                return proxied
+
             # Handle response content safely
             try:
                 content = response.json() if response.content else {}
             except Exception as json_error:
                 logger.error(f"Failed to parse JSON response from {target_url}: {str(json_error)}")
-                logger.error(f"Response content: {response.content}")
+                logger.error(f"Response content: {truncate_body(response.content)}")
                 content = {"error": "Invalid response format from service"}
-            
-            return JSONResponse(
+        
+            return OrjsonResponse(
                 content=content,
                 status_code=response.status_code,
-                headers=dict(response.headers)
+                headers=_response_headers(response)
             )
+        except UpstreamUnavailable as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(int(e.retry_after) + 1)})
         except httpx.RequestError as e:
             logger.error(f"Request error when calling {target_url}: {str(e)}")
             raise HTTPException(status_code=503, detail=f"Service unavailable: {str(e)}")
         except Exception as e:
             logger.error(f"Unexpected error when calling {target_url}: {str(e)}")
             raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+    finally:
+        if not streaming:
+            await release()
+
+async def _stream_body(response: httpx.Response, release):
+    """Upstream body chunks; the response and slot are freed however the stream ends"""
+    try:
+        async for chunk in response.aiter_bytes():
+            yield chunk
+    finally:
+        await _finish_stream(response, release)
+
+async def _finish_stream(response: httpx.Response, release):
+    # Also runs when the body was never iterated; both calls are idempotent
+    await response.aclose()
+    await release()
+
+@router.websocket("/lab/{container_id}/exec")
+async def exec_lab_session(websocket: WebSocket, container_id: str):
+    """Proxy an interactive exec session to the container service"""
+    # Close codes only reach the client after the handshake; closing before accept is a bare 403
+    await websocket.accept()
+
+    # Browsers cannot set headers on WebSocket requests, so also accept ?token=
+    authorization = websocket.headers.get("authorization")
+    params = dict(websocket.query_params)
+    token = params.pop("token", None)
+    if token:
+        authorization = f"Bearer {token}"
+    try:
+        principal = await verify_token(authorization)
+    except HTTPException:
+        await websocket.close(code=4401)
+        return
+
+    target_url = CONTAINER_SERVICE_URL.replace("http", "ws", 1) + f"/lab/{container_id}/exec"
+    if params:
+        target_url += f"?{urlencode(params)}"
+
+    # The session holds an exec slot for as long as it stays open
+    breaker = get_upstream("api-gateway", "container-manager").breaker
+    try:
+        async with rate_limiter.limit(principal, "exec"):
+            if not breaker.allow():
+                # 1013: try again later
+                await websocket.close(code=1013)
+                return
+            logger.info(f"Proxying exec session to: {target_url}")
+            try:
+                async with websockets.connect(target_url, max_size=None,
+                                              open_timeout=UPSTREAM_CONNECT_TIMEOUT_SECONDS) as upstream:
+                    breaker.record_success()
+                    await _pump_websockets(websocket, upstream)
+            except (OSError, asyncio.TimeoutError, websockets.exceptions.InvalidHandshake) as e:
+                breaker.record_failure()
+                logger.error(f"Exec session upstream unavailable: {str(e)}")
+                await websocket.close(code=1011)
+    except HTTPException as e:
+        # 4429 mirrors HTTP 429 for clients that cannot see the handshake status
+        await websocket.close(code=4429, reason=str(e.detail))
+
+async def _pump_websockets(client: WebSocket, upstream):
+    """Forward frames both ways until either side closes"""
+    async def client_to_upstream():
+        while True:
+            message = await client.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            if message.get("bytes") is not None:
+                await upstream.send(message["bytes"])
+            elif message.get("text") is not None:
+                await upstream.send(message["text"])
+
+    async def upstream_to_client():
+        async for message in upstream:
+            if isinstance(message, bytes):
+                await client.send_bytes(message)
+            else:
+                await client.send_text(message)
+        await client.close()
+
+    tasks = [asyncio.create_task(client_to_upstream()), asyncio.create_task(upstream_to_client())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+# Every other HTTP route comes from route_table.json; registered last so explicit routes win
+@router.api_route("/{path:path}", methods=["GET", "POST", "PUT", "PATCH", "DELETE"])
+async def dispatch(path: str, request: Request):
+    """Forward a request to the upstream its route table entry points at"""
+    path = "/" + path
+    match = route_table.match(request.method, path)
+    if not match:
+        allowed = route_table.allowed_methods(path)
+        if allowed:
+            raise HTTPException(status_code=405, detail="Method Not Allowed", headers={"Allow": ", ".join(allowed)})
+        raise HTTPException(status_code=404, detail="Not Found")
+
+    route = match.route
+    request.scope["route_template"] = f"/api/v1{route.path}"
+    base_url = UPSTREAM_URLS.get(route.upstream)
+    if not base_url:
+        logger.error(f"Route {route.method} {route.path} points at unknown upstream {route.upstream}")
+        raise HTTPException(status_code=502, detail=f"Unknown upstream: {route.upstream}")
+
+    return await proxy_request(
+        request, base_url + match.target_path,
+        auth_required=route.auth,
+        route_class=route.route_class,
+        timeout=route.timeout,
+        cache_seconds=route.cache_seconds,
+        stream=route.stream
+    )
 
-# Auth routes (no auth required)
-@router.post("/auth/register")
-async def register(request: Request):
-    return await proxy_request(request, f"{AUTH_SERVICE_URL}/register", auth_required=False)
-
-@router.post("/auth/login")
-async def login(request: Request):
-    return await proxy_request(request, f"{AUTH_SERVICE_URL}/login", auth_required=False)
-
-@router.post("/auth/verify")
-async def verify(request: Request):
-    return await proxy_request(request, f"{AUTH_SERVICE_URL}/verify", auth_required=False)
-
-# User service routes
-@router.get("/users/profile/{user_id}")
-async def get_user_profile(user_id: int, request: Request):
-    return await proxy_request(request, f"{USER_SERVICE_URL}/profile/{user_id}")
-
-@router.post("/users/profile/{user_id}")
-async def create_user_profile(user_id: int, request: Request):
-    return await proxy_request(request, f"{USER_SERVICE_URL}/profile/{user_id}")
-
-@router.put("/users/profile/{user_id}")
-async def update_user_profile(user_id: int, request: Request):
-    return await proxy_request(request, f"{USER_SERVICE_URL}/profile/{user_id}")
-
-@router.get("/users/settings/{user_id}")
-async def get_user_settings(user_id: int, request: Request):
-    return await proxy_request(request, f"{USER_SERVICE_URL}/settings/{user_id}")
-
-@router.post("/users/settings/{user_id}")
-async def create_user_settings(user_id: int, request: Request):
-    return await proxy_request(request, f"{USER_SERVICE_URL}/settings/{user_id}")
-
-@router.put("/users/settings/{user_id}")
-async def update_user_settings(user_id: int, request: Request):
-    return await proxy_request(request, f"{USER_SERVICE_URL}/settings/{user_id}")
-
-# Container service routes - simplified Docker-only endpoints
-@router.get("/labs")
-async def get_labs(user_id: str, request: Request):
-    """Get all labs for a user using Docker labels"""
-    return await proxy_request(request, f"{CONTAINER_SERVICE_URL}/labs?user_id={user_id}")
-
-@router.post("/create-lab")
-async def create_lab(request: Request):
-    """Create a new Docker container lab with user labels"""
-    return await proxy_request(request, f"{CONTAINER_SERVICE_URL}/create-lab")
-
-@router.get("/lab/{container_id}")
-async def get_lab_details(container_id: str, request: Request):
-    """Get specific lab details by container ID"""
-    return await proxy_request(request, f"{CONTAINER_SERVICE_URL}/lab/{container_id}")
-
-@router.delete("/delete-lab/{container_id}")
-async def delete_lab(container_id: str, request: Request):
-    """Delete a lab (remove Docker container)"""
-    return await proxy_request(request, f"{CONTAINER_SERVICE_URL}/delete-lab/{container_id}")
-
-@router.post("/lab/{container_id}/start")
-async def start_lab_container(container_id: str, request: Request):
-    """Start a lab container"""
-    return await proxy_request(request, f"{CONTAINER_SERVICE_URL}/lab/{container_id}/start")
-
-@router.post("/lab/{container_id}/stop")
-async def stop_lab_container(container_id: str, request: Request):
-    """Stop a lab container"""
-    return await proxy_request(request, f"{CONTAINER_SERVICE_URL}/lab/{container_id}/stop")
-
-@router.post("/lab/{container_id}/restart")
-async def restart_lab_container(container_id: str, request: Request):
-    """Restart a lab container"""
-    return await proxy_request(request, f"{CONTAINER_SERVICE_URL}/lab/{container_id}/restart")
-
-@router.get("/lab/{container_id}/logs")
-async def get_lab_logs(container_id: str, request: Request):
-    """Get container logs"""
-    return await proxy_request(request, f"{CONTAINER_SERVICE_URL}/lab/{container_id}/logs")
-
-@router.get("/lab/{container_id}/stats")
-async def get_lab_stats(container_id: str, request: Request):
-    """Get container stats"""
-    return await proxy_request(request, f"{CONTAINER_SERVICE_URL}/lab/{container_id}/stats")
-
-@router.get("/lab/{container_id}/processes")
-async def get_lab_processes(container_id: str, request: Request):
-    """Get container processes"""
-    return await proxy_request(request, f"{CONTAINER_SERVICE_URL}/lab/{container_id}/processes")
-
-@router.post("/lab/{container_id}/exec")
-async def exec_lab_command(container_id: str, request: Request):
-    """Execute command in container"""
-    return await proxy_request(request, f"{CONTAINER_SERVICE_URL}/lab/{container_id}/exec")
-
-@router.get("/templates")
-async def get_lab_templates(request: Request):
-    """Get available lab templates"""
-    return await proxy_request(request, f"{CONTAINER_SERVICE_URL}/templates", auth_required=False)
+async def close_http_client():
+    if _http_client is not None:
+        await _http_client.aclose()
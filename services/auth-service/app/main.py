@@ -1,36 +1,27 @@
 from fastapi import FastAPI, Depends, HTTPException, status
+from responses import OrjsonResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from datetime import timedelta
-from database import get_database, engine, Base
+from database import get_database, engine, ensure_schema, database_ready
 from auth import (
     authenticate_user, create_user, get_user_by_email, 
     create_access_token, verify_token, save_session, ACCESS_TOKEN_EXPIRE_MINUTES
 )
+from metrics import setup_metrics, startup_phase
+from log_config import setup_logging, SAMPLED
+from tracing import setup_tracing
 import uvicorn
 import logging
-import sys
 
 # Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+setup_logging("auth-service")
 logger = logging.getLogger(__name__)
 
-# Create tables
-try:
-    Base.metadata.create_all(bind=engine)
-    logger.info("Database tables created successfully")
-except Exception as e:
-    logger.error(f"Failed to create database tables: {e}")
-    raise
-
-app = FastAPI(title="Auth Service", version="1.0.0")
+app = FastAPI(title="Auth Service", version="1.0.0", default_response_class=OrjsonResponse)
+setup_metrics(app, "auth-service", engine=engine)
+setup_tracing(app, "auth-service", engine=engine)
 security = HTTPBearer()
 
 logger.info("Auth Service starting up...")
@@ -91,8 +82,6 @@ def register(user: UserCreate, db: Session = Depends(get_database)):
 
 @app.post("/login", response_model=Token)
 def login(user_credentials: UserLogin, db: Session = Depends(get_database)):
-    logger.info(f"Login attempt for email: {user_credentials.email}")
-    
     try:
         user = authenticate_user(db, user_credentials.email, user_credentials.password)
         if not user:
@@ -111,7 +100,7 @@ def login(user_credentials: UserLogin, db: Session = Depends(get_database)):
         # Save session
         save_session(db, user.id, access_token)
         
-        logger.info(f"Login successful for: {user_credentials.email}")
+        logger.info(f"Login successful for user {user.id}", extra=SAMPLED)
         return {"access_token": access_token, "token_type": "bearer"}
         
     except HTTPException:
@@ -139,5 +128,23 @@ def verify_token_endpoint(credentials: HTTPAuthorizationCredentials = Depends(se
 def health_check():
     return {"status": "healthy"}
 
+@app.get("/health/live")
+def liveness_check():
+    """The process is up and serving; never touches dependencies"""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+def readiness_check():
+    """Ready once the database answers and the tables exist"""
+    if not database_ready():
+        return OrjsonResponse(status_code=503, content={"status": "not ready", "database": False})
+    return {"status": "ready", "database": True}
+
+@app.on_event("startup")
+def startup_event():
+    # Tables are created here, or on first use if the database is not up yet
+    with startup_phase("auth-service", "schema"):
+        ensure_schema()
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8001)
@@ -0,0 +1,219 @@
+from typing import Optional, List, Dict, Any
+import threading
+import logging
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+# Resource profiles applied to lab containers at create time
+RESOURCE_PROFILES = {
+    "small": {"cpus": 0.5, "memory_mb": 512, "pids": 256},
+    "medium": {"cpus": 1.0, "memory_mb": 1024, "pids": 512},
+    "large": {"cpus": 2.0, "memory_mb": 4096, "pids": 1024}
+}
+DEFAULT_RESOURCE_PROFILE = os.getenv("DEFAULT_RESOURCE_PROFILE", "small")
+
+# Host capacity; 0 means "ask the Docker daemon"
+HOST_CPU_CAPACITY = float(os.getenv("HOST_CPU_CAPACITY", "0"))
+HOST_MEMORY_CAPACITY_MB = int(os.getenv("HOST_MEMORY_CAPACITY_MB", "0"))
+# CPU is compressible, so it may be overcommitted; memory is not
+ADMISSION_CPU_OVERCOMMIT = float(os.getenv("ADMISSION_CPU_OVERCOMMIT", "1.0"))
+ADMISSION_MEMORY_RESERVE_MB = int(os.getenv("ADMISSION_MEMORY_RESERVE_MB", "512"))
+# How long a create waits for capacity before being rejected (0 = reject immediately)
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "0"))
+ADMISSION_RESYNC_SECONDS = int(os.getenv("ADMISSION_RESYNC_SECONDS", "60"))
+
+
+class AdmissionRejected(Exception):
+    """Raised when a lab does not fit in the remaining host capacity"""
+
+    def __init__(self, message: str, retry_after: int = 30):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ExceedsHostCapacity(AdmissionRejected):
+    """Raised when a lab is larger than the host could ever hold, so retrying cannot help"""
+
+    def __init__(self, message: str):
+        super().__init__(message, retry_after=0)
+
+
+def resolve_resource_profile(name: Optional[str]) -> Dict[str, Any]:
+    """Look up a resource profile by name, falling back to the default"""
+    profile_name = name if name in RESOURCE_PROFILES else DEFAULT_RESOURCE_PROFILE
+    return {"profile": profile_name, **RESOURCE_PROFILES[profile_name]}
+
+
+class AdmissionController:
+    """Tracks CPU and memory committed to active lab containers against host capacity.
+
+    Commitments are the resource limits of containers that are not exited.
+    Reservations are keyed by container ID (or by name while a create is in
+    flight) and periodically resynced from Docker so that containers removed
+    behind our back are released.
+    """
+
+    def __init__(self, docker_client, host: Optional[str] = None,
+                 cpu_capacity: float = HOST_CPU_CAPACITY,
+                 memory_capacity_mb: int = HOST_MEMORY_CAPACITY_MB,
+                 cpu_overcommit: float = ADMISSION_CPU_OVERCOMMIT,
+                 memory_reserve_mb: int = ADMISSION_MEMORY_RESERVE_MB,
+                 queue_timeout_seconds: float = ADMISSION_QUEUE_TIMEOUT_SECONDS,
+                 resync_seconds: int = ADMISSION_RESYNC_SECONDS):
+        self.docker_client = docker_client
+        self.host = host
+        self._cpu_capacity = cpu_capacity
+        self._memory_capacity_mb = memory_capacity_mb
+        self.cpu_overcommit = cpu_overcommit
+        self.memory_reserve_mb = memory_reserve_mb
+        self.queue_timeout_seconds = queue_timeout_seconds
+        self.resync_seconds = resync_seconds
+        self.reservations: Dict[str, Dict[str, float]] = {}
+        self.queued = 0
+        self.rejected_total = 0
+        self._last_sync = 0.0
+        # Monotonic start of the resync in flight, and keys released while it runs
+        self._sync_started: Optional[float] = None
+        self._released_during_sync = set()
+        self._condition = threading.Condition()
+
+    def _load_capacity(self):
+        if self.capacity_known:
+            return
+        info = self.docker_client.get_host_info(self.host)
+        if not self._cpu_capacity:
+            self._cpu_capacity = float(info.get("NCPU", 1))
+        if not self._memory_capacity_mb:
+            self._memory_capacity_mb = int(info.get("MemTotal", 0) / (1024 * 1024))
+
+    @property
+    def cpu_limit(self) -> float:
+        return self._cpu_capacity * self.cpu_overcommit
+
+    @property
+    def memory_limit_mb(self) -> int:
+        return max(0, self._memory_capacity_mb - self.memory_reserve_mb)
+
+    def _committed(self):
+        cpus = sum(r["cpus"] for r in self.reservations.values())
+        memory_mb = sum(r["memory_mb"] for r in self.reservations.values())
+        return cpus, memory_mb
+
+    @property
+    def capacity_known(self) -> bool:
+        return bool(self._cpu_capacity and self._memory_capacity_mb)
+
+    def _fits(self, cpus: float, memory_mb: int) -> bool:
+        if not self.capacity_known:
+            # Fail open until the daemon has told us how big the host is
+            return True
+        committed_cpus, committed_memory_mb = self._committed()
+        return (committed_cpus + cpus <= self.cpu_limit and
+                committed_memory_mb + memory_mb <= self.memory_limit_mb)
+
+    def _maybe_resync(self):
+        """Refresh reservations from Docker when due; called without the lock, which the Docker calls never hold"""
+        with self._condition:
+            if self._sync_started is not None or time.monotonic() - self._last_sync < self.resync_seconds:
+                return
+            started = self._sync_started = time.monotonic()
+            self._released_during_sync = set()
+        try:
+            self._load_capacity()
+            usage = self.docker_client.list_resource_commitments(self.host)
+        except Exception as e:
+            logger.warning(f"Admission resync failed for host {self.host}: {e}")
+            with self._condition:
+                self._sync_started = None
+            return
+        with self._condition:
+            reservations = {
+                item["id"]: {"cpus": item["cpus"], "memory_mb": item["memory_mb"], "at": started}
+                for item in usage if item["id"] not in self._released_during_sync
+            }
+            # Keep in-flight creates Docker doesn't know about yet, and anything admitted while listing
+            reservations.update({k: v for k, v in self.reservations.items() if v.get("pending") or v["at"] > started})
+            self.reservations = reservations
+            self._last_sync = time.monotonic()
+            self._sync_started = None
+            # Containers removed behind our back may have freed room for queued creates
+            self._condition.notify_all()
+
+    def admit(self, key: str, cpus: float, memory_mb: int, timeout: Optional[float] = None):
+        """Reserve capacity for a lab, waiting up to timeout seconds if the host is full"""
+        timeout = self.queue_timeout_seconds if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        self._maybe_resync()
+        with self._condition:
+            if self.capacity_known and (cpus > self.cpu_limit or memory_mb > self.memory_limit_mb):
+                self.rejected_total += 1
+                raise ExceedsHostCapacity("Requested resources exceed host capacity")
+
+            self.queued += 1
+            try:
+                while not self._fits(cpus, memory_mb):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.rejected_total += 1
+                        logger.warning(f"Admission rejected for {key} on host {self.host}: capacity exhausted")
+                        raise AdmissionRejected("Host capacity exhausted, try again later")
+                    self._condition.wait(remaining)
+            finally:
+                self.queued -= 1
+
+            self.reservations[key] = {"cpus": cpus, "memory_mb": memory_mb, "at": time.monotonic(), "pending": True}
+
+    def commit(self, key: str, container_id: str):
+        """Move an in-flight reservation onto the created container's ID"""
+        with self._condition:
+            reservation = self.reservations.pop(key, None)
+            if reservation:
+                reservation.pop("pending", None)
+                reservation["at"] = time.monotonic()
+                self.reservations[container_id] = reservation
+
+    def reserve_existing(self, container_id: str, cpus: float, memory_mb: int):
+        """Re-admit a stopped container that is being started again"""
+        with self._condition:
+            if container_id in self.reservations:
+                return
+        self.admit(container_id, cpus, memory_mb)
+        self.commit(container_id, container_id)
+
+    def release(self, key: str):
+        """Release capacity held by a container (or a failed create)"""
+        with self._condition:
+            if self._sync_started is not None:
+                # The listing in flight may still show it
+                self._released_during_sync.add(key)
+            if self.reservations.pop(key, None) is not None:
+                self._condition.notify_all()
+
+    def holds(self, key: str) -> bool:
+        return key in self.reservations
+
+    def utilization(self) -> Dict[str, Any]:
+        """Current commitments against host capacity"""
+        self._maybe_resync()
+        with self._condition:
+            committed_cpus, committed_memory_mb = self._committed()
+            return {
+                "host": self.host,
+                "cpu": {
+                    "capacity": self._cpu_capacity,
+                    "limit": round(self.cpu_limit, 3),
+                    "committed": round(committed_cpus, 3),
+                    "available": round(max(0.0, self.cpu_limit - committed_cpus), 3)
+                },
+                "memory_mb": {
+                    "capacity": self._memory_capacity_mb,
+                    "limit": self.memory_limit_mb,
+                    "committed": committed_memory_mb,
+                    "available": max(0, self.memory_limit_mb - committed_memory_mb)
+                },
+                "labs": len(self.reservations),
+                "queued": self.queued,
+                "rejected_total": self.rejected_total
+            }
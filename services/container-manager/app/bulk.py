@@ -0,0 +1,104 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional, List, Dict, Any, Callable, Iterator
+from datetime import datetime
+from metrics import BACKGROUND_EVENTS
+import contextvars
+import logging
+import json
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on how many labs one bulk operation works on at once
+BULK_MAX_PARALLELISM = int(os.getenv("BULK_MAX_PARALLELISM", "16"))
+BULK_DEFAULT_PARALLELISM = int(os.getenv("BULK_DEFAULT_PARALLELISM", "8"))
+
+# Docker states in which an action has nothing left to do
+DONE_STATES = {
+    "stop": ("created", "exited", "dead"),
+    "start": ("running",)
+}
+
+
+class BulkOperations:
+    """Runs one lab action over every lab matching a selector, a bounded number at a time.
+
+    Results stream back as NDJSON lines in completion order, followed by a summary line.
+    Actions are idempotent against the current Docker state (deleted labs no longer match,
+    stopped labs are skipped by stop), so an interrupted operation is resumed by sending
+    the same request again.
+    """
+
+    def __init__(self, docker_client, actions: Dict[str, Callable[[str], Any]]):
+        self.docker_client = docker_client
+        self.actions = actions
+
+    def select(self, user_id: Optional[str] = None, template_id: Optional[str] = None,
+               created_before: Optional[datetime] = None,
+               container_ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Labs matching every given criterion; label criteria are filtered by Docker"""
+        labels = {}
+        if user_id:
+            labels["fluxlabs.user_id"] = user_id
+        if template_id:
+            labels["fluxlabs.template"] = template_id
+        containers, failed_hosts = self.docker_client.list_lab_inventory(labels)
+        if failed_hosts:
+            logger.warning(f"Bulk selection skipped unreachable hosts: {', '.join(failed_hosts)}")
+
+        selected = []
+        wanted = set(container_ids or [])
+        for container in containers:
+            if wanted and container["Id"] not in wanted and container["Id"][:12] not in wanted:
+                continue
+            if created_before:
+                try:
+                    created_at = datetime.fromisoformat(container["Labels"].get("fluxlabs.created_at", ""))
+                except ValueError:
+                    continue
+                if created_at.replace(tzinfo=None) >= created_before.replace(tzinfo=None):
+                    continue
+            selected.append(container)
+        return selected
+
+    def run(self, action: str, containers: List[Dict[str, Any]],
+            parallelism: int = BULK_DEFAULT_PARALLELISM) -> Iterator[bytes]:
+        """Apply an action to the selected labs, yielding one NDJSON line per lab"""
+        handler = self.actions[action]
+        done_states = DONE_STATES.get(action, ())
+        parallelism = max(1, min(parallelism, BULK_MAX_PARALLELISM))
+        counts = {"ok": 0, "skipped": 0, "error": 0}
+        started = time.monotonic()
+
+        def apply(container):
+            result = {
+                "container_id": container["Id"],
+                "name": container["Labels"].get("fluxlabs.name", ""),
+                "user_id": container["Labels"].get("fluxlabs.user_id", ""),
+                "action": action
+            }
+            if container["State"] in done_states:
+                return {**result, "status": "skipped", "detail": f"already {container['State']}"}
+            try:
+                handler(container["Id"])
+                return {**result, "status": "ok"}
+            except Exception as e:
+                return {**result, "status": "error", "detail": str(e)}
+
+        executor = ThreadPoolExecutor(max_workers=parallelism)
+        try:
+            # Keep the request's trace context in the worker threads
+            futures = [executor.submit(contextvars.copy_context().run, apply, container) for container in containers]
+            for future in as_completed(futures):
+                result = future.result()
+                counts[result["status"]] += 1
+                yield (json.dumps(result) + "\n").encode()
+        finally:
+            # A client that disconnects stops labs not yet started; a retry picks them up
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        BACKGROUND_EVENTS.labels("container-manager", f"bulk_{action}").inc(counts["ok"])
+        logger.info(f"Bulk {action} of {len(containers)} labs: {counts}")
+        yield (json.dumps({"summary": {"action": action, "selected": len(containers), **counts,
+                                       "duration_seconds": round(time.monotonic() - started, 2)}}) + "\n").encode()
@@ -0,0 +1,198 @@
+from typing import Optional, List, Dict, Any, Tuple, Callable
+import threading
+import logging
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+# Read lab stats straight from cgroup v2 instead of one Docker stats call per lab.
+# Only labs on the engine whose cgroup tree and /proc are mounted here are covered;
+# the rest fall back to Docker.
+CGROUP_STATS_ENABLED = os.getenv("CGROUP_STATS_ENABLED", "false").lower() == "true"
+CGROUP_ROOT = os.getenv("CGROUP_ROOT", "/sys/fs/cgroup")
+PROC_ROOT = os.getenv("PROC_ROOT", "/proc")
+# Where the engine puts a container's cgroup, relative to CGROUP_ROOT: systemd driver, then cgroupfs
+CGROUP_PATH_PATTERNS = [
+    pattern for pattern in os.getenv(
+        "CGROUP_PATH_PATTERNS", "system.slice/docker-{id}.scope,docker/{id}"
+    ).split(",") if pattern
+]
+
+
+def _read(path: str) -> str:
+    with open(path) as stat_file:
+        return stat_file.read()
+
+
+def _read_optional(path: str, default: str = "") -> str:
+    """Read a file of a controller that may not be enabled for the cgroup"""
+    try:
+        return _read(path)
+    except FileNotFoundError:
+        return default
+
+
+def _keyed(text: str) -> Dict[str, int]:
+    """Parse `key value` lines such as cpu.stat and memory.stat"""
+    values = {}
+    for line in text.splitlines():
+        parts = line.split()
+        if len(parts) == 2 and parts[1].isdigit():
+            values[parts[0]] = int(parts[1])
+    return values
+
+
+def parse_io_stat(text: str) -> Tuple[int, int]:
+    """Bytes read and written over all devices in io.stat"""
+    read = written = 0
+    for line in text.splitlines():
+        for field in line.split()[1:]:
+            key, _, value = field.partition("=")
+            if key == "rbytes":
+                read += int(value)
+            elif key == "wbytes":
+                written += int(value)
+    return read, written
+
+
+def parse_net_dev(text: str) -> Tuple[int, int]:
+    """Bytes received and sent over all interfaces but loopback in /proc/<pid>/net/dev"""
+    rx = tx = 0
+    # Two header lines, then `iface: rx_bytes packets errs drop fifo frame compressed multicast tx_bytes ...`
+    for line in text.splitlines()[2:]:
+        interface, _, counters = line.partition(":")
+        fields = counters.split()
+        if interface.strip() == "lo" or len(fields) < 9:
+            continue
+        rx += int(fields[0])
+        tx += int(fields[8])
+    return rx, tx
+
+
+class CgroupStatsCollector:
+    """Normalized stats of many labs from one sweep over their cgroup v2 files.
+
+    Gives the same fields as normalize_docker_stats. Container IDs are mapped to
+    cgroup directories once and the mapping is cached until the directory goes
+    away. Network counters come from /proc/<pid>/net/dev of the container's init
+    process; its host PID comes from `pid_of` (Docker's State.Pid) since PIDs in
+    cgroup.procs are in this service's PID namespace, not the host's /proc.
+    CPU percent is the usage since this collector's previous sweep, so the first
+    sweep of a lab reports 0 and each consumer needs its own collector. Block I/O
+    and PIDs read as 0 when the io or pids controller is not enabled.
+    """
+
+    def __init__(self, pid_of: Callable[[str], int], cgroup_root: str = CGROUP_ROOT, proc_root: str = PROC_ROOT,
+                 path_patterns: Optional[List[str]] = None):
+        self.pid_of = pid_of
+        self.cgroup_root = cgroup_root
+        self.proc_root = proc_root
+        self.path_patterns = path_patterns or CGROUP_PATH_PATTERNS
+        # container ID -> cgroup directory
+        self._paths: Dict[str, str] = {}
+        # container ID -> host PID of its init process
+        self._pids: Dict[str, int] = {}
+        # container ID -> (monotonic time, cpu usage ns) at the previous sweep
+        self._previous: Dict[str, Tuple[float, int]] = {}
+        self._host_memory: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def available(self) -> bool:
+        """Whether the root is a cgroup v2 hierarchy"""
+        return os.path.exists(os.path.join(self.cgroup_root, "cgroup.controllers"))
+
+    def _resolve(self, container_id: str) -> Optional[str]:
+        path = self._paths.get(container_id)
+        if path is not None:
+            return path
+        for pattern in self.path_patterns:
+            candidate = os.path.join(self.cgroup_root, pattern.format(id=container_id))
+            if os.path.isdir(candidate):
+                self._paths[container_id] = candidate
+                return candidate
+        return None
+
+    def host_memory(self) -> int:
+        """Total host memory, reported as the limit of labs without one, as Docker does"""
+        if self._host_memory is None:
+            meminfo = _read(os.path.join(self.proc_root, "meminfo"))
+            total = next(line for line in meminfo.splitlines() if line.startswith("MemTotal:"))
+            self._host_memory = int(total.split()[1]) * 1024
+        return self._host_memory
+
+    def _network(self, container_id: str) -> Tuple[int, int]:
+        pid = self._pids.get(container_id)
+        if pid is None:
+            pid = self._pids[container_id] = self.pid_of(container_id)
+        try:
+            return parse_net_dev(_read(os.path.join(self.proc_root, str(pid), "net", "dev")))
+        except FileNotFoundError:
+            # Restarted under a new init process; the cgroup directory outlives it
+            pid = self._pids[container_id] = self.pid_of(container_id)
+            if not pid:
+                raise
+            return parse_net_dev(_read(os.path.join(self.proc_root, str(pid), "net", "dev")))
+
+    def _forget(self, container_id: str):
+        self._paths.pop(container_id, None)
+        self._pids.pop(container_id, None)
+        self._previous.pop(container_id, None)
+
+    def sample(self, container_id: str, now: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Normalized stats of one lab, or None if its cgroup is not visible here"""
+        path = self._resolve(container_id)
+        if path is None:
+            return None
+        now = now or time.monotonic()
+        try:
+            cpu = _keyed(_read(os.path.join(path, "cpu.stat")))
+            memory_stat = _keyed(_read(os.path.join(path, "memory.stat")))
+            memory_current = int(_read(os.path.join(path, "memory.current")))
+            memory_max = _read(os.path.join(path, "memory.max")).strip()
+            block_read, block_write = parse_io_stat(_read_optional(os.path.join(path, "io.stat")))
+            pids = int(_read_optional(os.path.join(path, "pids.current"), "0"))
+            network_rx, network_tx = self._network(container_id)
+        except FileNotFoundError:
+            # The container stopped or was removed; resolve again next time
+            self._forget(container_id)
+            return None
+
+        usage_ns = cpu.get("usage_usec", 0) * 1000
+        cpu_percent = 0.0
+        previous = self._previous.get(container_id)
+        if previous and now > previous[0] and usage_ns >= previous[1]:
+            cpu_percent = (usage_ns - previous[1]) / ((now - previous[0]) * 1e9) * 100.0
+        self._previous[container_id] = (now, usage_ns)
+
+        return {
+            "cpu_percent": round(cpu_percent, 3),
+            "cpu_usage_ns": usage_ns,
+            # Page cache is reclaimable; same as normalize_docker_stats
+            "memory_bytes": max(0, memory_current - memory_stat.get("inactive_file", 0)),
+            "memory_limit_bytes": self.host_memory() if memory_max == "max" else int(memory_max),
+            "network_rx_bytes": network_rx,
+            "network_tx_bytes": network_tx,
+            "block_read_bytes": block_read,
+            "block_write_bytes": block_write,
+            "pids": pids
+        }
+
+    def collect(self, container_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Stats of every listed lab whose cgroup is visible here, in one pass"""
+        now = time.monotonic()
+        results = {}
+        with self._lock:
+            for container_id in container_ids:
+                try:
+                    sample = self.sample(container_id, now)
+                except (OSError, ValueError, StopIteration) as e:
+                    logger.warning(f"Failed to read cgroup stats of {container_id}: {e}")
+                    continue
+                if sample is not None:
+                    results[container_id] = sample
+            # Labs no longer listed are not coming back under the same ID
+            listed = set(container_ids)
+            for container_id in [cid for cid in self._paths if cid not in listed]:
+                self._forget(container_id)
+        return results
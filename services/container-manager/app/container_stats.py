@@ -0,0 +1,68 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List, Dict, Any
+
+
+def normalize_docker_stats(raw: Dict[str, Any]) -> Dict[str, Any]:
+    """Reduce a raw `container.stats(stream=False)` document to flat counters and gauges"""
+    cpu_stats = raw.get("cpu_stats") or {}
+    precpu_stats = raw.get("precpu_stats") or {}
+
+    cpu_percent = 0.0
+    cpu_delta = (cpu_stats.get("cpu_usage", {}).get("total_usage", 0) -
+                 precpu_stats.get("cpu_usage", {}).get("total_usage", 0))
+    system_delta = cpu_stats.get("system_cpu_usage", 0) - precpu_stats.get("system_cpu_usage", 0)
+    online_cpus = cpu_stats.get("online_cpus") or len(cpu_stats.get("cpu_usage", {}).get("percpu_usage") or []) or 1
+    if cpu_delta > 0 and system_delta > 0:
+        cpu_percent = cpu_delta / system_delta * online_cpus * 100.0
+
+    memory_stats = raw.get("memory_stats") or {}
+    # Page cache is reclaimable; report it the way `docker stats` does
+    cache = (memory_stats.get("stats") or {}).get("inactive_file", 0)
+    memory_bytes = max(0, memory_stats.get("usage", 0) - cache)
+
+    network_rx = network_tx = 0
+    for interface in (raw.get("networks") or {}).values():
+        network_rx += interface.get("rx_bytes", 0)
+        network_tx += interface.get("tx_bytes", 0)
+
+    block_read = block_write = 0
+    for entry in (raw.get("blkio_stats") or {}).get("io_service_bytes_recursive") or []:
+        op = entry.get("op", "").lower()
+        if op == "read":
+            block_read += entry.get("value", 0)
+        elif op == "write":
+            block_write += entry.get("value", 0)
+
+    return {
+        "cpu_percent": round(cpu_percent, 3),
+        "cpu_usage_ns": cpu_stats.get("cpu_usage", {}).get("total_usage", 0),
+        "memory_bytes": memory_bytes,
+        "memory_limit_bytes": memory_stats.get("limit", 0),
+        "network_rx_bytes": network_rx,
+        "network_tx_bytes": network_tx,
+        "block_read_bytes": block_read,
+        "block_write_bytes": block_write,
+        "pids": (raw.get("pids_stats") or {}).get("current", 0)
+    }
+
+
+def sample_lab_stats(docker_client, container_ids: List[str], concurrency: int,
+                     cgroups=None) -> Dict[str, Dict[str, Any]]:
+    """Normalized stats of many labs: one cgroup sweep where available, Docker stats calls for the rest.
+
+    Labs whose stats cannot be read are left out.
+    """
+    results = cgroups.collect(container_ids) if cgroups is not None else {}
+    remaining = [container_id for container_id in container_ids if container_id not in results]
+    if not remaining:
+        return results
+
+    def sample(container_id):
+        raw = docker_client.get_container_stats(container_id)
+        return None if "error" in raw else normalize_docker_stats(raw)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for container_id, stats in zip(remaining, pool.map(sample, remaining)):
+            if stats is not None:
+                results[container_id] = stats
+    return results
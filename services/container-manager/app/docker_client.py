@@ -1,14 +1,156 @@
 import docker
+import requests
+import socket
 import random
 import json
-from typing import Optional, List, Dict, Any
+import os
+import threading
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from docker.utils.socket import frames_iter
+from typing import Optional, List, Dict, Any, Tuple, Iterator
+from docker_hosts import DockerHost, load_docker_hosts
+from container_stats import normalize_docker_stats
+from metrics import observe_docker_call
+from tracing import trace_call
+import contextvars
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on output buffered by one-shot exec calls
+EXEC_MAX_OUTPUT_BYTES = int(os.getenv("EXEC_MAX_OUTPUT_BYTES", str(1024 * 1024)))
+# Per-section timeouts (seconds) of the lab overview; OVERVIEW_TIMEOUTS=section=seconds,... overrides some of them
+OVERVIEW_TIMEOUTS = {"logs": 2.0, "stats": 4.0, "processes": 2.0}
+
+
+def _parse_overview_timeouts(spec: str) -> Dict[str, float]:
+    """Overrides from section=seconds pairs; malformed or unknown entries are skipped"""
+    overrides = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        name, _, seconds = item.partition("=")
+        name = name.strip()
+        try:
+            timeout = float(seconds)
+        except ValueError:
+            logger.warning(f"Ignoring malformed OVERVIEW_TIMEOUTS entry {item!r}")
+            continue
+        if name not in OVERVIEW_TIMEOUTS or timeout <= 0:
+            logger.warning(f"Ignoring OVERVIEW_TIMEOUTS entry {item!r}: expected one of "
+                           f"{', '.join(OVERVIEW_TIMEOUTS)} with a positive number of seconds")
+            continue
+        overrides[name] = timeout
+    return overrides
+
+
+OVERVIEW_TIMEOUTS.update(_parse_overview_timeouts(os.getenv("OVERVIEW_TIMEOUTS", "")))
+
+def instrumented(func):
+    """Time and trace a Docker operation under its method name"""
+    return observe_docker_call(trace_call(f"docker.{func.__name__}")(func))
 
 class DockerClient:
-    def __init__(self):
-        self.client = docker.from_env()
+    """Docker operations across a pool of Docker engines"""
+
+    def __init__(self, hosts: Optional[List[DockerHost]] = None):
+        self.hosts: Dict[str, DockerHost] = {host.name: host for host in (hosts or load_docker_hosts())}
+        self.default_host = next(iter(self.hosts))
+        # container ID (or name) -> host name
+        self._container_hosts: Dict[str, str] = {}
+        # exec ID -> host name, for interactive sessions
+        self._exec_hosts: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def client(self) -> docker.DockerClient:
+        """API client of the default host"""
+        return self.hosts[self.default_host].client
+
+    def host_names(self) -> List[str]:
+        return list(self.hosts)
+
+    def _host_client(self, host: Optional[str]) -> docker.DockerClient:
+        return self.hosts[host or self.default_host].client
+
+    def _fan_out(self, func, hosts: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Run func(host_name) on every host concurrently; failures are returned as exceptions"""
+        hosts = hosts or self.host_names()
+        if len(hosts) == 1:
+            try:
+                return {hosts[0]: func(hosts[0])}
+            except Exception as e:
+                return {hosts[0]: e}
+
+        def run(host):
+            try:
+                return func(host)
+            except Exception as e:
+                return e
+
+        # Carry the caller's trace context into the worker threads
+        contexts = [contextvars.copy_context() for _ in hosts]
+        with ThreadPoolExecutor(max_workers=len(hosts)) as pool:
+            return dict(zip(hosts, pool.map(lambda ctx, host: ctx.run(run, host), contexts, hosts)))
 
-    def create_container_with_labels(self, image: str, name: str, labels: Dict[str, str]) -> str:
-        """Create a new container with FluxLabs labels"""
+    def _remember_host(self, host: str, *keys: str):
+        with self._lock:
+            for key in keys:
+                self._container_hosts[key] = host
+
+    def _forget_container(self, *keys: str):
+        with self._lock:
+            for key in keys:
+                self._container_hosts.pop(key, None)
+
+    def _locate(self, container_id: str):
+        """Find the host running a container, returning (host_name, container)"""
+        host = self._container_hosts.get(container_id)
+        if host is not None:
+            try:
+                return host, self.hosts[host].client.containers.get(container_id)
+            except docker.errors.NotFound:
+                self._forget_container(container_id)
+
+        # A host that is down or erroring must not hide the container on the others
+        unreachable = None
+        for host in self.host_names():
+            try:
+                container = self.hosts[host].client.containers.get(container_id)
+            except docker.errors.NotFound:
+                continue
+            except (docker.errors.DockerException, requests.exceptions.RequestException) as e:
+                unreachable = e
+                continue
+            self._remember_host(host, container_id, container.id)
+            return host, container
+        if unreachable is not None:
+            # It may live on the host that failed, so this is not a 404
+            raise unreachable
+        raise docker.errors.NotFound(f"404 Client Error: No such container: {container_id}")
+
+    def _get_container(self, container_id: str):
+        return self._locate(container_id)[1]
+
+    def _client_for(self, container_id: str) -> docker.DockerClient:
+        host = self._container_hosts.get(container_id)
+        if host is None:
+            host = self._locate(container_id)[0]
+        return self.hosts[host].client
+
+    def host_of(self, container_id: str) -> str:
+        """Name of the host a container lives on"""
+        return self._container_hosts.get(container_id) or self._locate(container_id)[0]
+
+    @instrumented
+    def create_container_with_labels(self, image: str, name: str, labels: Dict[str, str],
+                                     resources: Optional[Dict[str, Any]] = None,
+                                     host: Optional[str] = None,
+                                     volumes: Optional[Dict[str, Dict[str, str]]] = None,
+                                     start: bool = True) -> str:
+        """Create (and by default start) a container with FluxLabs labels, optional limits and volumes"""
+        host = host or self.default_host
         try:
             # Generate random SSH port
             ssh_port = random.randint(2200, 2299)
@@ -22,128 +164,546 @@ class DockerClient:
 
             # Add FluxLabs prefix to all labels
             fluxlabs_labels = {f"{key}": value for key, value in labels.items()}
+            fluxlabs_labels["fluxlabs.host"] = host
+
+            # Resource limits; also recorded as labels so commitments can be listed cheaply
+            limits = {}
+            if resources:
+                limits = {
+                    "nano_cpus": int(resources["cpus"] * 1e9),
+                    "mem_limit": f"{resources['memory_mb']}m",
+                    "memswap_limit": f"{resources['memory_mb']}m",
+                    "pids_limit": resources["pids"]
+                }
+                fluxlabs_labels.update({
+                    "fluxlabs.resource_profile": resources.get("profile", "custom"),
+                    "fluxlabs.cpus": str(resources["cpus"]),
+                    "fluxlabs.memory_mb": str(resources["memory_mb"])
+                })
             
-            container = self.client.containers.run(
+            create_args = dict(
                 image=image,
-                detach=True,
                 ports=port_bindings,
-                remove=False,
                 name=name,
                 labels=fluxlabs_labels,
                 # Basic setup for SSH and common tools
                 environment={
                     'SSH_PORT': str(ssh_port)
-                }
+                },
+                volumes=volumes,
+                **limits
             )
-            
+            if start:
+                container = self.hosts[host].client.containers.run(detach=True, remove=False, **create_args)
+            else:
+                # Caller fills volumes before the first start
+                container = self.hosts[host].client.containers.create(**create_args)
+
+            self._remember_host(host, container.id, name)
             return container.id
         
         except Exception as e:
             raise Exception(f"Failed to create container: {str(e)}")
 
+    @instrumented
     def list_containers_by_label(self, label_key: str, label_value: str) -> List[Dict[str, Any]]:
-        """List containers filtered by a specific label"""
-        try:
-            filters = {
-                'label': f"{label_key}={label_value}"
-            }
-            containers = self.client.containers.list(all=True, filters=filters)
-            
+        """List containers filtered by a specific label, across all hosts"""
+        filters = {
+            'label': f"{label_key}={label_value}"
+        }
+
+        def list_host(host):
+            containers = self.hosts[host].client.containers.list(all=True, filters=filters)
             result = []
             for container in containers:
+                self._remember_host(host, container.id)
                 container_info = self._get_container_info(container)
                 if container_info:
+                    container_info["Host"] = host
                     result.append(container_info)
-            
             return result
-        
-        except Exception as e:
-            raise Exception(f"Failed to list containers: {str(e)}")
 
+        result = []
+        errors = []
+        for host, host_result in self._fan_out(list_host).items():
+            if isinstance(host_result, Exception):
+                errors.append(f"{host}: {host_result}")
+            else:
+                result.extend(host_result)
+        # Partial results are better than none when only some hosts are down
+        if errors and len(errors) == len(self.hosts):
+            raise Exception(f"Failed to list containers: {'; '.join(errors)}")
+        return result
+
+    def ping_hosts(self) -> Dict[str, bool]:
+        """Whether each Docker host answers; the first call also opens the API clients"""
+        return {host: result is True for host, result in self._fan_out(lambda host: self._host_client(host).ping()).items()}
+
+    @instrumented
+    def get_host_info(self, host: Optional[str] = None) -> Dict[str, Any]:
+        """Get Docker host information (NCPU, MemTotal, ...)"""
+        return self._host_client(host).info()
+
+    @instrumented
+    def list_resource_commitments(self, host: Optional[str] = None) -> List[Dict[str, Any]]:
+        """List resource limits of all active FluxLabs containers on a host in one API call"""
+        containers = self._host_client(host).api.containers(
+            all=True,
+            filters={'label': 'fluxlabs.created_by=FluxLabs'}
+        )
+        result = []
+        for container in containers:
+            if container.get("State") in ("exited", "dead"):
+                continue
+            result.append(self._resource_commitment(container["Id"], container.get("Labels") or {}))
+        return result
+
+    @instrumented
+    def list_image_tags(self, host: Optional[str] = None) -> List[str]:
+        """List image tags present on a host"""
+        tags = []
+        for image in self._host_client(host).api.images():
+            tags.extend(image.get("RepoTags") or [])
+        return tags
+
+    @instrumented
+    def get_container_resources(self, container_id: str) -> Dict[str, Any]:
+        """Get the resource commitment recorded on a container"""
+        container = self._get_container(container_id)
+        return self._resource_commitment(container.id, container.labels or {})
+
+    def _resource_commitment(self, container_id: str, labels: Dict[str, str]) -> Dict[str, Any]:
+        return {
+            "id": container_id,
+            "cpus": float(labels.get("fluxlabs.cpus", 0)),
+            "memory_mb": int(labels.get("fluxlabs.memory_mb", 0))
+        }
+
+    @instrumented
     def get_container_by_id(self, container_id: str) -> Optional[Dict[str, Any]]:
         """Get detailed container information by ID"""
         try:
-            container = self.client.containers.get(container_id)
+            container = self._get_container(container_id)
             return self._get_detailed_container_info(container)
         except Exception as e:
             raise Exception(f"Failed to get container: {str(e)}")
 
+    @instrumented
+    def get_lab_overview(self, container_id: str, log_tail: int = 100,
+                         timeouts: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+        """Details, log tail, stats and processes of a container from a single lookup.
+
+        The three sub-fetches run concurrently on the container already fetched; one
+        that fails or outlives its timeout (seconds, per section) is reported under
+        "errors" instead of failing the whole overview. Stats are normalized the same
+        way as the metrics history's samples.
+        """
+        timeouts = {**OVERVIEW_TIMEOUTS, **(timeouts or {})}
+        container = self._get_container(container_id)
+        sections = {
+            "logs": lambda: container.logs(tail=log_tail, timestamps=True).decode('utf-8', errors='replace'),
+            "stats": lambda: normalize_docker_stats(container.stats(stream=False)),
+            "processes": lambda: container.top()
+        }
+        overview = {"details": self._get_detailed_container_info(container, reload=False), "errors": {}}
+        if container.status != "running":
+            sections.pop("stats")
+            sections.pop("processes")
+            overview["errors"].update({"stats": "Lab is not running", "processes": "Lab is not running"})
+
+        started = time.monotonic()
+        pool = ThreadPoolExecutor(max_workers=len(sections))
+        futures = {
+            name: pool.submit(contextvars.copy_context().run, fetch)
+            for name, fetch in sections.items()
+        }
+        try:
+            # Each section has its own deadline, counted from when they all started
+            for name in sorted(futures, key=lambda name: timeouts.get(name, 0)):
+                remaining = timeouts.get(name, 0) - (time.monotonic() - started)
+                done, _ = wait([futures[name]], timeout=max(0, remaining))
+                if not done:
+                    overview["errors"][name] = f"Timed out after {timeouts.get(name, 0)}s"
+                elif futures[name].exception() is not None:
+                    overview["errors"][name] = str(futures[name].exception())
+                else:
+                    overview[name] = futures[name].result()
+        finally:
+            # Late fetches finish in the background; nobody waits for them
+            pool.shutdown(wait=False)
+        return overview
+
+    @instrumented
     def start_container(self, container_id: str) -> bool:
         """Start a container"""
         try:
-            container = self.client.containers.get(container_id)
+            container = self._get_container(container_id)
             container.start()
             return True
         except Exception:
             return False
 
+    @instrumented
     def stop_container(self, container_id: str) -> bool:
         """Stop a container"""
         try:
-            container = self.client.containers.get(container_id)
+            container = self._get_container(container_id)
             container.stop()
             return True
         except Exception:
             return False
 
+    @instrumented
     def restart_container(self, container_id: str) -> bool:
         """Restart a container"""
         try:
-            container = self.client.containers.get(container_id)
+            container = self._get_container(container_id)
             container.restart()
             return True
         except Exception:
             return False
 
+    @instrumented
+    def pause_container(self, container_id: str) -> bool:
+        """Pause (freeze) a container"""
+        try:
+            container = self._get_container(container_id)
+            container.pause()
+            return True
+        except Exception:
+            return False
+
+    @instrumented
+    def unpause_container(self, container_id: str) -> bool:
+        """Unpause a container"""
+        try:
+            container = self._get_container(container_id)
+            container.unpause()
+            return True
+        except Exception:
+            return False
+
+    @instrumented
+    def get_container_status(self, container_id: str) -> str:
+        """Get a container's Docker status (running, paused, exited, ...)"""
+        return self._get_container(container_id).status
+
+    @instrumented
+    def list_lab_ids_by_status(self, status: str = "running") -> List[str]:
+        """IDs of FluxLabs containers in a given state on all hosts, one sparse API call per host"""
+        def list_host(host):
+            containers = self.hosts[host].client.api.containers(
+                all=True,
+                filters={'label': 'fluxlabs.created_by=FluxLabs', 'status': status}
+            )
+            ids = [container["Id"] for container in containers]
+            self._remember_host(host, *ids)
+            return ids
+
+        result = []
+        for host_result in self._fan_out(list_host).values():
+            if not isinstance(host_result, Exception):
+                result.extend(host_result)
+        return result
+
+    @instrumented
+    def list_lab_inventory(self, labels: Optional[Dict[str, str]] = None,
+                           states: Optional[List[str]] = None) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """Summary of every FluxLabs container matching `labels` and `states`, one sparse API call per host.
+
+        Filtering happens in the Docker daemon. Returns the containers and the hosts that could not be listed.
+        """
+        filters = {'label': ['fluxlabs.created_by=FluxLabs'] + [f"{key}={value}" for key, value in (labels or {}).items()]}
+        if states:
+            filters['status'] = list(states)
+
+        def list_host(host):
+            containers = self.hosts[host].client.api.containers(all=True, filters=filters)
+            self._remember_host(host, *(container["Id"] for container in containers))
+            return [{"Id": container["Id"], "Names": container.get("Names") or [], "Image": container.get("Image", ""),
+                     "State": container.get("State", ""), "Status": container.get("Status", ""),
+                     "Ports": container.get("Ports") or [], "Labels": container.get("Labels") or {},
+                     "Host": host} for container in containers]
+
+        result = []
+        failed = []
+        for host, host_result in self._fan_out(list_host).items():
+            if isinstance(host_result, Exception):
+                failed.append(host)
+            else:
+                result.extend(host_result)
+        return result, failed
+
+    @instrumented
     def remove_container(self, container_id: str) -> bool:
         """Remove a container"""
         try:
-            container = self.client.containers.get(container_id)
+            container = self._get_container(container_id)
             container.remove(force=True)
+            self._forget_container(container_id, container.id, container.name)
             return True
         except Exception:
             return False
 
+    @instrumented
     def get_container_logs(self, container_id: str, tail: int = 100) -> str:
         """Get container logs"""
         try:
-            container = self.client.containers.get(container_id)
+            container = self._get_container(container_id)
             logs = container.logs(tail=tail, timestamps=True)
             return logs.decode('utf-8')
         except Exception as e:
             return f"Error getting logs: {str(e)}"
 
+    def stream_container_logs(self, container_id: str, since: Optional[float] = None) -> Iterator[bytes]:
+        """Stream a container's timestamped logs, optionally only those after `since` (epoch seconds)"""
+        kwargs = {"since": since} if since else {}
+        return self._client_for(container_id).api.logs(container_id, stream=True, follow=False,
+                                                       timestamps=True, **kwargs)
+
+    @instrumented
     def get_container_stats(self, container_id: str) -> Dict[str, Any]:
         """Get container stats"""
         try:
-            container = self.client.containers.get(container_id)
+            container = self._get_container(container_id)
             stats = container.stats(stream=False)
             return stats
         except Exception as e:
             return {"error": str(e)}
 
+    @instrumented
     def get_container_processes(self, container_id: str) -> List[Dict[str, Any]]:
         """Get container processes"""
         try:
-            container = self.client.containers.get(container_id)
+            container = self._get_container(container_id)
             processes = container.top()
             return processes
         except Exception as e:
             return {"error": str(e)}
 
-    def exec_command(self, container_id: str, command: str) -> Dict[str, Any]:
-        """Execute command in container"""
+    @instrumented
+    def exec_command(self, container_id: str, command: str, max_output_bytes: int = EXEC_MAX_OUTPUT_BYTES) -> Dict[str, Any]:
+        """Execute command in container, keeping at most max_output_bytes of output"""
         try:
-            container = self.client.containers.get(container_id)
-            exec_result = container.exec_run(command, stdout=True, stderr=True)
-            
+            api = self._client_for(container_id).api
+            exec_info = api.exec_create(container_id, command, stdout=True, stderr=True)
+            # The raw socket rather than a stream generator, whose close() leaves the connection open
+            sock = api.exec_start(exec_info["Id"], socket=True)
+
+            output = bytearray()
+            truncated = False
+            try:
+                for _, chunk in frames_iter(sock, tty=False):
+                    remaining = max_output_bytes - len(output)
+                    output.extend(chunk[:remaining])
+                    if len(chunk) > remaining:
+                        truncated = True
+                        break
+            finally:
+                # Dropping the attach connection closes the command's output pipe, so a command
+                # still writing gets SIGPIPE instead of blocking on a full buffer forever
+                raw = getattr(sock, "_sock", sock)
+                try:
+                    raw.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+                sock.close()
+
+            exec_state = api.exec_inspect(exec_info["Id"])
             return {
-                "exit_code": exec_result.exit_code,
-                "output": exec_result.output.decode('utf-8')
+                "exit_code": exec_state.get("ExitCode") if not exec_state.get("Running") else None,
+                "output": output.decode('utf-8', errors='replace'),
+                "truncated": truncated
             }
         except Exception as e:
             return {"error": str(e)}
 
+    @instrumented
+    def create_exec_session(self, container_id: str, command: str, tty: bool = True) -> Tuple[str, Any]:
+        """Create an interactive exec instance and return its id and attached socket"""
+        api = self._client_for(container_id).api
+        exec_info = api.exec_create(
+            container_id,
+            command,
+            stdout=True,
+            stderr=True,
+            stdin=True,
+            tty=tty
+        )
+        sock = api.exec_start(exec_info["Id"], tty=tty, socket=True)
+        self._exec_hosts[exec_info["Id"]] = self.host_of(container_id)
+        return exec_info["Id"], sock
+
+    @instrumented
+    def resize_exec(self, exec_id: str, rows: int, cols: int) -> None:
+        """Resize the PTY of an exec instance"""
+        self._exec_client(exec_id).api.exec_resize(exec_id, height=rows, width=cols)
+
+    @instrumented
+    def inspect_exec(self, exec_id: str) -> Dict[str, Any]:
+        """Get exec instance state (running flag, exit code)"""
+        return self._exec_client(exec_id).api.exec_inspect(exec_id)
+
+    @instrumented
+    def inspect_container(self, container_id: str) -> Dict[str, Any]:
+        """Raw inspect data of a container (Config, Mounts, Image, ...)"""
+        return self._get_container(container_id).attrs
+
+    @instrumented
+    def commit_container(self, container_id: str, repository: str, tag: str,
+                         labels: Dict[str, str]) -> Dict[str, Any]:
+        """Commit a container's writable layer as a new image on the container's host"""
+        container = self._get_container(container_id)
+        # Paused while committing so the layer is consistent
+        image = container.commit(repository=repository, tag=tag, conf={"Labels": labels}, pause=True)
+        return image.attrs
+
+    @instrumented
+    def inspect_image(self, image: str, host: Optional[str] = None) -> Dict[str, Any]:
+        """Raw inspect data of an image on a host"""
+        return self._host_client(host).api.inspect_image(image)
+
+    @instrumented
+    def list_images_by_label(self, label: str) -> List[Dict[str, Any]]:
+        """Images carrying a label on all hosts, one API call per host"""
+        def list_host(host):
+            images = self.hosts[host].client.api.images(filters={"label": label})
+            return [{**image, "Host": host} for image in images]
+
+        result = []
+        for host_result in self._fan_out(list_host).values():
+            if not isinstance(host_result, Exception):
+                result.extend(host_result)
+        return result
+
+    @instrumented
+    def list_exited_labs(self, host: str) -> List[Dict[str, Any]]:
+        """Exited or dead FluxLabs containers on a host with the size of their writable layer"""
+        containers = self.hosts[host].client.api.containers(
+            all=True, size=True,
+            filters={'label': 'fluxlabs.created_by=FluxLabs', 'status': ['exited', 'dead']}
+        )
+        return [{**container, "Host": host} for container in containers]
+
+    @instrumented
+    def list_images(self, host: str, dangling: bool = False) -> List[Dict[str, Any]]:
+        """Images on a host; with dangling=True only untagged layers no tagged image uses"""
+        images = self.hosts[host].client.api.images(filters={"dangling": True} if dangling else None)
+        return [{**image, "Host": host} for image in images]
+
+    @instrumented
+    def list_used_image_ids(self, host: str) -> List[str]:
+        """IDs of images any container on a host, running or not, was created from"""
+        return list({container["ImageID"] for container in self.hosts[host].client.api.containers(all=True)})
+
+    @instrumented
+    def list_volumes(self, host: str, dangling: bool = False) -> List[Dict[str, Any]]:
+        """Volumes on a host; with dangling=True only those no container references"""
+        volumes = self.hosts[host].client.api.volumes(filters={"dangling": True} if dangling else None)
+        return [{**volume, "Host": host} for volume in volumes.get("Volumes") or []]
+
+    @instrumented
+    def volume_sizes(self, host: str) -> Dict[str, int]:
+        """Disk usage of each volume on a host; walks the volumes, so it is slow"""
+        usage = self.hosts[host].client.api.df()
+        return {volume["Name"]: (volume.get("UsageData") or {}).get("Size", 0) for volume in usage.get("Volumes") or []}
+
+    @instrumented
+    def remove_image(self, image: str, host: Optional[str] = None) -> bool:
+        """Remove an image reference; layers still used by other images stay"""
+        try:
+            self._host_client(host).api.remove_image(image)
+            return True
+        except Exception:
+            return False
+
+    def save_image(self, image: str, host: Optional[str] = None, chunk_size: int = 1024 * 1024):
+        """Stream an image with all its layers as a `docker save` tarball"""
+        return self._host_client(host).api.get_image(image, chunk_size=chunk_size)
+
+    def get_archive(self, container_id: str, path: str, chunk_size: int = 1024 * 1024):
+        """Stream a path in a container as a tarball"""
+        stream, _ = self._client_for(container_id).api.get_archive(container_id, path, chunk_size=chunk_size)
+        return stream
+
+    @instrumented
+    def put_archive(self, container_id: str, path: str, data) -> bool:
+        """Extract a tarball (bytes or an iterable of chunks) into a directory of a container"""
+        return self._client_for(container_id).api.put_archive(container_id, path, data)
+
+    @instrumented
+    def ensure_image(self, image: str, host: Optional[str] = None) -> str:
+        """Pull an image onto a host if it is missing and return its ID"""
+        client = self._host_client(host)
+        try:
+            return client.images.get(image).id
+        except docker.errors.ImageNotFound:
+            return client.images.pull(image).id
+
+    @instrumented
+    def get_volume(self, name: str, host: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Inspect data of a named volume, or None if it does not exist"""
+        try:
+            return self._host_client(host).volumes.get(name).attrs
+        except docker.errors.NotFound:
+            return None
+
+    @instrumented
+    def create_volume(self, name: str, host: Optional[str] = None, labels: Optional[Dict[str, str]] = None,
+                      driver_opts: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """Create a named volume with the local driver"""
+        volume = self._host_client(host).volumes.create(name=name, driver="local", driver_opts=driver_opts or {},
+                                                        labels=labels or {})
+        return volume.attrs
+
+    @instrumented
+    def remove_volume(self, name: str, host: Optional[str] = None) -> bool:
+        """Remove a named volume; False if it is missing or still in use"""
+        try:
+            self._host_client(host).volumes.get(name).remove(force=True)
+            return True
+        except Exception:
+            return False
+
+    @instrumented
+    def run_to_completion(self, image: str, name: str, command: List[str], volumes: Dict[str, Dict[str, str]],
+                          labels: Dict[str, str], host: Optional[str] = None) -> int:
+        """Run a helper container to completion and return its exit code; the container is kept"""
+        client = self._host_client(host)
+        container = client.containers.create(image=image, name=name, entrypoint=command[:1], command=command[1:],
+                                             volumes=volumes, labels=labels, network_disabled=True)
+        container.start()
+        return container.wait().get("StatusCode", -1)
+
+    @instrumented
+    def get_helper_state(self, name: str, host: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """State of a helper container by name, or None if it does not exist"""
+        try:
+            return self._host_client(host).api.inspect_container(name).get("State", {})
+        except docker.errors.NotFound:
+            return None
+
+    @instrumented
+    def remove_helper(self, name: str, host: Optional[str] = None) -> bool:
+        """Remove a helper container by name"""
+        try:
+            self._host_client(host).api.remove_container(name, force=True)
+            return True
+        except Exception:
+            return False
+
+    def get_helper_archive(self, name: str, path: str, host: Optional[str] = None, chunk_size: int = 1024 * 1024):
+        """Stream a path of a helper container (which is not tracked as a lab) as a tarball"""
+        stream, _ = self._host_client(host).api.get_archive(name, path, chunk_size=chunk_size)
+        return stream
+
+    def release_exec(self, exec_id: str) -> None:
+        """Forget which host an exec instance belongs to"""
+        self._exec_hosts.pop(exec_id, None)
+
+    def _exec_client(self, exec_id: str) -> docker.DockerClient:
+        return self._host_client(self._exec_hosts.get(exec_id))
+
     def _get_container_info(self, container) -> Optional[Dict[str, Any]]:
         """Get basic container information for list view"""
         try:
@@ -175,10 +735,11 @@ class DockerClient:
         except Exception as e:
             return None
 
-    def _get_detailed_container_info(self, container) -> Optional[Dict[str, Any]]:
+    def _get_detailed_container_info(self, container, reload: bool = True) -> Optional[Dict[str, Any]]:
         """Get detailed container information for details view"""
         try:
-            container.reload()
+            if reload:
+                container.reload()
             attrs = container.attrs
             
             # Get network settings
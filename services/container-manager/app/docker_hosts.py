@@ -0,0 +1,47 @@
+from typing import Optional, List
+import threading
+import docker
+import os
+
+# Comma-separated Docker endpoints, e.g. "local=unix:///var/run/docker.sock,node2=tcp://10.0.0.2:2375".
+# Unset means a single host configured from the environment (DOCKER_HOST etc).
+DOCKER_HOSTS = os.getenv("DOCKER_HOSTS", "")
+DOCKER_API_TIMEOUT_SECONDS = int(os.getenv("DOCKER_API_TIMEOUT_SECONDS", "60"))
+
+
+class DockerHost:
+    """One Docker engine in the pool; the API client is created on first use"""
+
+    def __init__(self, name: str, base_url: Optional[str] = None):
+        self.name = name
+        self.base_url = base_url
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self) -> docker.DockerClient:
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    if self.base_url:
+                        self._client = docker.DockerClient(base_url=self.base_url, timeout=DOCKER_API_TIMEOUT_SECONDS)
+                    else:
+                        self._client = docker.from_env(timeout=DOCKER_API_TIMEOUT_SECONDS)
+        return self._client
+
+    def __repr__(self):
+        return f"DockerHost({self.name!r}, {self.base_url or 'from_env'!r})"
+
+
+def load_docker_hosts(spec: str = DOCKER_HOSTS) -> List[DockerHost]:
+    """Parse DOCKER_HOSTS into DockerHost entries"""
+    hosts = []
+    for index, entry in enumerate(item.strip() for item in spec.split(",")):
+        if not entry:
+            continue
+        if "=" in entry:
+            name, url = entry.split("=", 1)
+        else:
+            name, url = f"host{index}", entry
+        hosts.append(DockerHost(name.strip(), url.strip()))
+    return hosts or [DockerHost("local")]
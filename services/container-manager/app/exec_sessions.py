@@ -0,0 +1,314 @@
+from fastapi import WebSocket
+from typing import Optional, List, Dict, Any, Tuple, Callable
+import concurrent.futures
+import asyncio
+import socket
+import struct
+import threading
+import logging
+import json
+import time
+import uuid
+import os
+
+logger = logging.getLogger(__name__)
+
+# Exec session limits
+EXEC_MAX_SESSIONS_PER_CONTAINER = int(os.getenv("EXEC_MAX_SESSIONS_PER_CONTAINER", "4"))
+EXEC_SESSION_MAX_OUTPUT_BYTES = int(os.getenv("EXEC_SESSION_MAX_OUTPUT_BYTES", str(64 * 1024 * 1024)))
+EXEC_IDLE_TIMEOUT_SECONDS = int(os.getenv("EXEC_IDLE_TIMEOUT_SECONDS", "900"))
+
+# Flow control: the reader thread blocks once this many chunks are waiting for the client
+EXEC_OUTPUT_QUEUE_CHUNKS = 64
+EXEC_READ_CHUNK_BYTES = 16 * 1024
+
+# Channel byte prefixed to every binary frame sent to the client
+STDOUT_CHANNEL = 1
+STDERR_CHANNEL = 2
+
+# WebSocket close code for "try again later"
+WS_TRY_AGAIN_LATER = 1013
+
+
+class _StreamDemuxer:
+    """Split Docker's multiplexed (non-TTY) exec stream into stdout/stderr frames"""
+
+    HEADER_SIZE = 8
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data: bytes) -> List[Tuple[int, bytes]]:
+        self.buffer.extend(data)
+        frames = []
+        while len(self.buffer) >= self.HEADER_SIZE:
+            stream_type, size = struct.unpack(">BxxxL", self.buffer[:self.HEADER_SIZE])
+            end = self.HEADER_SIZE + size
+            if len(self.buffer) < end:
+                break
+            channel = STDERR_CHANNEL if stream_type == 2 else STDOUT_CHANNEL
+            frames.append((channel, bytes(self.buffer[self.HEADER_SIZE:end])))
+            del self.buffer[:end]
+        return frames
+
+
+class ExecSession:
+    def __init__(self, container_id: str, command: str, tty: bool):
+        self.id = uuid.uuid4().hex
+        self.container_id = container_id
+        self.command = command
+        self.tty = tty
+        self.exec_id: Optional[str] = None
+        self.sock = None
+        self.output_bytes = 0
+        self.started_at = time.time()
+        self.last_activity = time.monotonic()
+        self.closed = threading.Event()
+
+    @property
+    def raw_socket(self):
+        # docker-py hands back a SocketIO wrapper for unix sockets
+        return getattr(self.sock, "_sock", self.sock)
+
+    def touch(self):
+        self.last_activity = time.monotonic()
+
+    def close(self):
+        """Close the attached socket, unblocking the reader thread"""
+        self.closed.set()
+        raw = self.raw_socket
+        if raw is None:
+            return
+        try:
+            raw.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "container_id": self.container_id,
+            "command": self.command,
+            "tty": self.tty,
+            "output_bytes": self.output_bytes,
+            "started_at": self.started_at,
+            "idle_seconds": round(time.monotonic() - self.last_activity, 1)
+        }
+
+
+class ExecSessionManager:
+    """Interactive exec sessions streamed over WebSockets.
+
+    Protocol: the server sends binary frames prefixed with a channel byte
+    (1 = stdout, 2 = stderr) and JSON text frames for control messages
+    ("ready", "exit", "error"). The client sends stdin as binary frames, or
+    JSON text frames: {"type": "stdin", "data": "..."},
+    {"type": "resize", "rows": 24, "cols": 80} and {"type": "eof"}.
+    """
+
+    def __init__(self, docker_client,
+                 max_sessions_per_container: int = EXEC_MAX_SESSIONS_PER_CONTAINER,
+                 max_output_bytes: int = EXEC_SESSION_MAX_OUTPUT_BYTES,
+                 idle_timeout_seconds: int = EXEC_IDLE_TIMEOUT_SECONDS):
+        self.docker_client = docker_client
+        self.max_sessions_per_container = max_sessions_per_container
+        self.max_output_bytes = max_output_bytes
+        self.idle_timeout_seconds = idle_timeout_seconds
+        self.sessions: Dict[str, Dict[str, ExecSession]] = {}
+
+    def list_sessions(self, container_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """List active sessions, optionally for one container"""
+        if container_id is not None:
+            return [s.to_dict() for s in self.sessions.get(container_id, {}).values()]
+        return [s.to_dict() for sessions in self.sessions.values() for s in sessions.values()]
+
+    def active_count(self) -> int:
+        return sum(len(sessions) for sessions in self.sessions.values())
+
+    def _reserve(self, session: ExecSession) -> bool:
+        container_sessions = self.sessions.setdefault(session.container_id, {})
+        if len(container_sessions) >= self.max_sessions_per_container:
+            return False
+        container_sessions[session.id] = session
+        return True
+
+    def _release(self, session: ExecSession):
+        container_sessions = self.sessions.get(session.container_id, {})
+        container_sessions.pop(session.id, None)
+        if not container_sessions:
+            self.sessions.pop(session.container_id, None)
+
+    async def run(self, websocket: WebSocket, container_id: str, command: str,
+                  tty: bool = True, rows: Optional[int] = None, cols: Optional[int] = None,
+                  prepare: Optional[Callable[[str], Any]] = None):
+        """Attach a WebSocket to a new exec session and pump it until either side ends.
+
+        prepare runs (in a thread) after the WebSocket is accepted, e.g. to resume a suspended lab;
+        its failures reach the client as an "error" frame.
+        """
+        await websocket.accept()
+
+        session = ExecSession(container_id, command, tty)
+        if not self._reserve(session):
+            logger.warning(f"Exec session limit reached for container {container_id}")
+            await websocket.send_json({
+                "type": "error",
+                "message": f"Too many exec sessions for this lab (limit {self.max_sessions_per_container})"
+            })
+            await websocket.close(code=WS_TRY_AGAIN_LATER)
+            return
+
+        reason = "error"
+        try:
+            try:
+                if prepare is not None:
+                    await asyncio.to_thread(prepare, container_id)
+                session.exec_id, session.sock = await asyncio.to_thread(
+                    self.docker_client.create_exec_session, container_id, command, tty
+                )
+                if tty and rows and cols:
+                    await asyncio.to_thread(self.docker_client.resize_exec, session.exec_id, rows, cols)
+            except Exception as e:
+                logger.error(f"Failed to start exec session in {container_id}: {e}")
+                await websocket.send_json({"type": "error", "message": str(e)})
+                await websocket.close()
+                return
+
+            logger.info(f"Exec session {session.id} started in {container_id}")
+            await websocket.send_json({"type": "ready", "session_id": session.id, "tty": tty})
+            reason = await self._pump(websocket, session)
+        finally:
+            session.close()
+            self._release(session)
+
+        exit_code = await self._exit_code(session)
+        logger.info(f"Exec session {session.id} ended: {reason} (exit code {exit_code})")
+        if reason != "client_disconnected":
+            try:
+                await websocket.send_json({"type": "exit", "reason": reason, "exit_code": exit_code})
+                await websocket.close()
+            except Exception:
+                pass
+
+    async def _pump(self, websocket: WebSocket, session: ExecSession) -> str:
+        loop = asyncio.get_running_loop()
+        output = asyncio.Queue(maxsize=EXEC_OUTPUT_QUEUE_CHUNKS)
+        reader = threading.Thread(
+            target=self._read_loop,
+            args=(session, loop, output),
+            name=f"exec-reader-{session.id[:8]}",
+            daemon=True
+        )
+        reader.start()
+
+        tasks = [
+            asyncio.create_task(self._pump_output(websocket, session, output)),
+            asyncio.create_task(self._pump_input(websocket, session)),
+            asyncio.create_task(self._watch_idle(session))
+        ]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            finished = done.pop()
+            return finished.result() if not finished.exception() else "error"
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _read_loop(self, session: ExecSession, loop: asyncio.AbstractEventLoop, output: asyncio.Queue):
+        """Blocking socket reader; hands chunks to the event loop through a bounded queue"""
+        raw = session.raw_socket
+        while True:
+            try:
+                data = raw.recv(EXEC_READ_CHUNK_BYTES)
+            except OSError:
+                data = b""
+
+            future = asyncio.run_coroutine_threadsafe(output.put(data), loop)
+            while True:
+                try:
+                    future.result(timeout=1.0)
+                    break
+                except concurrent.futures.TimeoutError:
+                    # Client is not keeping up; keep waiting unless the session went away
+                    if session.closed.is_set():
+                        future.cancel()
+                        return
+                except Exception:
+                    return
+
+            if not data:
+                return
+
+    async def _pump_output(self, websocket: WebSocket, session: ExecSession, output: asyncio.Queue) -> str:
+        demuxer = None if session.tty else _StreamDemuxer()
+        while True:
+            data = await output.get()
+            if not data:
+                return "exited"
+            session.touch()
+
+            frames = [(STDOUT_CHANNEL, data)] if demuxer is None else demuxer.feed(data)
+            for channel, payload in frames:
+                remaining = self.max_output_bytes - session.output_bytes
+                payload = payload[:remaining]
+                session.output_bytes += len(payload)
+                if payload:
+                    await websocket.send_bytes(bytes([channel]) + payload)
+                if session.output_bytes >= self.max_output_bytes:
+                    return "output_limit"
+
+    async def _pump_input(self, websocket: WebSocket, session: ExecSession) -> str:
+        raw = session.raw_socket
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return "client_disconnected"
+            session.touch()
+
+            data = message.get("bytes")
+            if data is None and message.get("text"):
+                try:
+                    control = json.loads(message["text"])
+                except ValueError:
+                    continue
+                if control.get("type") == "stdin":
+                    data = str(control.get("data", "")).encode("utf-8")
+                elif control.get("type") == "resize" and session.tty:
+                    try:
+                        await asyncio.to_thread(
+                            self.docker_client.resize_exec,
+                            session.exec_id, int(control["rows"]), int(control["cols"])
+                        )
+                    except Exception as e:
+                        logger.warning(f"Failed to resize exec session {session.id}: {e}")
+                elif control.get("type") == "eof":
+                    try:
+                        raw.shutdown(socket.SHUT_WR)
+                    except OSError:
+                        pass
+
+            if data:
+                await asyncio.to_thread(raw.sendall, data)
+
+    async def _watch_idle(self, session: ExecSession) -> str:
+        check_interval = max(1, min(30, self.idle_timeout_seconds // 4))
+        while True:
+            await asyncio.sleep(check_interval)
+            if time.monotonic() - session.last_activity >= self.idle_timeout_seconds:
+                return "idle_timeout"
+
+    async def _exit_code(self, session: ExecSession) -> Optional[int]:
+        if not session.exec_id:
+            return None
+        try:
+            state = await asyncio.to_thread(self.docker_client.inspect_exec, session.exec_id)
+            return None if state.get("Running") else state.get("ExitCode")
+        except Exception:
+            return None
+        finally:
+            self.docker_client.release_exec(session.exec_id)
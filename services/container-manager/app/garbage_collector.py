@@ -0,0 +1,329 @@
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.triggers.interval import IntervalTrigger
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, Callable, Iterator, Set
+from metrics import BACKGROUND_EVENTS
+import threading
+import requests
+import logging
+import shutil
+import time
+import re
+import os
+
+logger = logging.getLogger(__name__)
+
+# How often a GC pass runs; 0 disables garbage collection
+GC_INTERVAL_SECONDS = int(os.getenv("GC_INTERVAL_SECONDS", "600"))
+# Exited labs are removed this long after they stopped, or as soon as their duration is over
+GC_EXITED_MAX_AGE_HOURS = float(os.getenv("GC_EXITED_MAX_AGE_HOURS", "24"))
+GC_DANGLING_IMAGE_MIN_AGE_HOURS = float(os.getenv("GC_DANGLING_IMAGE_MIN_AGE_HOURS", "1"))
+# Workspace volumes exist briefly before their lab container does
+GC_VOLUME_MIN_AGE_HOURS = float(os.getenv("GC_VOLUME_MIN_AGE_HOURS", "1"))
+# Docker data root of the default host as mounted here; "" disables the disk watermarks
+GC_DISK_PATH = os.getenv("GC_DISK_PATH", "")
+# Above the high watermark age limits drop to GC_PRESSURE_MIN_AGE_MINUTES and unused
+# non-template images become candidates, until usage is back under the low watermark
+GC_DISK_HIGH_WATERMARK = float(os.getenv("GC_DISK_HIGH_WATERMARK", "0.85"))
+GC_DISK_LOW_WATERMARK = float(os.getenv("GC_DISK_LOW_WATERMARK", "0.70"))
+GC_PRESSURE_MIN_AGE_MINUTES = float(os.getenv("GC_PRESSURE_MIN_AGE_MINUTES", "10"))
+# Removals are spaced out and capped per pass so GC never crowds out lab operations on the daemon
+GC_MAX_REMOVALS_PER_PASS = int(os.getenv("GC_MAX_REMOVALS_PER_PASS", "20"))
+GC_REMOVAL_INTERVAL_SECONDS = float(os.getenv("GC_REMOVAL_INTERVAL_SECONDS", "1.0"))
+# Report what would be removed without removing anything
+GC_DRY_RUN = os.getenv("GC_DRY_RUN", "false").lower() == "true"
+# Labs created through lab-manager are only removed once it has expired or dropped their lab row
+LAB_MANAGER_URL = os.getenv("LAB_MANAGER_URL", "http://lab-manager:8004")
+LAB_MANAGER_TIMEOUT_SECONDS = float(os.getenv("LAB_MANAGER_TIMEOUT_SECONDS", "5"))
+
+KINDS = ("containers", "images", "volumes")
+
+_ANONYMOUS_VOLUME = re.compile(r"^[0-9a-f]{64}$")
+
+
+def _epoch(value) -> Optional[float]:
+    """Seconds since the epoch of a Docker timestamp: a number, or RFC 3339 with nanoseconds"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return datetime.fromisoformat(re.sub(r"\.\d+", "", value).replace("Z", "+00:00")).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def _expired(labels: Dict[str, str], now: float) -> bool:
+    try:
+        expires_at = (datetime.fromisoformat(labels["fluxlabs.created_at"]) +
+                      timedelta(hours=float(labels["fluxlabs.duration_hours"])))
+    except (KeyError, ValueError):
+        return False
+    return expires_at.timestamp() < now
+
+
+def _image_reference(image: str) -> str:
+    """Image reference as Docker lists it in RepoTags"""
+    return image if ":" in image.rsplit("/", 1)[-1] else f"{image}:latest"
+
+
+class GarbageCollector:
+    """Removes exited lab containers, dangling images and unused volumes in small, rate-limited passes.
+
+    Persistent labs, labs the idle detector stopped, labs whose lab-manager row is still
+    live (or cannot be checked), template images, snapshot images and workspace base
+    volumes are never collected, nor are named volumes FluxLabs did not create. Each
+    pass removes at most GC_MAX_REMOVALS_PER_PASS objects, one every
+    GC_REMOVAL_INTERVAL_SECONDS; with GC_DISK_PATH set, disk usage above the high
+    watermark makes passes more aggressive until it drops below the low watermark.
+    """
+
+    def __init__(self, docker_client, remove_lab: Callable[[str], None],
+                 protected_lab: Callable[[str], bool], template_images: Callable[[], Set[str]],
+                 interval_seconds: int = GC_INTERVAL_SECONDS, disk_path: str = GC_DISK_PATH,
+                 dry_run: bool = GC_DRY_RUN, lab_manager_url: str = LAB_MANAGER_URL):
+        self.docker_client = docker_client
+        self.remove_lab = remove_lab
+        self.protected_lab = protected_lab
+        self.template_images = template_images
+        self.interval_seconds = interval_seconds
+        self.disk_path = disk_path
+        self.dry_run = dry_run
+        self.lab_manager_url = lab_manager_url.rstrip("/")
+        self.scheduler = BackgroundScheduler()
+        # host -> whether it is between crossing the high and the low watermark
+        self.pressure: Dict[str, bool] = {}
+        self.totals = {kind: {"removed": 0, "bytes": 0} for kind in KINDS}
+        self.last_pass: Optional[Dict[str, Any]] = None
+        self._last_removal = 0.0
+        self._pass_lock = threading.Lock()
+
+    def start(self):
+        if not self.interval_seconds:
+            return
+        self.scheduler.add_job(
+            func=self.collect,
+            trigger=IntervalTrigger(seconds=self.interval_seconds),
+            id='collect_garbage',
+            name='Collect Docker garbage',
+            max_instances=1,
+            coalesce=True
+        )
+        self.scheduler.start()
+        logger.info(f"Garbage collector started (every {self.interval_seconds}s{', dry run' if self.dry_run else ''})")
+
+    def stop(self):
+        if self.scheduler.running:
+            self.scheduler.shutdown(wait=False)
+
+    @property
+    def reclaimed_bytes(self) -> int:
+        return sum(total["bytes"] for total in self.totals.values())
+
+    def disk_usage(self, host: str) -> Optional[float]:
+        """Used fraction of a host's Docker filesystem, if it is visible here"""
+        if not self.disk_path or host != self.docker_client.default_host:
+            return None
+        try:
+            usage = shutil.disk_usage(self.disk_path)
+        except OSError as e:
+            logger.warning(f"Failed to read disk usage of {self.disk_path}: {e}")
+            return None
+        return usage.used / usage.total
+
+    def _under_pressure(self, host: str) -> bool:
+        usage = self.disk_usage(host)
+        if usage is None:
+            self.pressure[host] = False
+        elif usage >= GC_DISK_HIGH_WATERMARK:
+            self.pressure[host] = True
+        elif usage < GC_DISK_LOW_WATERMARK:
+            self.pressure[host] = False
+        return self.pressure.get(host, False)
+
+    def _container_candidates(self, host: str, pressure: bool, now: float) -> Iterator[Dict[str, Any]]:
+        floor = GC_PRESSURE_MIN_AGE_MINUTES * 60
+        for container in self.docker_client.list_exited_labs(host):
+            labels = container.get("Labels") or {}
+            if labels.get("fluxlabs.persistent") == "true" or self.protected_lab(container["Id"]):
+                continue
+            expired = _expired(labels, now)
+            limit = floor if pressure or expired else GC_EXITED_MAX_AGE_HOURS * 3600
+            # A lab cannot have stopped before it was created, so young ones need no inspect
+            if now - container.get("Created", now) < limit:
+                continue
+            finished = _epoch(self.docker_client.inspect_container(container["Id"]).get("State", {}).get("FinishedAt"))
+            if not finished or finished <= 0:
+                finished = container.get("Created", now)
+            # Checked last, as it asks lab-manager; an expired or missing row never comes back
+            if now - finished >= limit and not self._lab_row_live(container["Id"], labels):
+                yield {"kind": "containers", "id": container["Id"], "host": host, "bytes": container.get("SizeRw") or 0,
+                       "forced": pressure and not expired and now - finished < GC_EXITED_MAX_AGE_HOURS * 3600}
+
+    def _image_candidates(self, host: str, pressure: bool, now: float) -> Iterator[Dict[str, Any]]:
+        floor = GC_PRESSURE_MIN_AGE_MINUTES * 60
+        limit = floor if pressure else GC_DANGLING_IMAGE_MIN_AGE_HOURS * 3600
+        for image in sorted(self.docker_client.list_images(host, dangling=True), key=lambda image: image.get("Created", 0)):
+            age = now - image.get("Created", now)
+            if age >= limit:
+                yield {"kind": "images", "id": image["Id"], "host": host, "bytes": image.get("Size") or 0,
+                       "forced": age < GC_DANGLING_IMAGE_MIN_AGE_HOURS * 3600}
+        if not pressure:
+            return
+
+        # Under pressure: tagged images no container uses, except templates and snapshots
+        protected = {_image_reference(image) for image in self.template_images()}
+        used = set(self.docker_client.list_used_image_ids(host))
+        for image in sorted(self.docker_client.list_images(host), key=lambda image: image.get("Created", 0)):
+            tags = [tag for tag in image.get("RepoTags") or [] if tag != "<none>:<none>"]
+            labels = image.get("Labels") or {}
+            if (not tags or image["Id"] in used or protected.intersection(tags)
+                    or "fluxlabs.snapshot.id" in labels or now - image.get("Created", now) < floor):
+                continue
+            yield {"kind": "images", "id": tags[0] if len(tags) == 1 else image["Id"], "host": host,
+                   "bytes": image.get("Size") or 0, "forced": True}
+
+    def _volume_candidates(self, host: str, pressure: bool, now: float) -> Iterator[Dict[str, Any]]:
+        limit = GC_PRESSURE_MIN_AGE_MINUTES * 60 if pressure else GC_VOLUME_MIN_AGE_HOURS * 3600
+        dangling = {volume["Name"]: volume for volume in self.docker_client.list_volumes(host, dangling=True)}
+        existing = None
+        names = []
+        for name, volume in sorted(dangling.items()):
+            labels = volume.get("Labels") or {}
+            if "fluxlabs.workspace.base" in labels:
+                # Lower layer of overlay workspaces and source of copied ones
+                continue
+            if "fluxlabs.workspace.lab" in labels:
+                main = re.sub(r"-(upper|work)$", "", name)
+                if main != name and main not in dangling:
+                    # Overlay upper and work dirs are referenced only through the lab's own volume
+                    if existing is None:
+                        existing = {volume["Name"] for volume in self.docker_client.list_volumes(host)}
+                    if main in existing:
+                        continue
+            elif not ("com.docker.volume.anonymous" in labels or _ANONYMOUS_VOLUME.match(name)):
+                # Named volumes FluxLabs did not create are never touched
+                continue
+            created = _epoch(volume.get("CreatedAt"))
+            if created is not None and now - created >= limit:
+                names.append(name)
+        if not names:
+            return
+        try:
+            sizes = self.docker_client.volume_sizes(host)
+        except Exception as e:
+            logger.warning(f"Failed to read volume sizes on {host}: {e}")
+            sizes = {}
+        for name in names:
+            yield {"kind": "volumes", "id": name, "host": host, "bytes": max(0, sizes.get(name, 0)),
+                   "forced": pressure and now - (_epoch(dangling[name].get("CreatedAt")) or now) < GC_VOLUME_MIN_AGE_HOURS * 3600}
+
+    def _lab_row_live(self, container_id: str, labels: Dict[str, str]) -> bool:
+        """Whether lab-manager still has a live lab in this container; an unanswered check counts as live"""
+        lab_id = labels.get("fluxlabs.lab_id")
+        if not lab_id:
+            # Created directly through container-manager, so labels alone decide
+            return False
+        if not self.lab_manager_url:
+            return True
+        try:
+            response = requests.get(f"{self.lab_manager_url}/labs/{lab_id}", timeout=LAB_MANAGER_TIMEOUT_SECONDS)
+        except requests.RequestException as e:
+            logger.warning(f"GC could not check lab {lab_id} of {container_id} with lab-manager: {e}")
+            return True
+        if response.status_code == 404:
+            return False
+        if response.status_code != 200:
+            logger.warning(f"GC could not check lab {lab_id} of {container_id}: lab-manager returned {response.status_code}")
+            return True
+        lab = response.json()
+        # A row pointing at another container leaves this one orphaned
+        return lab.get("container_id") == container_id and lab.get("status") != "expired"
+
+    def _remove(self, candidate: Dict[str, Any]) -> Optional[bool]:
+        """Whether the candidate was removed, or None if it no longer qualifies"""
+        # Spaced out so removals never queue up in front of lab operations
+        wait = self._last_removal + GC_REMOVAL_INTERVAL_SECONDS - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        self._last_removal = time.monotonic()
+        if self.dry_run:
+            logger.info(f"GC dry run: would remove {candidate['kind']} {candidate['id']} on {candidate['host']}")
+            return True
+        if candidate["kind"] == "containers":
+            try:
+                # The lab may have been started or suspended since it was listed
+                state = self.docker_client.inspect_container(candidate["id"]).get("State", {})
+                if state.get("Status") not in ("exited", "dead") or self.protected_lab(candidate["id"]):
+                    return None
+                self.remove_lab(candidate["id"])
+                return True
+            except Exception as e:
+                logger.warning(f"GC failed to remove lab {candidate['id']}: {e}")
+                return False
+        if candidate["kind"] == "images":
+            return self.docker_client.remove_image(candidate["id"], candidate["host"])
+        return self.docker_client.remove_volume(candidate["id"], candidate["host"])
+
+    def collect(self) -> Optional[Dict[str, Any]]:
+        """Run one GC pass over every host; None if a pass is already running"""
+        if not self._pass_lock.acquire(blocking=False):
+            return None
+        try:
+            now = time.time()
+            budget = GC_MAX_REMOVALS_PER_PASS
+            result = {
+                "started_at": now,
+                "dry_run": self.dry_run,
+                "removed": {kind: 0 for kind in KINDS},
+                "reclaimed_bytes": {kind: 0 for kind in KINDS},
+                "failed": 0,
+                "pressure": {}
+            }
+            for host in self.docker_client.host_names():
+                if budget <= 0:
+                    break
+                try:
+                    pressure = self._under_pressure(host)
+                    result["pressure"][host] = pressure
+                    for kind_candidates in (self._container_candidates, self._image_candidates, self._volume_candidates):
+                        for candidate in kind_candidates(host, pressure, now):
+                            if budget <= 0:
+                                break
+                            # Objects only eligible because of disk pressure wait once it is relieved
+                            if candidate["forced"] and not self._under_pressure(host):
+                                continue
+                            budget -= 1
+                            removed = self._remove(candidate)
+                            if removed is None:
+                                continue
+                            if not removed:
+                                result["failed"] += 1
+                                continue
+                            kind = candidate["kind"]
+                            result["removed"][kind] += 1
+                            result["reclaimed_bytes"][kind] += candidate["bytes"]
+                            if not self.dry_run:
+                                self.totals[kind]["removed"] += 1
+                                self.totals[kind]["bytes"] += candidate["bytes"]
+                                BACKGROUND_EVENTS.labels("container-manager", f"gc_{kind}_removed").inc()
+                except Exception as e:
+                    logger.error(f"Garbage collection on {host} failed: {e}")
+
+            result["duration_seconds"] = round(time.time() - now, 3)
+            self.last_pass = result
+            if any(result["removed"].values()):
+                logger.info(f"GC pass removed {result['removed']}, reclaimed {sum(result['reclaimed_bytes'].values())} bytes"
+                            f"{' (dry run)' if self.dry_run else ''}")
+            return result
+        finally:
+            self._pass_lock.release()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "enabled": bool(self.interval_seconds),
+            "dry_run": self.dry_run,
+            "pressure": dict(self.pressure),
+            "disk_usage": {host: self.disk_usage(host) for host in self.docker_client.host_names()},
+            "totals": self.totals,
+            "reclaimed_bytes": self.reclaimed_bytes,
+            "last_pass": self.last_pass
+        }
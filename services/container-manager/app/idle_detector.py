@@ -0,0 +1,279 @@
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.triggers.interval import IntervalTrigger
+from typing import Optional, List, Dict, Any
+from container_stats import sample_lab_stats
+from metrics import BACKGROUND_EVENTS, LAB_RESUME_DURATION
+from collections import deque
+import threading
+import json
+import logging
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+# What to do with an idle lab: "pause" frees CPU, "stop" frees CPU and memory, "none" only reports
+IDLE_ACTION = os.getenv("IDLE_ACTION", "pause")
+IDLE_WINDOW_SECONDS = int(os.getenv("IDLE_WINDOW_SECONDS", "1800"))
+IDLE_CHECK_INTERVAL_SECONDS = int(os.getenv("IDLE_CHECK_INTERVAL_SECONDS", "60"))
+# Activity thresholds per check interval
+IDLE_CPU_THRESHOLD_PERCENT = float(os.getenv("IDLE_CPU_THRESHOLD_PERCENT", "2.0"))
+IDLE_NETWORK_THRESHOLD_BYTES = int(os.getenv("IDLE_NETWORK_THRESHOLD_BYTES", str(64 * 1024)))
+IDLE_STATS_CONCURRENCY = int(os.getenv("IDLE_STATS_CONCURRENCY", "8"))
+
+# Labs the detector suspended, kept across restarts: a lab it stopped looks like any other exited lab
+IDLE_STATE_FILE = os.getenv("IDLE_STATE_FILE", "/var/lib/fluxlabs/state/idle_suspended.json")
+
+# Resume latencies kept for percentile reporting
+RESUME_LATENCY_SAMPLES = 256
+
+
+class IdleDetector:
+    """Suspends labs with no CPU, network, exec or API activity and resumes them on next access"""
+
+    def __init__(self, docker_client, placement, exec_sessions,
+                 action: str = IDLE_ACTION,
+                 idle_window_seconds: int = IDLE_WINDOW_SECONDS,
+                 check_interval_seconds: int = IDLE_CHECK_INTERVAL_SECONDS,
+                 cgroups=None, state_file: str = IDLE_STATE_FILE):
+        self.docker_client = docker_client
+        # Optional CgroupStatsCollector read before falling back to Docker stats
+        self.cgroups = cgroups
+        self.placement = placement
+        self.exec_sessions = exec_sessions
+        self.action = action
+        self.idle_window_seconds = idle_window_seconds
+        self.check_interval_seconds = check_interval_seconds
+        self.state_file = state_file
+        self.scheduler = BackgroundScheduler()
+
+        # container ID -> monotonic time of last observed activity
+        self.last_active: Dict[str, float] = {}
+        # container ID -> last network byte counter
+        self.last_network: Dict[str, int] = {}
+        # container ID -> {"action": ..., "at": ...} for labs we suspended
+        self.suspended: Dict[str, Dict[str, Any]] = {}
+        self.suspend_total = 0
+        self.resume_total = 0
+        self.resume_latencies = deque(maxlen=RESUME_LATENCY_SAMPLES)
+        # container ID -> event set when an in-flight resume finishes
+        self._resuming: Dict[str, threading.Event] = {}
+        # container ID -> event set when an in-flight suspend finishes
+        self._suspending: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+
+    def _load_state(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.state_file) as state_file:
+                return json.load(state_file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Failed to read idle state from {self.state_file}: {e}")
+            return {}
+
+    def _save_state(self):
+        """Write the suspended labs; called with self._lock held"""
+        temporary = f"{self.state_file}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.state_file), exist_ok=True)
+            with open(temporary, "w") as state_file:
+                json.dump(self.suspended, state_file)
+            os.replace(temporary, self.state_file)
+        except OSError as e:
+            logger.warning(f"Failed to write idle state to {self.state_file}: {e}")
+
+    def start(self):
+        """Restore the labs suspended by a previous run and start the idle check job"""
+        saved = self._load_state()
+        try:
+            paused = set(self.docker_client.list_lab_ids_by_status("paused"))
+            stopped = set(self.docker_client.list_lab_ids_by_status("exited"))
+        except Exception as e:
+            # Keep every saved entry rather than lose track of a lab we stopped
+            logger.warning(f"Failed to list suspended labs: {e}")
+            paused, stopped = set(), set(saved)
+        with self._lock:
+            self.suspended.update({cid: info for cid, info in saved.items() if cid in paused or cid in stopped})
+            # Nothing else pauses labs, so paused labs left by a previous run are ours to resume
+            for container_id in paused:
+                self.suspended.setdefault(container_id, {"action": "pause", "at": None})
+            self._save_state()
+
+        if self.action not in ("pause", "stop", "none"):
+            logger.warning(f"Unknown IDLE_ACTION {self.action!r}, idle detection disabled")
+            return
+
+        self.scheduler.add_job(
+            func=self.check_idle_labs,
+            trigger=IntervalTrigger(seconds=self.check_interval_seconds),
+            id='check_idle_labs',
+            name='Check for idle labs',
+            max_instances=1,
+            coalesce=True
+        )
+        self.scheduler.start()
+        logger.info(f"Idle detector started (action={self.action}, window={self.idle_window_seconds}s)")
+
+    def stop(self):
+        """Stop the idle check job"""
+        if self.scheduler.running:
+            self.scheduler.shutdown(wait=False)
+
+    def touch(self, container_id: str):
+        """Record user activity (API access) on a lab"""
+        self.last_active[container_id] = time.monotonic()
+
+    def _is_active(self, container_id: str, sample: Dict[str, Any]) -> bool:
+        network = sample["network_rx_bytes"] + sample["network_tx_bytes"]
+        previous = self.last_network.get(container_id)
+        self.last_network[container_id] = network
+        if self.exec_sessions.list_sessions(container_id):
+            return True
+        if sample["cpu_percent"] >= IDLE_CPU_THRESHOLD_PERCENT:
+            return True
+        return previous is not None and network - previous >= IDLE_NETWORK_THRESHOLD_BYTES
+
+    def check_idle_labs(self):
+        """Sample every running lab once and suspend those idle for longer than the window"""
+        try:
+            running = self.docker_client.list_lab_ids_by_status("running")
+        except Exception as e:
+            logger.error(f"Idle check failed to list labs: {e}")
+            return
+
+        now = time.monotonic()
+        running_set = set(running)
+        for stale in [cid for cid in self.last_active if cid not in running_set and cid not in self.suspended]:
+            self.last_active.pop(stale, None)
+            self.last_network.pop(stale, None)
+
+        samples = sample_lab_stats(self.docker_client, running, IDLE_STATS_CONCURRENCY, self.cgroups)
+
+        idle = []
+        for container_id, sample in samples.items():
+            if self._is_active(container_id, sample) or container_id not in self.last_active:
+                self.last_active[container_id] = now
+            elif now - self.last_active[container_id] >= self.idle_window_seconds:
+                idle.append(container_id)
+
+        for container_id in idle:
+            self.suspend(container_id)
+
+    def suspend(self, container_id: str) -> bool:
+        """Pause or stop an idle lab"""
+        if self.action not in ("pause", "stop"):
+            logger.debug(f"Lab {container_id} is idle (action disabled)")
+            return False
+        with self._lock:
+            if container_id in self.suspended or container_id in self._suspending or container_id in self._resuming:
+                return False
+            # Activity may have been recorded since the check sampled this lab
+            last_active = self.last_active.get(container_id)
+            if last_active is None or time.monotonic() - last_active < self.idle_window_seconds:
+                return False
+            if self.exec_sessions.list_sessions(container_id):
+                return False
+            done = self._suspending[container_id] = threading.Event()
+
+        # Docker calls run outside the lock so resumes of other labs are not held up
+        success = False
+        try:
+            if self.action == "pause":
+                success = self.docker_client.pause_container(container_id)
+            else:
+                success = self.docker_client.stop_container(container_id)
+                if success:
+                    self.placement.release(container_id)
+        finally:
+            with self._lock:
+                if success:
+                    self.suspended[container_id] = {"action": self.action, "at": time.time()}
+                    self._save_state()
+                    self.suspend_total += 1
+                self._suspending.pop(container_id, None)
+            done.set()
+
+        if success:
+            BACKGROUND_EVENTS.labels("container-manager", f"idle_{self.action}").inc()
+            logger.info(f"Suspended idle lab {container_id} ({self.action})")
+        return success
+
+    def ensure_running(self, container_id: str) -> Optional[float]:
+        """Resume a lab we suspended; returns resume latency in seconds, or None if it was not suspended"""
+        self.touch(container_id)
+        suspending = self._suspending.get(container_id)
+        if suspending is not None:
+            # Let an in-flight suspend finish, then undo it
+            suspending.wait(timeout=60)
+        if container_id not in self.suspended and container_id not in self._resuming:
+            return None
+
+        suspended = None
+        with self._lock:
+            waiter = self._resuming.get(container_id)
+            if waiter is None:
+                # Stays recorded until the resume succeeds, so a failed one can be retried
+                suspended = self.suspended.get(container_id)
+                if suspended is None:
+                    return None
+                waiter = self._resuming[container_id] = threading.Event()
+        if suspended is None:
+            # Another request is already resuming this lab
+            waiter.wait(timeout=60)
+            return None
+
+        started = time.perf_counter()
+        success = False
+        try:
+            if suspended["action"] == "pause":
+                success = self.docker_client.unpause_container(container_id)
+            else:
+                resources = self.docker_client.get_container_resources(container_id)
+                self.placement.reserve_existing(container_id, resources["cpus"], resources["memory_mb"])
+                success = self.docker_client.start_container(container_id)
+                if not success:
+                    self.placement.release(container_id)
+        finally:
+            with self._lock:
+                if success:
+                    self.suspended.pop(container_id, None)
+                    self._save_state()
+                self._resuming.pop(container_id, None)
+            waiter.set()
+        latency = time.perf_counter() - started
+
+        if not success:
+            logger.warning(f"Failed to resume lab {container_id}")
+            return None
+        self.resume_total += 1
+        self.resume_latencies.append(latency)
+        BACKGROUND_EVENTS.labels("container-manager", "idle_resume").inc()
+        LAB_RESUME_DURATION.labels(suspended["action"]).observe(latency)
+        logger.info(f"Resumed lab {container_id} in {latency * 1000:.0f} ms")
+        return latency
+
+    def forget(self, container_id: str):
+        """Drop all state for a removed or explicitly stopped lab"""
+        with self._lock:
+            if self.suspended.pop(container_id, None) is not None:
+                self._save_state()
+        self.last_active.pop(container_id, None)
+        self.last_network.pop(container_id, None)
+
+    def status(self) -> Dict[str, Any]:
+        latencies = sorted(self.resume_latencies)
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 1)
+
+        return {
+            "action": self.action,
+            "idle_window_seconds": self.idle_window_seconds,
+            "suspended": [{"container_id": cid, **info} for cid, info in self.suspended.items()],
+            "suspend_total": self.suspend_total,
+            "resume_total": self.resume_total,
+            "resume_latency_ms": {"p50": percentile(0.5), "p95": percentile(0.95), "max": percentile(1.0)}
+        }
@@ -0,0 +1,479 @@
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.triggers.interval import IntervalTrigger
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Optional, List, Dict, Any, Tuple
+from metrics import BACKGROUND_EVENTS
+import threading
+import calendar
+import logging
+import struct
+import shutil
+import mmap
+import json
+import time
+import zlib
+import os
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+LOG_ARCHIVE_DIR = os.getenv("LOG_ARCHIVE_DIR", "/var/lib/fluxlabs/logs")
+# How often running labs' new log lines are appended to their archives; 0 archives only on deletion
+LOG_ARCHIVE_INTERVAL_SECONDS = int(os.getenv("LOG_ARCHIVE_INTERVAL_SECONDS", "60"))
+LOG_ARCHIVE_CONCURRENCY = int(os.getenv("LOG_ARCHIVE_CONCURRENCY", "4"))
+# Uncompressed bytes per frame: the unit of decompression and of the time index
+LOG_FRAME_BYTES = int(os.getenv("LOG_FRAME_BYTES", str(256 * 1024)))
+# Compressed bytes per chunk file before rotating to a new one
+LOG_CHUNK_BYTES = int(os.getenv("LOG_CHUNK_BYTES", str(16 * 1024 * 1024)))
+# Per-lab cap; the oldest chunks are dropped beyond it
+LOG_ARCHIVE_MAX_BYTES = int(os.getenv("LOG_ARCHIVE_MAX_BYTES", str(128 * 1024 * 1024)))
+# Archives of deleted labs are kept this long
+LOG_ARCHIVE_RETENTION_DAYS = float(os.getenv("LOG_ARCHIVE_RETENTION_DAYS", "7"))
+LOG_READ_MAX_LINES = int(os.getenv("LOG_READ_MAX_LINES", "10000"))
+
+# Index record per frame: first and last line timestamp, chunk number, byte offset and length in the chunk,
+# and how many archived lines (up to this frame, across frames) carry the last timestamp
+INDEX_RECORD = struct.Struct("<ddIQII")
+# Records of index.bin, written before the line count was kept; upgraded on first use
+LEGACY_INDEX_RECORD = struct.Struct("<ddIQI")
+CODECS = {"zstd": "zst", "zlib": "z"}
+
+
+class LogArchiveNotFound(Exception):
+    """Raised when a container has no log archive"""
+
+
+def _parse_timestamp(line: bytes, cache: Dict[bytes, float]) -> Optional[float]:
+    """Epoch seconds of a Docker timestamp prefix (2024-01-02T03:04:05.123456789Z ...)"""
+    if len(line) < 20 or line[4:5] != b"-" or line[10:11] != b"T":
+        return None
+    seconds = line[:19]
+    # Lines in the same second share the expensive part
+    base = cache.get(seconds)
+    if base is None:
+        try:
+            base = calendar.timegm(time.strptime(seconds.decode(), "%Y-%m-%dT%H:%M:%S"))
+        except ValueError:
+            return None
+        cache.clear()
+        cache[seconds] = base
+    end = line.find(b"Z", 19, 31)
+    fraction = line[19:end] if line[19:20] == b"." and end > 20 else b""
+    return base + (float(fraction[:7]) if fraction else 0.0)
+
+
+class LogArchive:
+    """One lab's archived logs: compressed frames in rotating chunk files plus a fixed-size time index.
+
+    Every frame is compressed on its own, so a time-range read binary-searches the
+    mmapped index and decompresses only the frames that overlap the range, read
+    with pread at their recorded offsets.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.index_path = os.path.join(path, "frames.idx")
+        self.legacy_index_path = os.path.join(path, "index.bin")
+        self.meta_path = os.path.join(path, "meta.json")
+        self.lock = threading.Lock()
+
+    def exists(self) -> bool:
+        return os.path.exists(self.meta_path)
+
+    def read_meta(self) -> Dict[str, Any]:
+        try:
+            with open(self.meta_path) as meta_file:
+                return json.load(meta_file)
+        except FileNotFoundError:
+            return {}
+
+    def write_meta(self, meta: Dict[str, Any]):
+        tmp_path = f"{self.meta_path}.tmp"
+        with open(tmp_path, "w") as meta_file:
+            json.dump(meta, meta_file)
+        os.replace(tmp_path, self.meta_path)
+
+    def _chunk_path(self, chunk: int, codec: str) -> str:
+        return os.path.join(self.path, f"chunk-{chunk:06d}.log.{CODECS[codec]}")
+
+    def records(self) -> List[Tuple[float, float, int, int, int, int]]:
+        """All index records, oldest first"""
+        with open(self.index_path, "rb") as index_file:
+            data = index_file.read()
+        count = len(data) // INDEX_RECORD.size
+        return [INDEX_RECORD.unpack_from(data, i * INDEX_RECORD.size) for i in range(count)]
+
+    def last_record(self) -> Optional[Tuple[float, float, int, int, int, int]]:
+        try:
+            with open(self.index_path, "rb") as index_file:
+                size = os.fstat(index_file.fileno()).st_size
+                if size < INDEX_RECORD.size:
+                    return None
+                return INDEX_RECORD.unpack(os.pread(index_file.fileno(), INDEX_RECORD.size,
+                                                    size - size % INDEX_RECORD.size - INDEX_RECORD.size))
+        except FileNotFoundError:
+            return None
+
+    def progress(self) -> Tuple[float, int, int]:
+        """Timestamp of the last archived line, how many archived lines carry it, and the last chunk number.
+
+        Read from the last index record, which is only written once its frame is, so it
+        stays right whatever state meta.json was left in.
+        """
+        record = self.last_record()
+        if record is None:
+            return 0.0, 0, 0
+        return record[1], record[5], record[2]
+
+    def upgrade_index(self, codec: str):
+        """Rewrite a legacy index.bin with line counts, counted once from the frames at its end"""
+        if not os.path.exists(self.legacy_index_path) or os.path.exists(self.index_path):
+            return
+        with open(self.legacy_index_path, "rb") as index_file:
+            data = index_file.read()
+        records = [LEGACY_INDEX_RECORD.unpack_from(data, i * LEGACY_INDEX_RECORD.size)
+                   for i in range(len(data) // LEGACY_INDEX_RECORD.size)]
+        count = 0
+        if records:
+            last_ts = records[-1][1]
+            handles: Dict[int, int] = {}
+            cache: Dict[bytes, float] = {}
+            try:
+                # Lines sharing the last timestamp may span several frames
+                for record in reversed(records):
+                    timestamps = [_parse_timestamp(line, cache) for line in self._frame_lines(codec, handles, record)]
+                    timestamps = [timestamp for timestamp in timestamps if timestamp is not None]
+                    count += timestamps.count(last_ts)
+                    if any(timestamp != last_ts for timestamp in timestamps):
+                        break
+            finally:
+                for handle in handles.values():
+                    os.close(handle)
+        # Only the last record's count is ever read
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "wb") as index_file:
+            for position, record in enumerate(records):
+                index_file.write(INDEX_RECORD.pack(*record, count if position == len(records) - 1 else 0))
+        os.replace(tmp_path, self.index_path)
+        os.remove(self.legacy_index_path)
+
+    def append_frame(self, meta: Dict[str, Any], data: bytes, first_ts: float, last_ts: float, at_last: int):
+        """Compress and append one frame, rotating and trimming chunk files as needed.
+
+        at_last is how many of the frame's lines carry last_ts.
+        """
+        codec = meta["codec"]
+        previous = self.last_record()
+        if previous is not None and first_ts == last_ts == previous[1]:
+            # The whole frame continues a run of lines sharing the previous frame's last timestamp
+            at_last += previous[5]
+        frame = zstandard.ZstdCompressor(level=3).compress(data) if codec == "zstd" else zlib.compress(data, 6)
+        chunk = meta["chunk"]
+        chunk_path = self._chunk_path(chunk, codec)
+        if os.path.exists(chunk_path) and os.path.getsize(chunk_path) + len(frame) > LOG_CHUNK_BYTES:
+            chunk = meta["chunk"] = chunk + 1
+            chunk_path = self._chunk_path(chunk, codec)
+            self._trim(meta)
+        with open(chunk_path, "ab") as chunk_file:
+            offset = chunk_file.tell()
+            chunk_file.write(frame)
+        # The index entry goes last, so readers never see a frame that is not fully written
+        with open(self.index_path, "ab") as index_file:
+            index_file.write(INDEX_RECORD.pack(first_ts, last_ts, chunk, offset, len(frame), at_last))
+        meta["last_ts"] = last_ts
+        meta["bytes"] = meta.get("bytes", 0) + len(frame)
+
+    def _trim(self, meta: Dict[str, Any]):
+        """Drop the oldest chunk files while the archive is over LOG_ARCHIVE_MAX_BYTES"""
+        records = self.records()
+        sizes: Dict[int, int] = {}
+        for record in records:
+            sizes[record[2]] = sizes.get(record[2], 0) + record[4]
+        total = sum(sizes.values())
+        dropped = set()
+        for chunk in sorted(sizes):
+            if total <= LOG_ARCHIVE_MAX_BYTES or chunk >= meta["chunk"] - 1:
+                break
+            total -= sizes[chunk]
+            dropped.add(chunk)
+        if not dropped:
+            return
+        # Rewrite the index without the dropped chunks, then delete them
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "wb") as index_file:
+            for record in records:
+                if record[2] not in dropped:
+                    index_file.write(INDEX_RECORD.pack(*record))
+        os.replace(tmp_path, self.index_path)
+        for chunk in dropped:
+            os.remove(self._chunk_path(chunk, meta["codec"]))
+        meta["bytes"] = total
+
+    def _first_frame(self, index: mmap.mmap, count: int, since: float) -> int:
+        """Index of the first frame whose last line is at or after `since`"""
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            if INDEX_RECORD.unpack_from(index, middle * INDEX_RECORD.size)[1] < since:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _frame_lines(self, codec: str, handles: Dict[int, int], record) -> List[bytes]:
+        chunk, offset, length = record[2:5]
+        if chunk not in handles:
+            handles[chunk] = os.open(self._chunk_path(chunk, codec), os.O_RDONLY)
+        frame = os.pread(handles[chunk], length, offset)
+        data = zstandard.ZstdDecompressor().decompress(frame) if codec == "zstd" else zlib.decompress(frame)
+        return data.splitlines(keepends=True)
+
+    def read(self, since: Optional[float] = None, until: Optional[float] = None,
+             tail: Optional[int] = None, limit: int = LOG_READ_MAX_LINES) -> Tuple[List[bytes], bool]:
+        """Lines with since <= timestamp < until (the last `tail` of them if given); returns lines and truncation"""
+        codec = self.read_meta().get("codec", "zlib")
+        if not os.path.exists(self.index_path) or os.path.getsize(self.index_path) < INDEX_RECORD.size:
+            return [], False
+        handles: Dict[int, int] = {}
+        cache: Dict[bytes, float] = {}
+        with open(self.index_path, "rb") as index_file, \
+                mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ) as index:
+            count = len(index) // INDEX_RECORD.size
+            start = self._first_frame(index, count, since) if since is not None else 0
+
+            def in_range(line):
+                timestamp = _parse_timestamp(line, cache)
+                return timestamp is None or ((since is None or timestamp >= since) and
+                                             (until is None or timestamp < until))
+
+            try:
+                if tail:
+                    # Walk frames backwards from the end of the range until enough lines are collected
+                    end = count
+                    if until is not None:
+                        while end > start and INDEX_RECORD.unpack_from(index, (end - 1) * INDEX_RECORD.size)[0] >= until:
+                            end -= 1
+                    collected: List[bytes] = []
+                    for position in range(end - 1, start - 1, -1):
+                        record = INDEX_RECORD.unpack_from(index, position * INDEX_RECORD.size)
+                        lines = [line for line in self._frame_lines(codec, handles, record) if in_range(line)]
+                        collected = lines + collected
+                        if len(collected) >= tail:
+                            break
+                    return collected[-tail:], False
+
+                lines: List[bytes] = []
+                for position in range(start, count):
+                    record = INDEX_RECORD.unpack_from(index, position * INDEX_RECORD.size)
+                    if until is not None and record[0] >= until:
+                        break
+                    for line in self._frame_lines(codec, handles, record):
+                        if in_range(line):
+                            lines.append(line)
+                            if len(lines) >= limit:
+                                return lines, True
+                return lines, False
+            finally:
+                for handle in handles.values():
+                    os.close(handle)
+
+
+class LogArchiver:
+    """Copies lab container logs into per-lab LogArchives so they outlive the container.
+
+    Running labs are archived incrementally (only lines from the last archived
+    timestamp on are fetched from Docker) every LOG_ARCHIVE_INTERVAL_SECONDS and once
+    more right before deletion. Archives of deleted labs are removed after
+    LOG_ARCHIVE_RETENTION_DAYS.
+    """
+
+    def __init__(self, docker_client, archive_dir: str = LOG_ARCHIVE_DIR,
+                 interval_seconds: int = LOG_ARCHIVE_INTERVAL_SECONDS):
+        self.docker_client = docker_client
+        self.archive_dir = archive_dir
+        self.interval_seconds = interval_seconds
+        self.codec = "zstd" if zstandard else "zlib"
+        self.scheduler = BackgroundScheduler()
+        self._archives: Dict[str, LogArchive] = {}
+        self._lock = threading.Lock()
+
+    def start(self):
+        if not self.interval_seconds:
+            return
+        self.scheduler.add_job(
+            func=self.sweep,
+            trigger=IntervalTrigger(seconds=self.interval_seconds),
+            id='archive_lab_logs',
+            name='Archive lab logs',
+            max_instances=1,
+            coalesce=True
+        )
+        self.scheduler.start()
+        logger.info(f"Log archiver started (every {self.interval_seconds}s, {self.codec}) in {self.archive_dir}")
+
+    def stop(self):
+        if self.scheduler.running:
+            self.scheduler.shutdown(wait=False)
+
+    def _archive_for(self, container_id: str) -> LogArchive:
+        with self._lock:
+            if container_id not in self._archives:
+                self._archives[container_id] = LogArchive(os.path.join(self.archive_dir, container_id))
+            return self._archives[container_id]
+
+    def find(self, container_id: str) -> LogArchive:
+        """Archive of a container by full ID or unique ID prefix"""
+        archive = self._archive_for(container_id)
+        if archive.exists():
+            return archive
+        try:
+            matches = [name for name in os.listdir(self.archive_dir) if name.startswith(container_id)]
+        except FileNotFoundError:
+            matches = []
+        if len(matches) != 1:
+            raise LogArchiveNotFound(f"No log archive for {container_id}")
+        return self._archive_for(matches[0])
+
+    def archive(self, container_id: str, labels: Optional[Dict[str, str]] = None, final: bool = False) -> int:
+        """Append a container's logs since the last archived line; returns the number of new lines"""
+        archive = self._archive_for(container_id)
+        with archive.lock:
+            meta = archive.read_meta()
+            if meta:
+                archive.upgrade_index(meta["codec"])
+            else:
+                if labels is None:
+                    labels = self.docker_client.inspect_container(container_id).get("Config", {}).get("Labels") or {}
+                os.makedirs(archive.path, exist_ok=True)
+                meta = {
+                    "container_id": container_id,
+                    "user_id": labels.get("fluxlabs.user_id", ""),
+                    "name": labels.get("fluxlabs.name", ""),
+                    "template_id": labels.get("fluxlabs.template", ""),
+                    "codec": self.codec,
+                    "chunk": 0,
+                    "last_ts": 0.0,
+                    "removed_at": None
+                }
+                # Meta goes first so the archive is found even if no frame makes it to disk
+                archive.write_meta(meta)
+
+            # Progress comes from the index, which a crash between a frame and meta.json cannot leave behind
+            last_ts, archived_at_last, last_chunk = archive.progress()
+            meta["last_ts"] = last_ts
+            meta["chunk"] = max(meta["chunk"], last_chunk)
+            cache: Dict[bytes, float] = {}
+            frame = {"buffer": bytearray(), "first_ts": None, "last_ts": None, "at_last": 0, "added": 0}
+            # Docker sends lines at last_ts again; the first archived_at_last of them are already stored
+            state = {"skip": archived_at_last, "kept": False}
+
+            def add(line: bytes):
+                timestamp = _parse_timestamp(line, cache)
+                timestamped = timestamp is not None
+                if not timestamped:
+                    if not state["kept"]:
+                        # Continuation of a line archived earlier
+                        return
+                    timestamp = frame["last_ts"] or last_ts
+                elif timestamp < last_ts or (timestamp == last_ts and state["skip"] > 0):
+                    if timestamp == last_ts:
+                        state["skip"] -= 1
+                    state["kept"] = False
+                    return
+                state["kept"] = True
+                if timestamped:
+                    # Only timestamped lines are counted, as they are the ones skipped above next time
+                    frame["at_last"] = frame["at_last"] + 1 if timestamp == frame["last_ts"] else 1
+                if frame["first_ts"] is None:
+                    frame["first_ts"] = timestamp
+                frame["last_ts"] = timestamp
+                frame["buffer"] += line + b"\n"
+                frame["added"] += 1
+                if len(frame["buffer"]) >= LOG_FRAME_BYTES:
+                    flush()
+
+            def flush():
+                if frame["buffer"]:
+                    archive.append_frame(meta, bytes(frame["buffer"]), frame["first_ts"], frame["last_ts"],
+                                         frame["at_last"])
+                    frame["buffer"] = bytearray()
+                    frame["first_ts"] = None
+                    frame["at_last"] = 0
+
+            pending = b""
+            # A little before last_ts, as a float `since` can round past lines in its own microsecond
+            since = last_ts - 0.001 if last_ts else None
+            for chunk in self.docker_client.stream_container_logs(container_id, since=since):
+                pending += chunk
+                lines = pending.split(b"\n")
+                pending = lines.pop()
+                for line in lines:
+                    add(line)
+            if pending:
+                add(pending)
+            flush()
+            added = frame["added"]
+
+            if final:
+                meta["removed_at"] = time.time()
+            archive.write_meta(meta)
+        if added:
+            BACKGROUND_EVENTS.labels("container-manager", "log_lines_archived").inc(added)
+        return added
+
+    def read(self, container_id: str, since: Optional[datetime] = None, until: Optional[datetime] = None,
+             tail: Optional[int] = None, limit: int = LOG_READ_MAX_LINES) -> Dict[str, Any]:
+        archive = self.find(container_id)
+        meta = archive.read_meta()
+        with archive.lock:
+            archive.upgrade_index(meta.get("codec", "zlib"))
+        lines, truncated = archive.read(
+            since.timestamp() if since else None,
+            until.timestamp() if until else None,
+            tail=tail, limit=limit
+        )
+        return {
+            "logs": b"".join(lines).decode("utf-8", errors="replace"),
+            "lines": len(lines),
+            "truncated": truncated,
+            "archived_until": datetime.fromtimestamp(meta.get("last_ts") or 0, tz=timezone.utc).isoformat(),
+            "removed_at": meta.get("removed_at")
+        }
+
+    def sweep(self):
+        """Archive new lines of every running lab and expire old archives of deleted labs"""
+        try:
+            running = self.docker_client.list_lab_ids_by_status("running")
+        except Exception as e:
+            logger.error(f"Log archive sweep failed to list labs: {e}")
+            return
+
+        def archive_one(container_id):
+            try:
+                self.archive(container_id)
+            except Exception as e:
+                logger.warning(f"Failed to archive logs of {container_id}: {e}")
+
+        with ThreadPoolExecutor(max_workers=LOG_ARCHIVE_CONCURRENCY) as pool:
+            list(pool.map(archive_one, running))
+        self.prune()
+
+    def prune(self):
+        cutoff = time.time() - LOG_ARCHIVE_RETENTION_DAYS * 86400
+        try:
+            names = os.listdir(self.archive_dir)
+        except FileNotFoundError:
+            return
+        for name in names:
+            archive = self._archive_for(name)
+            removed_at = archive.read_meta().get("removed_at")
+            if removed_at and removed_at < cutoff:
+                shutil.rmtree(archive.path, ignore_errors=True)
+                with self._lock:
+                    self._archives.pop(name, None)
+                BACKGROUND_EVENTS.labels("container-manager", "log_archive_expired").inc()
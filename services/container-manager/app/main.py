@@ -1,25 +1,88 @@
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, WebSocket, Header
+from fastapi.responses import StreamingResponse, Response
+from responses import OrjsonResponse
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
 from docker_client import DockerClient
+from exec_sessions import ExecSessionManager
+from admission import AdmissionRejected, ExceedsHostCapacity, resolve_resource_profile, RESOURCE_PROFILES
+from placement import PlacementScheduler
+from idle_detector import IdleDetector
+from cgroup_stats import CgroupStatsCollector, CGROUP_STATS_ENABLED
+from snapshots import SnapshotManager, SnapshotNotFound
+from workspaces import WorkspaceManager
+from bulk import BulkOperations, BULK_DEFAULT_PARALLELISM
+from template_catalog import TemplateCatalog
+from log_archive import LogArchiver, LogArchiveNotFound, LOG_READ_MAX_LINES
+from metrics_history import MetricsHistory, parse_duration
+from garbage_collector import GarbageCollector
+from pagination import encode_cursor, decode_cursor, paginate, InvalidCursor, PAGE_DEFAULT_LIMIT, PAGE_MAX_LIMIT
+from metrics import setup_metrics, register_gauge, startup_phase
+from log_config import setup_logging
+from tracing import setup_tracing, tracer
 import uvicorn
 import logging
-import sys
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
 
 # Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+setup_logging("container-manager")
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Container Manager - Docker Only", version="2.0.0")
+app = FastAPI(title="Container Manager - Docker Only", version="2.0.0", default_response_class=OrjsonResponse)
+setup_metrics(app, "container-manager")
+setup_tracing(app, "container-manager")
 docker_client = DockerClient()
+exec_sessions = ExecSessionManager(docker_client)
+placement = PlacementScheduler(docker_client)
+
+
+def _cgroup_stats() -> Optional[CgroupStatsCollector]:
+    """A collector per consumer, since CPU percent is measured against the collector's previous sweep"""
+    if not CGROUP_STATS_ENABLED:
+        return None
+    collector = CgroupStatsCollector(
+        pid_of=lambda container_id: docker_client.inspect_container(container_id)["State"]["Pid"]
+    )
+    if not collector.available():
+        logger.warning(f"CGROUP_STATS_ENABLED but {collector.cgroup_root} is not a cgroup v2 hierarchy; using Docker stats")
+        return None
+    return collector
+
+
+idle_detector = IdleDetector(docker_client, placement, exec_sessions, cgroups=_cgroup_stats())
+snapshots = SnapshotManager(docker_client)
+workspaces = WorkspaceManager(docker_client)
+log_archiver = LogArchiver(docker_client)
+metrics_history = MetricsHistory(docker_client, cgroups=_cgroup_stats())
+catalog = TemplateCatalog(serialize=lambda templates: {"data": [
+    {
+        "id": template["id"],
+        "name": template["name"],
+        "image": template["image"],
+        "description": template["description"],
+        "default_duration_hours": template["default_duration_hours"],
+        "resource_profile": template["resource_profile"],
+        "resources": RESOURCE_PROFILES[template["resource_profile"]]
+    }
+    for template in templates
+]})
+garbage_collector = GarbageCollector(
+    docker_client,
+    remove_lab=lambda container_id: _delete_lab(container_id),
+    # Labs the idle detector stopped come back on their next access
+    protected_lab=lambda container_id: container_id in idle_detector.suspended,
+    template_images=lambda: set(catalog.snapshot.by_image)
+)
+bulk = BulkOperations(docker_client, {
+    "stop": lambda container_id: _stop_lab(container_id),
+    "start": lambda container_id: _start_lab(container_id),
+    "delete": lambda container_id: _delete_lab(container_id)
+})
+register_gauge("container-manager", "exec_sessions_active", exec_sessions.active_count)
+register_gauge("container-manager", "idle_suspended_labs", lambda: len(idle_detector.suspended))
+register_gauge("container-manager", "metrics_history_labs", lambda: len(metrics_history.histories))
+register_gauge("container-manager", "gc_reclaimed_bytes", lambda: garbage_collector.reclaimed_bytes)
 
 logger.info("Container Manager (Docker-only) starting up...")
 
@@ -30,6 +93,32 @@ class LabCreateRequest(BaseModel):
     user_id: str
     duration_hours: Optional[int] = 24
     image: Optional[str] = None
+    resource_profile: Optional[str] = None
+    # Persistent labs are snapshotted before they are deleted
+    persistent: Optional[bool] = False
+    # Set by lab-manager; the garbage collector leaves the lab alone while that lab row is live
+    lab_id: Optional[int] = None
+
+class SnapshotRestoreRequest(BaseModel):
+    name: str
+    user_id: str
+    duration_hours: Optional[int] = 24
+    resource_profile: Optional[str] = None
+    persistent: Optional[bool] = False
+
+class BulkSelector(BaseModel):
+    user_id: Optional[str] = None
+    template_id: Optional[str] = None
+    created_before: Optional[datetime] = None
+    container_ids: Optional[List[str]] = None
+
+class BulkOperationRequest(BaseModel):
+    action: str  # stop, start or delete
+    selector: BulkSelector
+    parallelism: Optional[int] = BULK_DEFAULT_PARALLELISM
+
+LAB_SORT_FIELDS = ("created_at", "expires_at", "name")
+DOCKER_STATES = {"created", "restarting", "running", "removing", "paused", "exited", "dead"}
 
 class LabResponse(BaseModel):
     id: str
@@ -40,7 +129,9 @@ class LabResponse(BaseModel):
     status: str
     docker_status: str
     created_at: str
+    expires_at: Optional[str] = None
     image: str
+    host: Optional[str] = None
     ports: List[Dict[str, Any]] = []
     ssh_info: Optional[Dict[str, str]] = None
 
@@ -52,58 +143,90 @@ class TemplateResponse(BaseModel):
     name: str
     image: str
     description: str
-
-# Template configurations
-TEMPLATES = {
-    "ubuntu": {
-        "name": "Ubuntu 22.04",
-        "image": "ubuntu:22.04",
-        "description": "Basic Ubuntu environment with SSH"
-    },
-    "python": {
-        "name": "Python 3.11",
-        "image": "python:3.11",
-        "description": "Python development environment"
-    },
-    "node": {
-        "name": "Node.js 18",
-        "image": "node:18",
-        "description": "Node.js development environment"
-    },
-    "nginx": {
-        "name": "Nginx Web Server",
-        "image": "nginx:latest",
-        "description": "Nginx web server"
-    }
-}
+    resource_profile: str
 
 @app.get("/labs")
-def get_user_labs(user_id: str = Query(...)):
-    """Get all labs for a user using Docker labels"""
+def get_user_labs(user_id: str = Query(...), status: Optional[List[str]] = Query(None),
+                  template_id: Optional[str] = None,
+                  created_after: Optional[datetime] = None, created_before: Optional[datetime] = None,
+                  expires_after: Optional[datetime] = None, expires_before: Optional[datetime] = None,
+                  sort: str = "created_at", order: str = "desc",
+                  limit: int = Query(PAGE_DEFAULT_LIMIT, ge=1, le=PAGE_MAX_LIMIT), cursor: Optional[str] = None):
+    """One page of a user's labs; user, template and status filters are applied by Docker"""
+    if sort not in LAB_SORT_FIELDS or order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail=f"sort must be one of {', '.join(LAB_SORT_FIELDS)} and order asc or desc")
+    if status and not set(status) <= DOCKER_STATES:
+        raise HTTPException(status_code=400, detail=f"status must be among {', '.join(sorted(DOCKER_STATES))}")
+    try:
+        after = decode_cursor(cursor, sort, order) if cursor else None
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    labels = {"fluxlabs.user_id": user_id}
+    if template_id:
+        labels["fluxlabs.template"] = template_id
     try:
-        containers = docker_client.list_containers_by_label("fluxlabs.user_id", user_id)
+        containers, failed_hosts = docker_client.list_lab_inventory(labels, status)
+    except Exception as e:
+        logger.error(f"Error getting user labs: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    if failed_hosts and len(failed_hosts) == len(docker_client.hosts):
+        raise HTTPException(status_code=503, detail=f"No Docker host reachable: {', '.join(failed_hosts)}")
+
+    # Time ranges are checked against the ISO timestamp labels, ignoring time zones
+    ranges = [(created_after, created_before, "created_at"), (expires_after, expires_before, "expires_at")]
+    matching = []
+    for container in containers:
+        fields = _lab_sort_fields(container)
+        if all(_in_range(fields[field], lower, upper) for lower, upper, field in ranges):
+            matching.append((fields, container))
+
+    page, more = paginate(matching, key=lambda item: (item[0][sort], item[1]["Id"]), limit=limit,
+                          after=after, descending=order == "desc")
+    labs = [_summary_to_lab_response(container, fields) for fields, container in page]
+    next_cursor = encode_cursor(sort, order, (page[-1][0][sort], page[-1][1]["Id"])) if more else None
+    # Incomplete when a host could not be listed; its labs are missing from every page
+    return {"data": labs, "next_cursor": next_cursor, "complete": not failed_hosts}
+
+@app.get("/labs/inventory")
+def get_lab_inventory():
+    """Compact state of every lab container on all hosts, for reconciliation"""
+    try:
+        containers, failed_hosts = docker_client.list_lab_inventory()
         labs = []
-        
         for container in containers:
-            lab_data = _container_to_lab_response(container)
-            if lab_data:
-                labs.append(lab_data)
-        
-        return {"data": labs}
+            labels = container["Labels"]
+            labs.append({
+                "container_id": container["Id"],
+                "user_id": labels.get("fluxlabs.user_id", ""),
+                "name": labels.get("fluxlabs.name", ""),
+                "template_id": labels.get("fluxlabs.template", ""),
+                "status": container["State"],
+                "created_at": labels.get("fluxlabs.created_at", ""),
+                "duration_hours": labels.get("fluxlabs.duration_hours", ""),
+                "persistent": labels.get("fluxlabs.persistent") == "true",
+                "host": container["Host"]
+            })
+        # Incomplete when a host could not be listed; absence from the list then proves nothing
+        return {"data": labs, "complete": not failed_hosts, "failed_hosts": failed_hosts}
     except Exception as e:
-        logger.error(f"Error getting user labs: {e}")
+        logger.error(f"Error getting lab inventory: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/create-lab")
 def create_lab(lab_data: LabCreateRequest):
     """Create a new Docker container lab with user labels"""
     try:
-        # Get image from template or use provided image
+        # Get image from template or use provided image; a known image brings its template's settings
+        template = catalog.get(lab_data.template_id) or (lab_data.image and catalog.by_image(lab_data.image)) or {}
         image = lab_data.image
-        if not image and lab_data.template_id in TEMPLATES:
-            image = TEMPLATES[lab_data.template_id]["image"]
+        if not image and template:
+            image = template["image"]
         elif not image:
             image = "ubuntu:22.04"  # Default fallback
+
+        # Resource limits from the request, the template, or the default profile
+        resources = resolve_resource_profile(lab_data.resource_profile or template.get("resource_profile"))
         
         # Create labels for the container
         labels = {
@@ -112,22 +235,34 @@ def create_lab(lab_data: LabCreateRequest):
             "fluxlabs.template": lab_data.template_id,
             "fluxlabs.created_at": datetime.now().isoformat(),
             "fluxlabs.duration_hours": str(lab_data.duration_hours),
+            "fluxlabs.persistent": str(bool(lab_data.persistent)).lower(),
             "fluxlabs.created_by": "FluxLabs"
         }
-        
-        # Create container using Docker client
-        container_id = docker_client.create_container_with_labels(
-            image=image,
-            name=f"fluxlabs-{lab_data.name}-{lab_data.user_id}",
-            labels=labels
-        )
+        if lab_data.lab_id is not None:
+            labels["fluxlabs.lab_id"] = str(lab_data.lab_id)
+        container_name = f"fluxlabs-{lab_data.name}-{lab_data.user_id}"
+
+        # Pick a host and reserve capacity on it before touching Docker
+        with tracer.start_as_current_span("placement.admit"):
+            host = placement.admit(container_name, image, resources["cpus"], resources["memory_mb"])
+        try:
+            container_id = _create_lab_container(host, container_name, image, labels, resources,
+                                                 lab_data.template_id, image, template.get("workspace_setup"))
+        except Exception:
+            placement.release(container_name)
+            raise
+        placement.commit(host, container_name, container_id)
         
         # Get container details for response
         container = docker_client.get_container_by_id(container_id)
         lab_response = _container_to_lab_response(container)
         
         return {"data": lab_response}
-        
+
+    except ExceedsHostCapacity as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         logger.error(f"Error creating lab: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -136,6 +271,7 @@ def create_lab(lab_data: LabCreateRequest):
 def get_lab_details(container_id: str):
     """Get specific lab details by container ID"""
     try:
+        idle_detector.ensure_running(container_id)
         container = docker_client.get_container_by_id(container_id)
         if not container:
             raise HTTPException(status_code=404, detail="Lab not found")
@@ -148,28 +284,48 @@ def get_lab_details(container_id: str):
             raise HTTPException(status_code=404, detail="Lab not found")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/lab/{container_id}/overview")
+def get_lab_overview(container_id: str, tail: int = Query(100, ge=1, le=LOG_READ_MAX_LINES)):
+    """Lab details, log tail, stats and processes in one call; sections that fail or time out are listed in errors"""
+    try:
+        idle_detector.ensure_running(container_id)
+        overview = docker_client.get_lab_overview(container_id, tail)
+    except Exception as e:
+        logger.error(f"Error getting lab overview: {e}")
+        if "404" in str(e):
+            raise HTTPException(status_code=404, detail="Lab not found")
+        raise HTTPException(status_code=500, detail=str(e))
+    return {
+        "data": _container_to_lab_response(overview["details"]),
+        "logs": overview.get("logs"),
+        "stats": overview.get("stats"),
+        "processes": overview.get("processes"),
+        "errors": overview["errors"],
+        "partial": bool(overview["errors"])
+    }
+
 @app.delete("/delete-lab/{container_id}")
 def delete_lab(container_id: str):
     """Delete a lab (remove Docker container)"""
     try:
-        success = docker_client.remove_container(container_id)
-        if success:
-            return {"message": "Lab deleted successfully"}
-        else:
-            raise HTTPException(status_code=500, detail="Failed to delete lab")
+        _delete_lab(container_id)
+        return {"message": "Lab deleted successfully"}
     except Exception as e:
         logger.error(f"Error deleting lab: {e}")
+        if "404" in str(e):
+            raise HTTPException(status_code=404, detail="Lab not found")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/lab/{container_id}/start")
 def start_lab(container_id: str):
     """Start a lab container"""
     try:
-        success = docker_client.start_container(container_id)
-        if success:
-            return {"message": "Lab started successfully"}
-        else:
-            raise HTTPException(status_code=500, detail="Failed to start lab")
+        _start_lab(container_id)
+        return {"message": "Lab started successfully"}
+    except ExceedsHostCapacity as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         logger.error(f"Error starting lab: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -178,34 +334,77 @@ def start_lab(container_id: str):
 def stop_lab(container_id: str):
     """Stop a lab container"""
     try:
-        success = docker_client.stop_container(container_id)
-        if success:
-            return {"message": "Lab stopped successfully"}
-        else:
-            raise HTTPException(status_code=500, detail="Failed to stop lab")
+        _stop_lab(container_id)
+        return {"message": "Lab stopped successfully"}
     except Exception as e:
         logger.error(f"Error stopping lab: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/labs/bulk")
+def bulk_lab_operation(bulk_data: BulkOperationRequest):
+    """Stop, start or delete every lab matching a selector; streams one NDJSON result per lab"""
+    if bulk_data.action not in ("stop", "start", "delete"):
+        raise HTTPException(status_code=400, detail=f"Unknown action '{bulk_data.action}'")
+    selector = bulk_data.selector
+    if not (selector.user_id or selector.template_id or selector.created_before or selector.container_ids):
+        raise HTTPException(status_code=400, detail="Selector must have at least one criterion")
+    try:
+        containers = bulk.select(selector.user_id, selector.template_id, selector.created_before,
+                                 selector.container_ids)
+    except Exception as e:
+        logger.error(f"Error selecting labs: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    return StreamingResponse(bulk.run(bulk_data.action, containers, bulk_data.parallelism),
+                             media_type="application/x-ndjson")
+
 @app.post("/lab/{container_id}/restart")
 def restart_lab(container_id: str):
     """Restart a lab container"""
     try:
+        # A stopped lab comes back up, so it is re-admitted like a start; running ones already hold capacity
+        if idle_detector.ensure_running(container_id) is None:
+            resources = docker_client.get_container_resources(container_id)
+            placement.reserve_existing(container_id, resources["cpus"], resources["memory_mb"])
         success = docker_client.restart_container(container_id)
         if success:
             return {"message": "Lab restarted successfully"}
         else:
             raise HTTPException(status_code=500, detail="Failed to restart lab")
+    except ExceedsHostCapacity as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         logger.error(f"Error restarting lab: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/lab/{container_id}/logs")
-def get_lab_logs(container_id: str):
-    """Get container logs"""
+def get_lab_logs(container_id: str, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                 tail: Optional[int] = Query(None, ge=1, le=LOG_READ_MAX_LINES)):
+    """Get container logs; time ranges and deleted labs are read from the log archive"""
     try:
-        logs = docker_client.get_container_logs(container_id)
-        return {"logs": logs}
+        if since is None and until is None:
+            try:
+                docker_client.host_of(container_id)
+                live = True
+            except Exception:
+                # Deleted labs keep their archived logs
+                live = False
+            if live:
+                idle_detector.ensure_running(container_id)
+                logs = docker_client.get_container_logs(container_id, tail=tail or 100)
+                return {"logs": logs, "source": "live"}
+
+        archive_id = container_id
+        try:
+            archive_id = docker_client.inspect_container(container_id)["Id"]
+            # Pick up lines written since the last sweep; only new lines are fetched
+            log_archiver.archive(archive_id)
+        except Exception as e:
+            logger.debug(f"Reading archived logs of {container_id} without catching up: {e}")
+        return {**log_archiver.read(archive_id, since, until, tail=tail), "source": "archive"}
+    except LogArchiveNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         logger.error(f"Error getting lab logs: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -214,16 +413,34 @@ def get_lab_logs(container_id: str):
 def get_lab_stats(container_id: str):
     """Get container stats"""
     try:
+        idle_detector.ensure_running(container_id)
         stats = docker_client.get_container_stats(container_id)
         return {"stats": stats}
     except Exception as e:
         logger.error(f"Error getting lab stats: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/lab/{container_id}/metrics")
+def get_lab_metrics(container_id: str, window: str = Query("1h", alias="range"), step: Optional[str] = None):
+    """Recorded CPU, memory, network and block IO of a lab, averaged per step over the last range"""
+    try:
+        range_seconds = parse_duration(window)
+        step_seconds = parse_duration(step) if step else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if range_seconds <= 0:
+        raise HTTPException(status_code=400, detail="range must be positive")
+    # History is read as recorded; suspended labs are not resumed for it
+    result = metrics_history.query(container_id, range_seconds, step_seconds)
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"No metrics recorded for {container_id}")
+    return result
+
 @app.get("/lab/{container_id}/processes")
 def get_lab_processes(container_id: str):
     """Get container processes"""
     try:
+        idle_detector.ensure_running(container_id)
         processes = docker_client.get_container_processes(container_id)
         return {"processes": processes}
     except Exception as e:
@@ -234,29 +451,311 @@ def get_lab_processes(container_id: str):
 def exec_lab_command(container_id: str, exec_data: ExecRequest):
     """Execute command in container"""
     try:
+        idle_detector.ensure_running(container_id)
         result = docker_client.exec_command(container_id, exec_data.command)
         return {"result": result}
     except Exception as e:
         logger.error(f"Error executing command: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.websocket("/lab/{container_id}/exec")
+async def exec_lab_session(websocket: WebSocket, container_id: str, cmd: str = "/bin/sh", tty: bool = True,
+                           rows: Optional[int] = None, cols: Optional[int] = None):
+    """Interactive exec session streamed over a WebSocket"""
+    await exec_sessions.run(websocket, container_id, cmd, tty=tty, rows=rows, cols=cols,
+                            prepare=idle_detector.ensure_running)
+
+@app.get("/lab/{container_id}/exec-sessions")
+def get_lab_exec_sessions(container_id: str):
+    """List active exec sessions for a container"""
+    return {"data": exec_sessions.list_sessions(container_id)}
+
+@app.post("/lab/{container_id}/snapshot")
+def snapshot_lab(container_id: str, include_volumes: bool = True):
+    """Commit a lab's writable layer (and archive its volumes) as a snapshot"""
+    try:
+        return {"data": snapshots.create(container_id, include_volumes=include_volumes)}
+    except Exception as e:
+        logger.error(f"Error snapshotting lab: {e}")
+        if "404" in str(e):
+            raise HTTPException(status_code=404, detail="Lab not found")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/snapshots")
+def get_snapshots(user_id: Optional[str] = Query(None)):
+    """List snapshots, optionally for one user"""
+    try:
+        return {"data": snapshots.list(user_id)}
+    except Exception as e:
+        logger.error(f"Error listing snapshots: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.delete("/snapshots/{snapshot_id}")
+def delete_snapshot(snapshot_id: str):
+    """Delete a snapshot and its volume archives"""
+    try:
+        if not snapshots.delete(snapshot_id):
+            raise HTTPException(status_code=409, detail="Snapshot is in use by a lab")
+        return {"message": "Snapshot deleted successfully"}
+    except HTTPException:
+        raise
+    except SnapshotNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error deleting snapshot: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/snapshots/{snapshot_id}/export")
+def export_snapshot(snapshot_id: str):
+    """Stream a snapshot image with all its layers as a compressed archive"""
+    try:
+        export = snapshots.export(snapshot_id)
+    except SnapshotNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error exporting snapshot: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    return StreamingResponse(export["stream"], media_type=export["media_type"],
+                             headers={"Content-Disposition": f"attachment; filename={export['filename']}"})
+
+@app.post("/snapshots/{snapshot_id}/restore")
+def restore_snapshot(snapshot_id: str, restore_data: SnapshotRestoreRequest):
+    """Create a new lab from a snapshot on the host that holds its layers"""
+    try:
+        snapshot = snapshots.get(snapshot_id)
+        resources = resolve_resource_profile(restore_data.resource_profile or snapshot["resource_profile"])
+        labels = {
+            "fluxlabs.user_id": restore_data.user_id,
+            "fluxlabs.name": restore_data.name,
+            "fluxlabs.template": snapshot["template_id"] or "snapshot",
+            "fluxlabs.created_at": datetime.now().isoformat(),
+            "fluxlabs.duration_hours": str(restore_data.duration_hours),
+            "fluxlabs.persistent": str(bool(restore_data.persistent)).lower(),
+            "fluxlabs.restored_from": snapshot_id,
+            "fluxlabs.created_by": "FluxLabs"
+        }
+        container_name = f"fluxlabs-{restore_data.name}-{restore_data.user_id}"
+
+        with tracer.start_as_current_span("placement.admit"):
+            host = placement.admit(container_name, snapshot["image"], resources["cpus"], resources["memory_mb"],
+                                   hosts=[snapshot["host"]])
+        # Snapshots taken before workspaces existed keep the home directory in the image itself
+        template = catalog.get(snapshot["template_id"]) or {}
+        base_image = template.get("image") if workspaces.mount in snapshot["volumes"] else None
+        try:
+            container_id = _create_lab_container(
+                host, container_name, snapshot["image"], labels, resources, snapshot["template_id"], base_image,
+                template.get("workspace_setup"), restore=lambda new_id: snapshots.restore_volumes(snapshot, new_id)
+            )
+        except Exception:
+            placement.release(container_name)
+            raise
+        placement.commit(host, container_name, container_id)
+
+        container = docker_client.get_container_by_id(container_id)
+        return {"data": _container_to_lab_response(container)}
+
+    except SnapshotNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ExceedsHostCapacity as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except Exception as e:
+        logger.error(f"Error restoring snapshot: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/templates")
-def get_lab_templates():
-    """Get available lab templates"""
-    templates = []
-    for template_id, template_data in TEMPLATES.items():
-        templates.append({
-            "id": template_id,
-            "name": template_data["name"],
-            "image": template_data["image"],
-            "description": template_data["description"]
-        })
-    return {"data": templates}
+def get_lab_templates(if_none_match: Optional[str] = Header(None)):
+    """Get available lab templates, served from the catalog's pre-serialized body"""
+    snapshot = catalog.snapshot
+    headers = {"ETag": snapshot.etag, "X-Template-Catalog-Version": str(snapshot.version)}
+    if if_none_match == snapshot.etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=snapshot.body, media_type="application/json", headers=headers)
+
+@app.get("/capacity")
+def get_capacity():
+    """Committed CPU and memory against capacity, per host and in total"""
+    try:
+        return {"data": placement.utilization()}
+    except Exception as e:
+        logger.error(f"Error getting capacity: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/idle")
+def get_idle_status():
+    """Idle detector state: suspended labs, transition counts and resume latency"""
+    return {"data": idle_detector.status()}
+
+@app.get("/gc")
+def get_gc_status():
+    """Garbage collector state: disk pressure, last pass and bytes reclaimed so far"""
+    return {"data": garbage_collector.status()}
+
+@app.post("/gc/run")
+def run_gc():
+    """Run a garbage collection pass now"""
+    result = garbage_collector.collect()
+    if result is None:
+        raise HTTPException(status_code=409, detail="A GC pass is already running")
+    return {"data": result}
+
+@app.on_event("startup")
+def startup_event():
+    # Docker clients connect on first use, so a down engine does not block startup
+    with startup_phase("container-manager", "idle_detector"):
+        idle_detector.start()
+    with startup_phase("container-manager", "log_archiver"):
+        log_archiver.start()
+    with startup_phase("container-manager", "metrics_history"):
+        metrics_history.start()
+    with startup_phase("container-manager", "garbage_collector"):
+        garbage_collector.start()
+
+@app.on_event("shutdown")
+def shutdown_event():
+    idle_detector.stop()
+    log_archiver.stop()
+    metrics_history.stop()
+    garbage_collector.stop()
 
 @app.get("/health")
 def health_check():
     return {"status": "healthy", "service": "container-manager-docker-only"}
 
+@app.get("/health/live")
+def liveness_check():
+    """The process is up and serving; never touches Docker"""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+def readiness_check():
+    """Ready while at least one Docker host answers"""
+    hosts = docker_client.ping_hosts()
+    if not any(hosts.values()):
+        return OrjsonResponse(status_code=503, content={"status": "not ready", "hosts": hosts})
+    return {"status": "ready", "hosts": hosts}
+
+def _delete_lab(container_id: str):
+    """Remove a lab and what it holds: snapshot first if persistent, then logs, workspace and capacity"""
+    info = docker_client.inspect_container(container_id)
+    labels = info.get("Config", {}).get("Labels") or {}
+    host = docker_client.host_of(container_id)
+    if labels.get("fluxlabs.persistent") == "true":
+        # A failed snapshot keeps the lab rather than losing its state
+        snapshot = snapshots.create(container_id)
+        logger.info(f"Saved persistent lab {container_id} as {snapshot['id']}")
+    try:
+        log_archiver.archive(info["Id"], labels, final=True)
+    except Exception as e:
+        # Losing the log tail is not worth keeping the lab for
+        logger.warning(f"Failed to archive logs of {container_id}: {e}")
+    if not docker_client.remove_container(container_id):
+        raise Exception("Failed to delete lab")
+    workspaces.release(labels.get("fluxlabs.workspace"), host)
+    placement.release(container_id)
+    idle_detector.forget(container_id)
+    metrics_history.forget(info["Id"])
+
+def _start_lab(container_id: str):
+    # Resuming a lab the idle detector stopped re-admits it itself
+    if idle_detector.ensure_running(container_id) is not None:
+        return
+    resources = docker_client.get_container_resources(container_id)
+    placement.reserve_existing(container_id, resources["cpus"], resources["memory_mb"])
+    if not docker_client.start_container(container_id):
+        placement.release(container_id)
+        raise Exception("Failed to start lab")
+
+def _stop_lab(container_id: str):
+    if not docker_client.stop_container(container_id):
+        raise Exception("Failed to stop lab")
+    placement.release(container_id)
+    idle_detector.forget(container_id)
+
+def _create_lab_container(host: str, container_name: str, image: str, labels: Dict[str, str],
+                          resources: Dict[str, Any], template_id: str, base_image: Optional[str],
+                          workspace_setup: Optional[str] = None, restore=None) -> str:
+    """Create a lab container with a workspace cloned from the template base, fill it, then start it"""
+    workspace = None
+    container_id = None
+    try:
+        if base_image:
+            with tracer.start_as_current_span("workspace.prepare"):
+                workspace = workspaces.prepare(container_name, template_id, base_image, host, workspace_setup)
+        container_id = docker_client.create_container_with_labels(
+            image=image,
+            name=container_name,
+            labels={**labels, **(workspace["labels"] if workspace else {})},
+            resources=resources,
+            host=host,
+            volumes=workspace["volumes"] if workspace else None,
+            start=False
+        )
+        workspaces.seed(workspace, container_id)
+        if restore:
+            restore(container_id)
+        if not docker_client.start_container(container_id):
+            raise Exception(f"Failed to start container {container_name}")
+        return container_id
+    except Exception:
+        if container_id:
+            docker_client.remove_container(container_id)
+        if workspace:
+            workspaces.release(workspace["volume"], host)
+        raise
+
+def _lab_sort_fields(container: Dict[str, Any]) -> Dict[str, str]:
+    """Sortable values of a listed lab; timestamps come from labels as ISO strings"""
+    labels = container["Labels"]
+    created_at = labels.get("fluxlabs.created_at", "")
+    expires_at = ""
+    try:
+        expires_at = (datetime.fromisoformat(created_at) +
+                      timedelta(hours=float(labels.get("fluxlabs.duration_hours", "")))).isoformat()
+    except ValueError:
+        pass
+    return {"created_at": created_at, "expires_at": expires_at, "name": labels.get("fluxlabs.name", "")}
+
+def _in_range(value: str, lower: Optional[datetime], upper: Optional[datetime]) -> bool:
+    if lower is None and upper is None:
+        return True
+    try:
+        moment = datetime.fromisoformat(value).replace(tzinfo=None)
+    except ValueError:
+        return False
+    return ((lower is None or moment >= lower.replace(tzinfo=None)) and
+            (upper is None or moment < upper.replace(tzinfo=None)))
+
+def _summary_to_lab_response(container: Dict[str, Any], fields: Dict[str, str]) -> LabResponse:
+    """Lab response from a container list summary, without inspecting the container"""
+    labels = container["Labels"]
+    ssh_info = None
+    for port in container["Ports"]:
+        if port.get("PrivatePort") == 22 and port.get("PublicPort"):
+            ssh_info = {
+                "host": "localhost",
+                "port": str(port["PublicPort"]),
+                "command": f"ssh root@localhost -p {port['PublicPort']}"
+            }
+            break
+    return LabResponse(
+        id=container["Id"],
+        container_id=container["Id"],
+        name=fields["name"] or (container["Names"] or ["Unknown"])[0].lstrip("/"),
+        template_id=labels.get("fluxlabs.template", "unknown"),
+        user_id=labels.get("fluxlabs.user_id", "unknown"),
+        status=container["State"],
+        docker_status=container["Status"],
+        created_at=fields["created_at"],
+        expires_at=fields["expires_at"] or None,
+        image=container["Image"],
+        host=container["Host"],
+        ports=container["Ports"],
+        ssh_info=ssh_info
+    )
+
 def _container_to_lab_response(container: Dict[str, Any]) -> Optional[LabResponse]:
     """Convert Docker container to lab response format"""
     try:
@@ -295,6 +794,7 @@ def _container_to_lab_response(container: Dict[str, Any]) -> Optional[LabRespons
             docker_status=container.get("Status", "Unknown"),
             created_at=container.get("Created", ""),
             image=config.get("Image", "unknown"),
+            host=container.get("Host") or labels.get("fluxlabs.host"),
             ports=port_list,
             ssh_info=ssh_info
         )
@@ -0,0 +1,221 @@
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.triggers.interval import IntervalTrigger
+from typing import Optional, List, Dict, Any, Tuple
+from container_stats import sample_lab_stats
+import numpy as np
+import threading
+import logging
+import time
+import re
+import os
+
+logger = logging.getLogger(__name__)
+
+# Resolution tiers as step_seconds:slots, finest first; the first step is the sampling interval.
+# The default keeps 1h at 15s, 6h at 1m and 3 days at 10m.
+METRICS_TIERS = os.getenv("METRICS_TIERS", "15:240,60:360,600:432")
+METRICS_SAMPLE_CONCURRENCY = int(os.getenv("METRICS_SAMPLE_CONCURRENCY", "8"))
+# History of labs that stopped reporting is dropped after this long
+METRICS_FORGET_SECONDS = int(os.getenv("METRICS_FORGET_SECONDS", str(24 * 3600)))
+METRICS_MAX_POINTS = int(os.getenv("METRICS_MAX_POINTS", "1000"))
+
+FIELDS = ("cpu_percent", "memory_bytes", "network_rx_rate", "network_tx_rate",
+          "block_read_rate", "block_write_rate", "pids")
+# Counters recorded as per-second rates
+RATE_FIELDS = {"network_rx_rate": "network_rx_bytes", "network_tx_rate": "network_tx_bytes",
+               "block_read_rate": "block_read_bytes", "block_write_rate": "block_write_bytes"}
+
+_DURATION = re.compile(r"^(\d+(?:\.\d+)?)([smhd]?)$")
+_UNITS = {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_duration(value: str) -> float:
+    """Seconds in a duration like 90, 30s, 15m, 6h or 2d"""
+    match = _DURATION.match(value.strip())
+    if not match:
+        raise ValueError(f"Invalid duration {value!r}")
+    return float(match.group(1)) * _UNITS[match.group(2)]
+
+
+def parse_tiers(spec: str = METRICS_TIERS) -> List[Tuple[int, int]]:
+    tiers = sorted((int(step), int(slots)) for step, slots in (item.split(":") for item in spec.split(",") if item))
+    if not tiers:
+        raise ValueError("METRICS_TIERS defines no tier")
+    return tiers
+
+
+class Ring:
+    """Fixed-size ring of timestamped rows, one column per field"""
+
+    def __init__(self, step: int, slots: int):
+        self.step = step
+        self.slots = slots
+        self.times = np.full(slots, np.nan)
+        self.values = np.full((slots, len(FIELDS)), np.nan, dtype=np.float32)
+        self.position = 0
+
+    def append(self, at: float, row: np.ndarray):
+        self.times[self.position] = at
+        self.values[self.position] = row
+        self.position = (self.position + 1) % self.slots
+
+    def window(self, start: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Rows at or after start, oldest first"""
+        order = np.roll(np.arange(self.slots), -self.position)
+        times = self.times[order]
+        keep = times >= start
+        return times[keep], self.values[order][keep]
+
+
+class ContainerHistory:
+    """All tiers of one container; coarser tiers get the mean of each finished bucket of raw samples"""
+
+    def __init__(self, tiers: List[Tuple[int, int]]):
+        self.rings = [Ring(step, slots) for step, slots in tiers]
+        # Per coarse tier: bucket number, running sum and count of each field
+        self._buckets = [[None, np.zeros(len(FIELDS)), np.zeros(len(FIELDS))] for _ in tiers[1:]]
+        self._counters: Optional[Tuple[float, Dict[str, float]]] = None
+        self.last_seen = time.time()
+        self.lock = threading.Lock()
+
+    def record(self, at: float, sample: Dict[str, Any]):
+        row = np.empty(len(FIELDS), dtype=np.float64)
+        previous = self._counters
+        for index, field in enumerate(FIELDS):
+            if field in RATE_FIELDS:
+                counter = RATE_FIELDS[field]
+                if previous and at > previous[0] and sample[counter] >= previous[1][counter]:
+                    row[index] = (sample[counter] - previous[1][counter]) / (at - previous[0])
+                else:
+                    # First sample, or the counter was reset by a restart
+                    row[index] = np.nan
+            else:
+                row[index] = sample[field]
+
+        with self.lock:
+            self._counters = (at, {counter: sample[counter] for counter in RATE_FIELDS.values()})
+            self.last_seen = time.time()
+            self.rings[0].append(at, row)
+            for ring, bucket in zip(self.rings[1:], self._buckets):
+                number = int(at // ring.step)
+                if bucket[0] is not None and number != bucket[0] and bucket[2].any():
+                    with np.errstate(invalid="ignore"):
+                        ring.append(bucket[0] * ring.step, (bucket[1] / bucket[2]).astype(np.float32))
+                    bucket[1][:] = 0
+                    bucket[2][:] = 0
+                bucket[0] = number
+                # NaN rates (first sample after a reset) are left out of the mean
+                bucket[1] += np.nan_to_num(row)
+                bucket[2] += ~np.isnan(row)
+
+    def query(self, start: float, end: float, step: float) -> Dict[str, Any]:
+        """Mean of each field per `step` bucket between start and end, from the finest tier covering start"""
+        ring = next((ring for ring in self.rings if ring.slots * ring.step >= end - start), self.rings[-1])
+        step = max(step, ring.step)
+        with self.lock:
+            times, values = ring.window(start)
+        keep = times < end
+        times, values = times[keep], values[keep].astype(np.float64)
+
+        buckets = int(np.ceil((end - start) / step))
+        index = ((times - start) // step).astype(np.int64)
+        valid = ~np.isnan(values)
+        counts = np.stack([np.bincount(index, weights=valid[:, column], minlength=buckets)
+                           for column in range(len(FIELDS))], axis=1)
+        sums = np.stack([np.bincount(index, weights=np.where(valid[:, column], values[:, column], 0.0),
+                                     minlength=buckets) for column in range(len(FIELDS))], axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = sums / counts
+
+        return {
+            "resolution_seconds": ring.step,
+            "step_seconds": step,
+            "timestamps": (start + np.arange(buckets) * step).tolist(),
+            "series": {
+                field: [None if np.isnan(value) else round(float(value), 3) for value in means[:, column]]
+                for column, field in enumerate(FIELDS)
+            }
+        }
+
+
+class MetricsHistory:
+    """Per-container metric history in fixed-size, multi-resolution rings.
+
+    Memory per container is fixed by METRICS_TIERS (about 37 KB with the default
+    tiers), whatever the lab's age. A background job samples every running lab
+    once per finest step; reads aggregate with vectorized bucketing.
+    """
+
+    def __init__(self, docker_client, tiers: Optional[List[Tuple[int, int]]] = None, cgroups=None):
+        self.docker_client = docker_client
+        self.tiers = tiers or parse_tiers()
+        # Optional CgroupStatsCollector read before falling back to Docker stats
+        self.cgroups = cgroups
+        self.histories: Dict[str, ContainerHistory] = {}
+        self.scheduler = BackgroundScheduler()
+        self._lock = threading.Lock()
+
+    @property
+    def sample_interval(self) -> int:
+        return self.tiers[0][0]
+
+    def start(self):
+        self.scheduler.add_job(
+            func=self.collect,
+            trigger=IntervalTrigger(seconds=self.sample_interval),
+            id='collect_lab_metrics',
+            name='Collect lab metrics',
+            max_instances=1,
+            coalesce=True
+        )
+        self.scheduler.start()
+        logger.info(f"Metrics history started (tiers {self.tiers})")
+
+    def stop(self):
+        if self.scheduler.running:
+            self.scheduler.shutdown(wait=False)
+
+    def record(self, container_id: str, sample: Dict[str, Any], at: Optional[float] = None):
+        with self._lock:
+            history = self.histories.get(container_id)
+            if history is None:
+                history = self.histories[container_id] = ContainerHistory(self.tiers)
+        history.record(at or time.time(), sample)
+
+    def collect(self):
+        """Sample every running lab once and drop histories of labs gone for METRICS_FORGET_SECONDS"""
+        try:
+            running = self.docker_client.list_lab_ids_by_status("running")
+        except Exception as e:
+            logger.error(f"Metrics collection failed to list labs: {e}")
+            return
+        at = time.time()
+        samples = sample_lab_stats(self.docker_client, running, METRICS_SAMPLE_CONCURRENCY, self.cgroups)
+        for container_id, sample in samples.items():
+            self.record(container_id, sample, at)
+
+        cutoff = at - METRICS_FORGET_SECONDS
+        with self._lock:
+            for container_id in [cid for cid, history in self.histories.items() if history.last_seen < cutoff]:
+                del self.histories[container_id]
+
+    def forget(self, container_id: str):
+        with self._lock:
+            self.histories.pop(container_id, None)
+
+    def find(self, container_id: str) -> Optional[ContainerHistory]:
+        """History of a container by full ID or unique ID prefix"""
+        history = self.histories.get(container_id)
+        if history is not None:
+            return history
+        matches = [history for cid, history in list(self.histories.items()) if cid.startswith(container_id)]
+        return matches[0] if len(matches) == 1 else None
+
+    def query(self, container_id: str, range_seconds: float, step_seconds: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        history = self.find(container_id)
+        if history is None:
+            return None
+        end = time.time()
+        # Bound the number of points whatever range and step are asked for
+        step = max(step_seconds or 0, range_seconds / METRICS_MAX_POINTS, 1)
+        return {"fields": list(FIELDS), **history.query(end - range_seconds, end, step)}
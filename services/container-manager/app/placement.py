@@ -0,0 +1,140 @@
+from typing import Optional, List, Dict, Any, Set
+from admission import AdmissionController, AdmissionRejected, ExceedsHostCapacity
+import threading
+import logging
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+# "least_loaded" spreads labs across hosts, "binpack" fills one host before the next
+PLACEMENT_STRATEGY = os.getenv("PLACEMENT_STRATEGY", "least_loaded")
+# Score bonus for hosts that already have the image (avoids a pull)
+PLACEMENT_IMAGE_AFFINITY = float(os.getenv("PLACEMENT_IMAGE_AFFINITY", "0.25"))
+PLACEMENT_IMAGE_CACHE_SECONDS = int(os.getenv("PLACEMENT_IMAGE_CACHE_SECONDS", "60"))
+
+
+def _normalize_image(image: str) -> str:
+    name = image.rsplit("/", 1)[-1]
+    return image if ":" in name else f"{image}:latest"
+
+
+class PlacementScheduler:
+    """Chooses a Docker host for each new lab and holds per-host admission controllers"""
+
+    def __init__(self, docker_client, strategy: str = PLACEMENT_STRATEGY,
+                 image_affinity: float = PLACEMENT_IMAGE_AFFINITY,
+                 image_cache_seconds: int = PLACEMENT_IMAGE_CACHE_SECONDS):
+        self.docker_client = docker_client
+        self.strategy = strategy
+        self.image_affinity = image_affinity
+        self.image_cache_seconds = image_cache_seconds
+        self.admission: Dict[str, AdmissionController] = {
+            host: AdmissionController(docker_client, host) for host in docker_client.host_names()
+        }
+        self._images: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def _host_images(self, host: str) -> Set[str]:
+        cached = self._images.get(host)
+        if cached and time.monotonic() - cached[0] < self.image_cache_seconds:
+            return cached[1]
+        try:
+            images = {_normalize_image(tag) for tag in self.docker_client.list_image_tags(host)}
+        except Exception as e:
+            logger.warning(f"Failed to list images on host {host}: {e}")
+            images = cached[1] if cached else set()
+        with self._lock:
+            self._images[host] = (time.monotonic(), images)
+        return images
+
+    def _score(self, utilization: Dict[str, Any], images: Set[str], image: str, cpus: float, memory_mb: int) -> Optional[float]:
+        """Higher is better; None when the lab does not fit on the host right now"""
+        cpu = utilization["cpu"]
+        memory = utilization["memory_mb"]
+        if not cpu["limit"] or not memory["limit"]:
+            # Capacity unknown: placeable, but never preferred over a known host
+            score = 0.0
+        else:
+            if cpu["available"] < cpus or memory["available"] < memory_mb:
+                return None
+            free = min((cpu["available"] - cpus) / cpu["limit"], (memory["available"] - memory_mb) / memory["limit"])
+            score = free if self.strategy != "binpack" else 1.0 - free
+
+        if _normalize_image(image) in images:
+            score += self.image_affinity
+        return score
+
+    def rank(self, image: str, cpus: float, memory_mb: int) -> List[str]:
+        """Hosts ordered by preference; hosts without room go last"""
+        # Image lists come from Docker (or the cache) before any host's admission state is read
+        images = {host: self._host_images(host) for host in self.admission}
+        scored = []
+        full = []
+        for host, controller in self.admission.items():
+            score = self._score(controller.utilization(), images[host], image, cpus, memory_mb)
+            if score is None:
+                full.append(host)
+            else:
+                scored.append((score, host))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return [host for _, host in scored] + full
+
+    def admit(self, key: str, image: str, cpus: float, memory_mb: int, hosts: Optional[List[str]] = None) -> str:
+        """Reserve capacity on the best host (of `hosts`, if given) for a new lab and return the host name"""
+        ranked = [host for host in self.rank(image, cpus, memory_mb) if not hosts or host in hosts]
+        if not ranked:
+            raise AdmissionRejected("No Docker host available for this lab")
+        full = []
+        exceeded = None
+        for host in ranked:
+            try:
+                self.admission[host].admit(key, cpus, memory_mb, timeout=0)
+                return host
+            except ExceedsHostCapacity as e:
+                exceeded = e
+            except AdmissionRejected as e:
+                # Full, or lost a race with another create; try the next host
+                full.append((host, e))
+
+        if not full:
+            # Too big for every host; waiting cannot change that
+            raise exceeded
+        # Every host is full: wait for room on the preferred one if queueing is enabled, else reject
+        host, rejection = full[0]
+        controller = self.admission[host]
+        if controller.queue_timeout_seconds <= 0:
+            raise rejection
+        controller.admit(key, cpus, memory_mb)
+        return host
+
+    def commit(self, host: str, key: str, container_id: str):
+        self.admission[host].commit(key, container_id)
+
+    def reserve_existing(self, container_id: str, cpus: float, memory_mb: int):
+        """Re-admit a stopped container on the host it already lives on"""
+        self.admission[self.docker_client.host_of(container_id)].reserve_existing(container_id, cpus, memory_mb)
+
+    def release(self, key: str):
+        for controller in self.admission.values():
+            controller.release(key)
+
+    def utilization(self) -> Dict[str, Any]:
+        """Per-host commitments plus pool totals"""
+        hosts = [controller.utilization() for controller in self.admission.values()]
+        return {
+            "strategy": self.strategy,
+            "hosts": hosts,
+            "total": {
+                "cpu": {
+                    key: round(sum(h["cpu"][key] for h in hosts), 3)
+                    for key in ("capacity", "limit", "committed", "available")
+                },
+                "memory_mb": {
+                    key: sum(h["memory_mb"][key] for h in hosts)
+                    for key in ("capacity", "limit", "committed", "available")
+                },
+                "labs": sum(h["labs"] for h in hosts),
+                "queued": sum(h["queued"] for h in hosts)
+            }
+        }
@@ -0,0 +1,361 @@
+from datetime import datetime
+from typing import Optional, List, Dict, Any, Iterable, Iterator, Set
+from metrics import BACKGROUND_EVENTS
+import tempfile
+import logging
+import tarfile
+import shutil
+import gzip
+import json
+import uuid
+import zlib
+import io
+import os
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# Volume archives are written here; committed layers live in each host's image store
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "/var/lib/fluxlabs/snapshots")
+SNAPSHOT_REPOSITORY = os.getenv("SNAPSHOT_REPOSITORY", "fluxlabs-snapshot")
+# Snapshots kept per lab lineage; older ones are untagged and their archives removed
+SNAPSHOT_RETENTION = int(os.getenv("SNAPSHOT_RETENTION", "3"))
+# zstd when the zstandard package is installed, gzip otherwise
+SNAPSHOT_COMPRESSION = os.getenv("SNAPSHOT_COMPRESSION", "zstd" if zstandard else "gzip")
+SNAPSHOT_ZSTD_LEVEL = int(os.getenv("SNAPSHOT_ZSTD_LEVEL", "3"))
+SNAPSHOT_CHUNK_BYTES = 1024 * 1024
+# Volume archives hold only files changed since the previous snapshot; every Nth one is full
+SNAPSHOT_FULL_EVERY = int(os.getenv("SNAPSHOT_FULL_EVERY", "5"))
+
+EXTENSIONS = {"zstd": "zst", "gzip": "gz"}
+MEDIA_TYPES = {"zstd": "application/zstd", "gzip": "application/gzip"}
+
+
+class SnapshotNotFound(Exception):
+    """Raised when no host has the requested snapshot"""
+
+
+def compress_stream(chunks: Iterable[bytes], compression: str = SNAPSHOT_COMPRESSION) -> Iterator[bytes]:
+    """Compress an iterable of byte chunks as it is read"""
+    if compression == "zstd":
+        compressor = zstandard.ZstdCompressor(level=SNAPSHOT_ZSTD_LEVEL, threads=-1).compressobj()
+    else:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def decompress_file(path: str) -> Iterator[bytes]:
+    """Read a compressed archive back as a stream of raw chunks"""
+    if path.endswith(".zst"):
+        decompressor = zstandard.ZstdDecompressor().decompressobj()
+    else:
+        decompressor = zlib.decompressobj(31)
+    with open(path, "rb") as archive:
+        while True:
+            chunk = archive.read(SNAPSHOT_CHUNK_BYTES)
+            if not chunk:
+                break
+            data = decompressor.decompress(chunk)
+            if data:
+                yield data
+    if hasattr(decompressor, "flush"):
+        yield decompressor.flush()
+
+
+def compressed_writer(raw, compression: str = SNAPSHOT_COMPRESSION):
+    """File-like writer compressing into an open file, in the format decompress_file reads"""
+    if compression == "zstd":
+        return zstandard.ZstdCompressor(level=SNAPSHOT_ZSTD_LEVEL, threads=-1).stream_writer(raw, closefd=False)
+    return gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6, mtime=0)
+
+
+class ChunkReader(io.RawIOBase):
+    """Readable file over an iterable of byte chunks, for streaming tar parsing"""
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._pending = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._pending:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._pending = chunk
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+
+def open_tar_stream(chunks: Iterable[bytes]) -> tarfile.TarFile:
+    return tarfile.open(fileobj=io.BufferedReader(ChunkReader(chunks), SNAPSHOT_CHUNK_BYTES), mode="r|")
+
+
+def member_signature(member: tarfile.TarInfo) -> list:
+    """What decides whether a tar entry changed between two snapshots"""
+    # PAX headers carry sub-second mtimes, which catch quick successive writes
+    mtime = member.pax_headers.get("mtime", str(member.mtime))
+    return [member.size, mtime, member.mode, member.uid, member.gid, member.type.decode(), member.linkname]
+
+
+class SnapshotManager:
+    """Lab snapshots: the container's writable layer committed as an image, plus compressed volume archives.
+
+    Volumes, where the workspace lives, are archived incrementally: a manifest records each
+    file's signature and the snapshot whose archive holds it, so the next snapshot of the lab
+    (or of a lab restored from it) only archives what changed, and a restore replays the
+    chain. Every SNAPSHOT_FULL_EVERY-th archive is full to bound the chain. The image layer
+    is incremental across restores only, since Docker diffs a commit against the container's
+    own image. Snapshots of one lab and of labs restored from it share a lineage and are
+    pruned together; archives stay while a retained snapshot's chain needs them.
+    """
+
+    def __init__(self, docker_client, snapshot_dir: str = SNAPSHOT_DIR, retention: int = SNAPSHOT_RETENTION):
+        self.docker_client = docker_client
+        self.snapshot_dir = snapshot_dir
+        self.retention = retention
+
+    def create(self, container_id: str, include_volumes: bool = True) -> Dict[str, Any]:
+        """Snapshot a lab container and return the snapshot"""
+        attrs = self.docker_client.inspect_container(container_id)
+        host = self.docker_client.host_of(container_id)
+        labels = attrs.get("Config", {}).get("Labels") or {}
+        volumes = [mount["Destination"] for mount in attrs.get("Mounts", []) if mount.get("Type") == "volume"]
+        snapshot_id = f"snap-{uuid.uuid4().hex[:12]}"
+        previous = self._previous_manifest(attrs["Id"], labels, volumes) if include_volumes and volumes else None
+
+        snapshot_labels = {
+            "fluxlabs.snapshot.id": snapshot_id,
+            # Restored labs inherit this label from the snapshot image, keeping the lineage
+            "fluxlabs.snapshot.lineage": labels.get("fluxlabs.snapshot.lineage") or attrs["Id"],
+            "fluxlabs.snapshot.source": attrs["Id"],
+            "fluxlabs.snapshot.user_id": labels.get("fluxlabs.user_id", ""),
+            "fluxlabs.snapshot.name": labels.get("fluxlabs.name", ""),
+            "fluxlabs.snapshot.template": labels.get("fluxlabs.template", ""),
+            "fluxlabs.snapshot.resource_profile": labels.get("fluxlabs.resource_profile", ""),
+            "fluxlabs.snapshot.created_at": datetime.now().isoformat(),
+            "fluxlabs.snapshot.volumes": json.dumps(volumes if include_volumes else []),
+            "fluxlabs.snapshot.base": previous["chain"][-1] if previous else ""
+        }
+        image = self.docker_client.commit_container(container_id, SNAPSHOT_REPOSITORY, snapshot_id, snapshot_labels)
+
+        try:
+            if include_volumes and volumes:
+                self._archive_volumes(container_id, snapshot_id, volumes, snapshot_labels["fluxlabs.snapshot.lineage"],
+                                      previous)
+        except Exception:
+            self.docker_client.remove_image(self._reference(snapshot_id), host)
+            shutil.rmtree(os.path.join(self.snapshot_dir, snapshot_id), ignore_errors=True)
+            raise
+
+        # Size of the new layer alone: everything below it is shared with the source image
+        base_size = self.docker_client.inspect_image(attrs["Image"], host).get("Size", 0)
+        BACKGROUND_EVENTS.labels("container-manager", "snapshot_created").inc()
+        logger.info(f"Snapshot {snapshot_id} of {container_id} on {host}")
+
+        snapshot = self._to_snapshot({**image, "Host": host, "Labels": snapshot_labels})
+        snapshot["layer_bytes"] = max(0, image.get("Size", 0) - base_size)
+        self._prune(snapshot_labels["fluxlabs.snapshot.lineage"])
+        return snapshot
+
+    def _previous_manifest(self, container_id: str, labels: Dict[str, str],
+                           volumes: List[str]) -> Optional[Dict[str, Any]]:
+        """Manifest of the snapshot to archive against: the lab's latest, or the one it was restored from"""
+        images = self.docker_client.list_images_by_label(f"fluxlabs.snapshot.source={container_id}")
+        snapshots = sorted((self._to_snapshot(image) for image in images),
+                           key=lambda snapshot: snapshot["created_at"], reverse=True)
+        base = snapshots[0]["id"] if snapshots else labels.get("fluxlabs.restored_from")
+        manifest = self._read_manifest(base) if base else None
+        if not manifest or manifest.get("paths") != volumes or len(manifest["chain"]) >= SNAPSHOT_FULL_EVERY:
+            return None
+        return manifest
+
+    def _archive_volumes(self, container_id: str, snapshot_id: str, volumes: List[str], lineage: str,
+                         previous: Optional[Dict[str, Any]] = None):
+        directory = os.path.join(self.snapshot_dir, snapshot_id)
+        os.makedirs(directory, exist_ok=True)
+        extension = EXTENSIONS[SNAPSHOT_COMPRESSION]
+        manifest = {
+            "lineage": lineage,
+            "chain": (previous["chain"] if previous else []) + [snapshot_id],
+            "paths": volumes,
+            "volumes": {}
+        }
+        for index, path in enumerate(volumes):
+            before = previous["volumes"].get(str(index), {}) if previous else {}
+            entries = {}
+            target = os.path.join(directory, f"{index}.tar.{extension}")
+            with open(f"{target}.partial", "wb") as archive:
+                writer = compressed_writer(archive)
+                source = open_tar_stream(self.docker_client.get_archive(container_id, path))
+                output = tarfile.open(fileobj=writer, mode="w|", format=tarfile.PAX_FORMAT)
+                for member in source:
+                    signature = member_signature(member)
+                    known = before.get(member.name)
+                    if known and known[:-1] == signature:
+                        # Unchanged: restored from the archive that already holds it
+                        entries[member.name] = known
+                        continue
+                    output.addfile(member, source.extractfile(member) if member.isreg() else None)
+                    entries[member.name] = signature + [snapshot_id]
+                output.close()
+                source.close()
+                writer.close()
+            os.replace(f"{target}.partial", target)
+            manifest["volumes"][str(index)] = entries
+
+        with open(os.path.join(directory, "manifest.json.partial"), "w") as manifest_file:
+            json.dump(manifest, manifest_file)
+        os.replace(os.path.join(directory, "manifest.json.partial"), os.path.join(directory, "manifest.json"))
+
+    def _read_manifest(self, snapshot_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(os.path.join(self.snapshot_dir, snapshot_id, "manifest.json")) as manifest_file:
+                return json.load(manifest_file)
+        except (OSError, ValueError):
+            return None
+
+    def _volume_archive(self, snapshot_id: str, index: int) -> Optional[str]:
+        directory = os.path.join(self.snapshot_dir, snapshot_id)
+        if not os.path.isdir(directory):
+            return None
+        for name in os.listdir(directory):
+            if name.startswith(f"{index}.tar.") and not name.endswith(".partial"):
+                return os.path.join(directory, name)
+        return None
+
+    def list(self, user_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Snapshots on all hosts, newest first"""
+        label = f"fluxlabs.snapshot.user_id={user_id}" if user_id else "fluxlabs.snapshot.id"
+        snapshots = [self._to_snapshot(image) for image in self.docker_client.list_images_by_label(label)]
+        return sorted(snapshots, key=lambda snapshot: snapshot["created_at"], reverse=True)
+
+    def get(self, snapshot_id: str) -> Dict[str, Any]:
+        for image in self.docker_client.list_images_by_label(f"fluxlabs.snapshot.id={snapshot_id}"):
+            return self._to_snapshot(image)
+        raise SnapshotNotFound(f"Snapshot {snapshot_id} not found")
+
+    def delete(self, snapshot_id: str) -> bool:
+        snapshot = self.get(snapshot_id)
+        removed = self.docker_client.remove_image(snapshot["image"], snapshot["host"])
+        if removed:
+            self._remove_archives(snapshot["lineage"], [snapshot_id])
+        return removed
+
+    def export(self, snapshot_id: str) -> Dict[str, Any]:
+        """The image with all its layers as a compressed `docker save` stream"""
+        snapshot = self.get(snapshot_id)
+        return {
+            "stream": compress_stream(self.docker_client.save_image(snapshot["image"], snapshot["host"])),
+            "media_type": MEDIA_TYPES[SNAPSHOT_COMPRESSION],
+            "filename": f"{snapshot_id}.tar.{EXTENSIONS[SNAPSHOT_COMPRESSION]}"
+        }
+
+    def restore_volumes(self, snapshot: Dict[str, Any], container_id: str):
+        """Unpack a snapshot's volume archives into a lab created from its image"""
+        manifest = self._read_manifest(snapshot["id"])
+        for index, path in enumerate(snapshot["volumes"]):
+            # The archive's top entry is the directory itself, so extract into its parent
+            parent = os.path.dirname(path.rstrip("/")) or "/"
+            if manifest is None:
+                archive = self._volume_archive(snapshot["id"], index)
+                if archive is None:
+                    logger.warning(f"Snapshot {snapshot['id']} has no archive for {path}")
+                    continue
+                self.docker_client.put_archive(container_id, parent, decompress_file(archive))
+                continue
+
+            # Oldest first, each archive contributing the entries it holds the latest version of
+            entries = manifest["volumes"].get(str(index), {})
+            for origin in manifest["chain"]:
+                names = {name for name, entry in entries.items() if entry[-1] == origin}
+                if not names:
+                    continue
+                archive = self._volume_archive(origin, index)
+                if archive is None:
+                    logger.warning(f"Snapshot {snapshot['id']} is missing archive {origin} for {path}")
+                    continue
+                data = decompress_file(archive) if origin == snapshot["id"] else self._filter_archive(archive, names)
+                self.docker_client.put_archive(container_id, parent, data)
+
+    def _filter_archive(self, archive: str, names: Set[str]) -> Iterator[bytes]:
+        """Stream the entries of an archive that are in names, spooled through a temporary file"""
+        with tempfile.TemporaryFile(dir=self.snapshot_dir) as spool:
+            source = open_tar_stream(decompress_file(archive))
+            output = tarfile.open(fileobj=spool, mode="w|", format=tarfile.PAX_FORMAT)
+            for member in source:
+                if member.name in names:
+                    output.addfile(member, source.extractfile(member) if member.isreg() else None)
+            output.close()
+            source.close()
+            spool.seek(0)
+            while True:
+                chunk = spool.read(SNAPSHOT_CHUNK_BYTES)
+                if not chunk:
+                    break
+                yield chunk
+
+    def _prune(self, lineage: str):
+        if self.retention <= 0:
+            return
+        images = self.docker_client.list_images_by_label(f"fluxlabs.snapshot.lineage={lineage}")
+        snapshots = sorted((self._to_snapshot(image) for image in images),
+                           key=lambda snapshot: snapshot["created_at"], reverse=True)
+        removed = []
+        for snapshot in snapshots[self.retention:]:
+            # Fails while a lab still runs on the image; retried on the next snapshot
+            if self.docker_client.remove_image(snapshot["image"], snapshot["host"]):
+                removed.append(snapshot["id"])
+                logger.info(f"Pruned snapshot {snapshot['id']}")
+        self._remove_archives(lineage, removed)
+
+    def _remove_archives(self, lineage: str, removed: List[str]):
+        """Delete archives of removed snapshots of a lineage unless a remaining snapshot's chain uses them"""
+        remaining = {self._to_snapshot(image)["id"]
+                     for image in self.docker_client.list_images_by_label(f"fluxlabs.snapshot.lineage={lineage}")}
+        needed = set(remaining)
+        for snapshot_id in remaining:
+            needed.update((self._read_manifest(snapshot_id) or {}).get("chain", []))
+        # Archives kept earlier for a chain are collected once nothing needs them
+        candidates = set(removed)
+        if os.path.isdir(self.snapshot_dir):
+            candidates.update(name for name in os.listdir(self.snapshot_dir)
+                              if (self._read_manifest(name) or {}).get("lineage") == lineage)
+        for snapshot_id in candidates - needed:
+            shutil.rmtree(os.path.join(self.snapshot_dir, snapshot_id), ignore_errors=True)
+
+    @staticmethod
+    def _reference(snapshot_id: str) -> str:
+        return f"{SNAPSHOT_REPOSITORY}:{snapshot_id}"
+
+    def _to_snapshot(self, image: Dict[str, Any]) -> Dict[str, Any]:
+        labels = image.get("Labels") or image.get("Config", {}).get("Labels") or {}
+        snapshot_id = labels.get("fluxlabs.snapshot.id", "")
+        return {
+            "id": snapshot_id,
+            "image": self._reference(snapshot_id),
+            "image_id": image.get("Id", ""),
+            "host": image.get("Host"),
+            "user_id": labels.get("fluxlabs.snapshot.user_id", ""),
+            "name": labels.get("fluxlabs.snapshot.name", ""),
+            "template_id": labels.get("fluxlabs.snapshot.template", ""),
+            "resource_profile": labels.get("fluxlabs.snapshot.resource_profile") or None,
+            "source_container_id": labels.get("fluxlabs.snapshot.source", ""),
+            "lineage": labels.get("fluxlabs.snapshot.lineage", ""),
+            "base": labels.get("fluxlabs.snapshot.base") or None,
+            "volumes": json.loads(labels.get("fluxlabs.snapshot.volumes") or "[]"),
+            "created_at": labels.get("fluxlabs.snapshot.created_at", ""),
+            "size_bytes": image.get("Size", 0)
+        }
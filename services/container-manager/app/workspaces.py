@@ -0,0 +1,137 @@
+from typing import Optional, Dict, Any
+from metrics import BACKGROUND_EVENTS
+import threading
+import logging
+import time
+import re
+import os
+
+logger = logging.getLogger(__name__)
+
+# Where the workspace volume is mounted in lab containers ("" disables workspaces)
+WORKSPACE_MOUNT = os.getenv("WORKSPACE_MOUNT", "/root")
+# "auto" clones with an overlay mount on overlay2 hosts and copies otherwise; "overlay", "copy" or "none" to force
+WORKSPACE_CLONE = os.getenv("WORKSPACE_CLONE", "auto")
+
+
+def _volume_name(value: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_.-]", "-", value)
+
+
+class WorkspaceManager:
+    """Per-lab workspace volumes cloned from a per-template base volume.
+
+    The base is seeded once per template image and host: Docker copies the image's
+    WORKSPACE_MOUNT directory into it, then the template's optional `workspace_setup`
+    command runs against it. Each lab then gets either an overlay volume with the base
+    as its read-only lower layer, storing only the lab's own changes, or, where overlay
+    mounts are not available, a plain volume filled from the base with a streamed tar copy.
+    """
+
+    def __init__(self, docker_client, mount: str = WORKSPACE_MOUNT, clone: str = WORKSPACE_CLONE):
+        self.docker_client = docker_client
+        self.mount = mount
+        self.clone = clone
+        self._host_modes: Dict[str, str] = {}
+        self._base_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.mount) and self.clone != "none"
+
+    def _mode(self, host: str) -> str:
+        if self.clone != "auto":
+            return self.clone
+        if host not in self._host_modes:
+            try:
+                driver = self.docker_client.get_host_info(host).get("Driver", "")
+            except Exception as e:
+                logger.warning(f"Failed to read storage driver of host {host}: {e}")
+                return "copy"
+            self._host_modes[host] = "overlay" if driver == "overlay2" else "copy"
+        return self._host_modes[host]
+
+    def _base_lock(self, key: str) -> threading.Lock:
+        with self._lock:
+            return self._base_locks.setdefault(key, threading.Lock())
+
+    def ensure_base(self, template_id: str, image: str, host: str, setup: Optional[str] = None) -> str:
+        """Seed the template's base volume on a host if needed and return its name"""
+        image_id = self.docker_client.ensure_image(image, host)
+        # A new image version gets a new base; labs on the old one keep using it
+        name = _volume_name(f"fluxlabs-base-{template_id}-{image_id.split(':')[-1][:12]}")
+
+        with self._base_lock(f"{host}/{name}"):
+            # The stopped seeding container marks a finished seed and is the source for tar copies
+            state = self.docker_client.get_helper_state(name, host)
+            if state is not None and not state.get("Running") and state.get("ExitCode") == 0:
+                return name
+            if state is not None or self.docker_client.get_volume(name, host):
+                # Leftovers of an interrupted seed
+                self.docker_client.remove_helper(name, host)
+                self.docker_client.remove_volume(name, host)
+
+            started = time.monotonic()
+            labels = {"fluxlabs.workspace.base": template_id, "fluxlabs.workspace.image": image}
+            self.docker_client.create_volume(name, host, labels=labels)
+            # Starting with an empty volume makes Docker copy the image's files into it
+            exit_code = self.docker_client.run_to_completion(
+                image, name, ["/bin/sh", "-c", setup or "true"],
+                volumes={name: {"bind": self.mount, "mode": "rw"}}, labels=labels, host=host
+            )
+            if exit_code != 0:
+                self.docker_client.remove_helper(name, host)
+                self.docker_client.remove_volume(name, host)
+                raise Exception(f"Workspace setup for template {template_id} exited with {exit_code}")
+            BACKGROUND_EVENTS.labels("container-manager", "workspace_base_seeded").inc()
+            logger.info(f"Seeded workspace base {name} on {host} in {time.monotonic() - started:.1f}s")
+            return name
+
+    def prepare(self, lab_key: str, template_id: str, image: str, host: str,
+                setup: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Create a lab's workspace volume; returns None when workspaces are disabled"""
+        if not self.enabled:
+            return None
+        base = self.ensure_base(template_id, image, host, setup)
+        name = _volume_name(f"{lab_key}-workspace")
+        labels = {"fluxlabs.workspace.lab": lab_key, "fluxlabs.workspace.base_volume": base}
+        mode = self._mode(host)
+
+        if mode == "overlay":
+            lower = self.docker_client.get_volume(base, host)["Mountpoint"]
+            # Docker creates each volume's directory, which gives overlay an upper and work dir on the same filesystem
+            upper = self.docker_client.create_volume(f"{name}-upper", host, labels=labels)["Mountpoint"]
+            work = self.docker_client.create_volume(f"{name}-work", host, labels=labels)["Mountpoint"]
+            self.docker_client.create_volume(name, host, labels=labels, driver_opts={
+                "type": "overlay",
+                "device": "overlay",
+                "o": f"lowerdir={lower},upperdir={upper},workdir={work}"
+            })
+        else:
+            self.docker_client.create_volume(name, host, labels=labels)
+
+        BACKGROUND_EVENTS.labels("container-manager", f"workspace_{mode}").inc()
+        return {
+            "volume": name,
+            "base": base,
+            "mode": mode,
+            "host": host,
+            "volumes": {name: {"bind": self.mount, "mode": "rw"}},
+            "labels": {"fluxlabs.workspace": name}
+        }
+
+    def seed(self, workspace: Optional[Dict[str, Any]], container_id: str):
+        """Fill a copy-mode workspace from its base; call before the lab's first start"""
+        if not workspace or workspace["mode"] == "overlay":
+            return
+        archive = self.docker_client.get_helper_archive(workspace["base"], self.mount, workspace["host"])
+        # The archive's top entry is the mount directory itself, so extract into its parent
+        self.docker_client.put_archive(container_id, os.path.dirname(self.mount.rstrip("/")) or "/", archive)
+
+    def release(self, volume: Optional[str], host: str):
+        """Remove a lab's workspace volume and, for overlay clones, its upper and work dirs"""
+        if not volume:
+            return
+        for name in (volume, f"{volume}-upper", f"{volume}-work"):
+            self.docker_client.remove_volume(name, host)
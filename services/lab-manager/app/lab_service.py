@@ -1,24 +1,46 @@
+from sqlalchemy import or_, and_
 from sqlalchemy.orm import Session
-from models import Lab, LabTemplate, ScheduledTask
+from typing import Optional, List, Any, Tuple
+from models import Lab, ScheduledTask
 from datetime import datetime, timedelta
+from resilience import get_upstream
+from template_catalog import TemplateCatalog
+import logging
 import httpx
 import os
 
+logger = logging.getLogger(__name__)
+
 CONTAINER_SERVICE_URL = os.getenv("CONTAINER_SERVICE_URL", "http://container-manager:8003")
 
+# Templates come from the shared catalog; lab_templates rows are only a mirror of it
+catalog = TemplateCatalog(serialize=lambda templates: [
+    {
+        "id": template["id"],
+        "name": template["name"],
+        "description": template["description"],
+        "image": template["image"],
+        "default_duration_hours": template["default_duration_hours"],
+        "resource_profile": template["resource_profile"]
+    }
+    for template in templates
+])
+
 class LabService:
     def __init__(self):
         self.container_service_url = CONTAINER_SERVICE_URL
+        self.container_service = get_upstream("lab-manager", "container-manager")
 
-    async def create_lab(self, db: Session, user_id: int, name: str, template_id: int, duration_hours: int = None):
+    async def create_lab(self, db: Session, user_id: int, name: str, template_id: str, duration_hours: int = None,
+                         persistent: bool = False):
         """Create a new lab"""
         # Get template
-        template = db.query(LabTemplate).filter(LabTemplate.id == template_id).first()
+        template = catalog.get(template_id)
         if not template:
             raise Exception("Template not found")
 
         # Calculate expiry time
-        hours = duration_hours or template.default_duration_hours
+        hours = duration_hours or template["default_duration_hours"]
         expires_at = datetime.utcnow() + timedelta(hours=hours)
 
         # Create lab record
@@ -26,6 +48,7 @@ class LabService:
             user_id=user_id,
             name=name,
             expires_at=expires_at,
+            persistent=persistent,
             status="creating"
         )
         db.add(lab)
@@ -35,21 +58,29 @@ class LabService:
         try:
             # Create container via Container Manager
             async with httpx.AsyncClient() as client:
-                container_request = {"image": template.image, "ssh_enabled": True}
-                print(f"Creating container with request: {container_request}")
-                
-                response = await client.post(
-                    f"{self.container_service_url}/containers",
-                    json=container_request
+                # Persistent labs are snapshotted by the container manager before removal
+                container_request = {
+                    "name": name,
+                    "template_id": template["id"],
+                    "user_id": str(user_id),
+                    "duration_hours": hours,
+                    "resource_profile": template["resource_profile"],
+                    "persistent": lab.persistent,
+                    "lab_id": lab.id
+                }
+                logger.info(f"Creating container for lab {lab.id} from template {template['id']}")
+
+                # Image pulls and workspace setup make creation slower than other calls
+                response = await self.container_service.request(
+                    client, "POST", f"{self.container_service_url}/create-lab",
+                    json=container_request, timeout=120
                 )
-                
-                print(f"Container service response: {response.status_code} - {response.text}")
-                
+
                 if response.status_code == 200:
-                    container_data = response.json()
-                    lab.container_id = container_data["id"]
+                    container_data = response.json()["data"]
+                    lab.container_id = container_data["container_id"]
                     lab.status = "running"
-                    print(f"Container created with ID: {container_data['id']}")
+                    logger.info(f"Lab {lab.id} runs in container {lab.container_id}")
                 else:
                     lab.status = "error"
                     raise Exception(f"Failed to create container: {response.status_code} - {response.text}")
@@ -82,31 +113,64 @@ class LabService:
         if not lab:
             return False
 
+        previous_status = lab.status
         lab.status = "expired"
         
         # Remove container if it exists
         if lab.container_id:
             try:
                 async with httpx.AsyncClient() as client:
-                    await client.delete(f"{self.container_service_url}/containers/{lab.container_id}")
+                    response = await self.container_service.request(
+                        client, "DELETE", f"{self.container_service_url}/delete-lab/{lab.container_id}",
+                        timeout=60
+                    )
+                if response.status_code == 404:
+                    # Already gone
+                    logger.info(f"Container {lab.container_id} of lab {lab_id} no longer exists")
+                else:
+                    response.raise_for_status()
             except Exception:
-                pass  # Container might already be gone
+                # Leave the lab as it was; unavailability is retried, other failures mark the task failed
+                lab.status = previous_status
+                raise
 
         db.commit()
         return True
 
-    def get_user_labs(self, db: Session, user_id: int):
-        """Get all labs for a user"""
-        return db.query(Lab).filter(Lab.user_id == user_id).all()
+    def list_user_labs(self, db: Session, user_id: int, limit: int, sort: str = "created_at", order: str = "desc",
+                       after: Optional[List[Any]] = None, statuses: Optional[List[str]] = None,
+                       created_after: datetime = None, created_before: datetime = None,
+                       expires_after: datetime = None, expires_before: datetime = None) -> Tuple[List[Lab], bool]:
+        """One keyset page of a user's labs, walking the (user_id, sort column, id) index; returns labs and whether more follow"""
+        column = getattr(Lab, sort)
+        query = db.query(Lab).filter(Lab.user_id == user_id)
+        if statuses:
+            query = query.filter(Lab.status.in_(statuses))
+        if created_after:
+            query = query.filter(Lab.created_at >= created_after)
+        if created_before:
+            query = query.filter(Lab.created_at < created_before)
+        if expires_after:
+            query = query.filter(Lab.expires_at >= expires_after)
+        if expires_before:
+            query = query.filter(Lab.expires_at < expires_before)
+        if after:
+            value = after[0] if sort == "name" else datetime.fromisoformat(after[0])
+            if order == "desc":
+                query = query.filter(or_(column < value, and_(column == value, Lab.id < after[1])))
+            else:
+                query = query.filter(or_(column > value, and_(column == value, Lab.id > after[1])))
+        if order == "desc":
+            query = query.order_by(column.desc(), Lab.id.desc())
+        else:
+            query = query.order_by(column.asc(), Lab.id.asc())
+        labs = query.limit(limit + 1).all()
+        return labs[:limit], len(labs) > limit
 
     def get_lab(self, db: Session, lab_id: int):
         """Get a specific lab"""
         return db.query(Lab).filter(Lab.id == lab_id).first()
 
-    def get_templates(self, db: Session):
-        """Get all lab templates"""
-        return db.query(LabTemplate).all()
-
     async def extend_lab(self, db: Session, lab_id: int, additional_hours: int):
         """Extend lab duration"""
         lab = db.query(Lab).filter(Lab.id == lab_id).first()
@@ -1,48 +1,55 @@
-from fastapi import FastAPI, Depends, HTTPException, Query
+from fastapi import FastAPI, Depends, HTTPException, Query, Header
+from fastapi.responses import StreamingResponse, Response
+from responses import OrjsonResponse
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, List
 from datetime import datetime
-from database import get_database, engine, Base
-from models import Lab, LabTemplate
-from lab_service import LabService
+from database import get_database, engine, SessionLocal, ensure_schema, database_ready
+from models import Lab
+from template_seed import seed_templates
+from pagination import encode_cursor, decode_cursor, InvalidCursor, PAGE_DEFAULT_LIMIT, PAGE_MAX_LIMIT
+from lab_service import LabService, catalog
 from scheduler import scheduler
+from metrics import setup_metrics, startup_phase
+from log_config import setup_logging
+from tracing import setup_tracing
+from resilience import upstream_health, degraded
+from reconciler import reconciler
+import asyncio
 import uvicorn
 import logging
-import sys
+import json
+import time
+import os
+
+STARTED = time.perf_counter()
 
 # Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+setup_logging("lab-manager")
 logger = logging.getLogger(__name__)
 
-# Create tables
-try:
-    Base.metadata.create_all(bind=engine)
-    logger.info("Database tables created successfully")
-except Exception as e:
-    logger.error(f"Failed to create database tables: {e}")
-    raise
+BULK_MAX_PARALLELISM = int(os.getenv("BULK_MAX_PARALLELISM", "16"))
+
+database_prepared = False
 
-app = FastAPI(title="Lab Manager", version="1.0.0")
+app = FastAPI(title="Lab Manager", version="1.0.0", default_response_class=OrjsonResponse)
+setup_metrics(app, "lab-manager", engine=engine)
+setup_tracing(app, "lab-manager", engine=engine, httpx_client=True)
 lab_service = LabService()
 
 logger.info("Lab Manager starting up...")
 
 class LabCreate(BaseModel):
     name: str
-    template_id: int
+    template_id: str
     duration_hours: Optional[int] = None
+    persistent: bool = False
 
 class LabResponse(BaseModel):
     id: int
     user_id: int
-    container_id: Optional[int]
+    container_id: Optional[str]
     name: str
     expires_at: datetime
     persistent: bool
@@ -51,12 +58,20 @@ class LabResponse(BaseModel):
     class Config:
         from_attributes = True
 
-class TemplateResponse(BaseModel):
-    id: int
-    name: str
-    description: Optional[str]
-    image: str
-    default_duration_hours: int
+class LabPage(BaseModel):
+    data: List[LabResponse]
+    next_cursor: Optional[str] = None
+
+LAB_SORT_FIELDS = ("created_at", "expires_at", "name")
+
+class BulkLabRequest(BaseModel):
+    action: str  # delete or extend
+    user_id: Optional[int] = None
+    lab_ids: Optional[List[int]] = None
+    status: Optional[str] = None
+    created_before: Optional[datetime] = None
+    additional_hours: Optional[int] = None
+    parallelism: int = 8
 
 @app.post("/labs", response_model=LabResponse)
 async def create_lab(lab_data: LabCreate, user_id: int = Query(...), db: Session = Depends(get_database)):
@@ -67,7 +82,8 @@ async def create_lab(lab_data: LabCreate, user_id: int = Query(...), db: Session
             user_id=user_id,
             name=lab_data.name,
             template_id=lab_data.template_id,
-            duration_hours=lab_data.duration_hours
+            duration_hours=lab_data.duration_hours,
+            persistent=lab_data.persistent
         )
         logger.info(f"Lab created successfully: {lab.id}")
         return lab
@@ -75,10 +91,26 @@ async def create_lab(lab_data: LabCreate, user_id: int = Query(...), db: Session
         logger.error(f"Failed to create lab: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/labs/user/{user_id}", response_model=list[LabResponse])
-def get_user_labs(user_id: int, db: Session = Depends(get_database)):
-    labs = lab_service.get_user_labs(db, user_id)
-    return labs
+@app.get("/labs/user/{user_id}", response_model=LabPage)
+def get_user_labs(user_id: int, status: Optional[List[str]] = Query(None),
+                  created_after: Optional[datetime] = None, created_before: Optional[datetime] = None,
+                  expires_after: Optional[datetime] = None, expires_before: Optional[datetime] = None,
+                  sort: str = "created_at", order: str = "desc",
+                  limit: int = Query(PAGE_DEFAULT_LIMIT, ge=1, le=PAGE_MAX_LIMIT), cursor: Optional[str] = None,
+                  db: Session = Depends(get_database)):
+    """One page of a user's labs, newest first by default"""
+    if sort not in LAB_SORT_FIELDS or order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail=f"sort must be one of {', '.join(LAB_SORT_FIELDS)} and order asc or desc")
+    try:
+        after = decode_cursor(cursor, sort, order) if cursor else None
+        labs, more = lab_service.list_user_labs(
+            db, user_id, limit, sort, order, after, status,
+            created_after, created_before, expires_after, expires_before
+        )
+    except (InvalidCursor, ValueError, IndexError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {e}")
+    next_cursor = encode_cursor(sort, order, (getattr(labs[-1], sort), labs[-1].id)) if more else None
+    return {"data": labs, "next_cursor": next_cursor}
 
 @app.get("/labs/{lab_id}", response_model=LabResponse)
 def get_lab(lab_id: int, db: Session = Depends(get_database)):
@@ -103,95 +135,130 @@ async def terminate_lab(lab_id: int, db: Session = Depends(get_database)):
     else:
         raise HTTPException(status_code=404, detail="Lab not found")
 
-@app.get("/templates", response_model=list[TemplateResponse])
-def get_templates(db: Session = Depends(get_database)):
-    return lab_service.get_templates(db)
+@app.post("/labs/bulk")
+def bulk_labs(bulk_data: BulkLabRequest, db: Session = Depends(get_database)):
+    """Terminate or extend every live lab matching a selector; streams one NDJSON result per lab"""
+    if bulk_data.action not in ("delete", "extend"):
+        raise HTTPException(status_code=400, detail=f"Unknown action '{bulk_data.action}'")
+    if bulk_data.action == "extend" and not bulk_data.additional_hours:
+        raise HTTPException(status_code=400, detail="extend needs additional_hours")
+    if not (bulk_data.user_id or bulk_data.lab_ids or bulk_data.status or bulk_data.created_before):
+        raise HTTPException(status_code=400, detail="Selector must have at least one criterion")
+
+    # Expired labs never match, so re-sending an interrupted delete resumes it
+    query = db.query(Lab.id, Lab.name, Lab.user_id).filter(Lab.status != "expired")
+    if bulk_data.user_id:
+        query = query.filter(Lab.user_id == bulk_data.user_id)
+    if bulk_data.lab_ids:
+        query = query.filter(Lab.id.in_(bulk_data.lab_ids))
+    if bulk_data.status:
+        query = query.filter(Lab.status == bulk_data.status)
+    if bulk_data.created_before:
+        query = query.filter(Lab.created_at < bulk_data.created_before)
+    labs = query.all()
+    parallelism = max(1, min(bulk_data.parallelism, BULK_MAX_PARALLELISM))
+
+    async def apply(lab, semaphore):
+        result = {"lab_id": lab.id, "name": lab.name, "user_id": lab.user_id, "action": bulk_data.action}
+        async with semaphore:
+            # Each lab gets its own session so one failure cannot roll back another
+            session = SessionLocal()
+            try:
+                if bulk_data.action == "delete":
+                    done = await lab_service.expire_lab(session, lab.id)
+                else:
+                    done = await lab_service.extend_lab(session, lab.id, bulk_data.additional_hours)
+                return {**result, "status": "ok" if done else "skipped"}
+            except Exception as e:
+                return {**result, "status": "error", "detail": str(e)}
+            finally:
+                session.close()
+
+    async def stream():
+        semaphore = asyncio.Semaphore(parallelism)
+        counts = {"ok": 0, "skipped": 0, "error": 0}
+        tasks = [asyncio.ensure_future(apply(lab, semaphore)) for lab in labs]
+        try:
+            for task in asyncio.as_completed(tasks):
+                result = await task
+                counts[result["status"]] += 1
+                yield json.dumps(result) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+        logger.info(f"Bulk {bulk_data.action} of {len(labs)} labs: {counts}")
+        yield json.dumps({"summary": {"action": bulk_data.action, "selected": len(labs), **counts}}) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@app.get("/templates")
+def get_templates(if_none_match: Optional[str] = Header(None)):
+    """Lab templates, served from the catalog's pre-serialized body"""
+    snapshot = catalog.snapshot
+    headers = {"ETag": snapshot.etag, "X-Template-Catalog-Version": str(snapshot.version)}
+    if if_none_match == snapshot.etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=snapshot.body, media_type="application/json", headers=headers)
+
+@app.get("/reconcile")
+def get_reconcile_status():
+    """Outcome of the last reconciliation pass between lab rows and Docker"""
+    return {"data": reconciler.status()}
 
 @app.get("/health")
 def health_check():
-    return {"status": "healthy"}
+    return {"status": "degraded" if degraded() else "healthy", "upstreams": upstream_health()}
+
+@app.get("/health/live")
+def liveness_check():
+    """The process is up and serving; never touches dependencies"""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+def readiness_check():
+    """Ready once the database answers, tables exist and templates are seeded"""
+    if not (database_ready() and prepare_database()):
+        return OrjsonResponse(status_code=503, content={"status": "not ready", "database": False})
+    return {"status": "ready", "database": True}
+
+def prepare_database() -> bool:
+    """Create tables and seed templates; safe to repeat until it succeeds"""
+    global database_prepared
+    if database_prepared:
+        return True
+    with startup_phase("lab-manager", "schema"):
+        if not ensure_schema():
+            return False
+    db = SessionLocal()
+    try:
+        with startup_phase("lab-manager", "template_seed"):
+            if not seed_templates(db, catalog.snapshot.manifest):
+                logger.info("Lab templates already at manifest version")
+    except Exception as e:
+        logger.warning(f"Template seeding failed, retrying on next readiness check: {e}")
+        return False
+    finally:
+        db.close()
+    database_prepared = True
+    return True
+
+def mirror_templates(snapshot):
+    """Catalog change notification: bring lab_templates up to the new version"""
+    db = SessionLocal()
+    try:
+        seed_templates(db, snapshot.manifest)
+    finally:
+        db.close()
+
+catalog.subscribe(mirror_templates)
 
-# Initialize default templates
 @app.on_event("startup")
 async def startup_event():
-    # Start the scheduler
-    scheduler.start()
-    
-    # Add default templates if none exist, or update if we have the old basic set
-    db = next(get_database())
-    
-    # Check if we have the old basic template set (3 templates)
-    template_count = db.query(LabTemplate).count()
-    has_old_templates = (template_count == 3 and 
-                        db.query(LabTemplate).filter(LabTemplate.name.in_(["Ubuntu Lab", "Python Lab", "Node.js Lab"])).count() == 3)
-    
-    if template_count == 0 or has_old_templates:
-        # Clear old templates if they exist
-        if has_old_templates:
-            db.query(LabTemplate).delete()
-            db.commit()
-            
-        default_templates = [
-            # Popular Linux Distributions
-            LabTemplate(name="Ubuntu 22.04", description="Ubuntu 22.04 LTS (Jammy Jellyfish)", image="ubuntu:22.04", default_duration_hours=2),
-            LabTemplate(name="Ubuntu 20.04", description="Ubuntu 20.04 LTS (Focal Fossa)", image="ubuntu:20.04", default_duration_hours=2),
-            LabTemplate(name="Ubuntu Latest", description="Latest Ubuntu release", image="ubuntu:latest", default_duration_hours=2),
-            LabTemplate(name="Debian 12", description="Debian 12 (Bookworm)", image="debian:12", default_duration_hours=2),
-            LabTemplate(name="Debian 11", description="Debian 11 (Bullseye)", image="debian:11", default_duration_hours=2),
-            LabTemplate(name="CentOS 7", description="CentOS 7 Linux", image="centos:7", default_duration_hours=2),
-            LabTemplate(name="AlmaLinux 9", description="AlmaLinux 9 (CentOS successor)", image="almalinux:9", default_duration_hours=2),
-            LabTemplate(name="AlmaLinux 8", description="AlmaLinux 8 (CentOS successor)", image="almalinux:8", default_duration_hours=2),
-            LabTemplate(name="Rocky Linux 9", description="Rocky Linux 9 (CentOS alternative)", image="rockylinux:9", default_duration_hours=2),
-            LabTemplate(name="Rocky Linux 8", description="Rocky Linux 8 (CentOS alternative)", image="rockylinux:8", default_duration_hours=2),
-            LabTemplate(name="Fedora 39", description="Fedora 39 Linux", image="fedora:39", default_duration_hours=2),
-            LabTemplate(name="Fedora 38", description="Fedora 38 Linux", image="fedora:38", default_duration_hours=2),
-            LabTemplate(name="Alpine Linux", description="Lightweight Alpine Linux", image="alpine:latest", default_duration_hours=1),
-            LabTemplate(name="Arch Linux", description="Arch Linux rolling release", image="archlinux:latest", default_duration_hours=2),
-            LabTemplate(name="openSUSE Leap", description="openSUSE Leap stable release", image="opensuse/leap:latest", default_duration_hours=2),
-            LabTemplate(name="openSUSE Tumbleweed", description="openSUSE Tumbleweed rolling release", image="opensuse/tumbleweed:latest", default_duration_hours=2),
-            LabTemplate(name="Kali Linux", description="Kali Linux for penetration testing", image="kalilinux/kali-rolling:latest", default_duration_hours=3),
-            LabTemplate(name="Amazon Linux 2", description="Amazon Linux 2", image="amazonlinux:2", default_duration_hours=2),
-            LabTemplate(name="Amazon Linux 2023", description="Amazon Linux 2023", image="amazonlinux:2023", default_duration_hours=2),
-            LabTemplate(name="Oracle Linux 9", description="Oracle Linux 9", image="oraclelinux:9", default_duration_hours=2),
-            LabTemplate(name="Oracle Linux 8", description="Oracle Linux 8", image="oraclelinux:8", default_duration_hours=2),
-            
-            # Development Environments
-            LabTemplate(name="Python 3.12", description="Python 3.12 development environment", image="python:3.12", default_duration_hours=2),
-            LabTemplate(name="Python 3.11", description="Python 3.11 development environment", image="python:3.11", default_duration_hours=2),
-            LabTemplate(name="Python 3.10", description="Python 3.10 development environment", image="python:3.10", default_duration_hours=2),
-            LabTemplate(name="Node.js 20", description="Node.js 20 LTS development environment", image="node:20", default_duration_hours=2),
-            LabTemplate(name="Node.js 18", description="Node.js 18 LTS development environment", image="node:18", default_duration_hours=2),
-            LabTemplate(name="Java 21", description="OpenJDK 21 development environment", image="openjdk:21", default_duration_hours=2),
-            LabTemplate(name="Java 17", description="OpenJDK 17 LTS development environment", image="openjdk:17", default_duration_hours=2),
-            LabTemplate(name="Java 11", description="OpenJDK 11 LTS development environment", image="openjdk:11", default_duration_hours=2),
-            LabTemplate(name="Go Latest", description="Go programming language latest", image="golang:latest", default_duration_hours=2),
-            LabTemplate(name="Rust Latest", description="Rust programming language", image="rust:latest", default_duration_hours=2),
-            LabTemplate(name="PHP 8.3", description="PHP 8.3 development environment", image="php:8.3", default_duration_hours=2),
-            LabTemplate(name="PHP 8.2", description="PHP 8.2 development environment", image="php:8.2", default_duration_hours=2),
-            LabTemplate(name="Ruby 3.3", description="Ruby 3.3 development environment", image="ruby:3.3", default_duration_hours=2),
-            LabTemplate(name="Ruby 3.2", description="Ruby 3.2 development environment", image="ruby:3.2", default_duration_hours=2),
-            
-            # Databases
-            LabTemplate(name="MySQL 8.0", description="MySQL 8.0 database server", image="mysql:8.0", default_duration_hours=2),
-            LabTemplate(name="PostgreSQL 16", description="PostgreSQL 16 database server", image="postgres:16", default_duration_hours=2),
-            LabTemplate(name="PostgreSQL 15", description="PostgreSQL 15 database server", image="postgres:15", default_duration_hours=2),
-            LabTemplate(name="MongoDB 7", description="MongoDB 7 NoSQL database", image="mongo:7", default_duration_hours=2),
-            LabTemplate(name="Redis 7", description="Redis 7 in-memory database", image="redis:7", default_duration_hours=1),
-            
-            # Web Servers
-            LabTemplate(name="Nginx", description="Nginx web server", image="nginx:latest", default_duration_hours=1),
-            LabTemplate(name="Apache", description="Apache HTTP server", image="httpd:latest", default_duration_hours=1),
-            
-            # Specialized Tools
-            LabTemplate(name="Docker in Docker", description="Docker-in-Docker for container development", image="docker:dind", default_duration_hours=3),
-            LabTemplate(name="Ansible", description="Ansible automation platform", image="ansible/ansible:latest", default_duration_hours=2),
-            LabTemplate(name="Terraform", description="Terraform infrastructure as code", image="hashicorp/terraform:latest", default_duration_hours=2),
-        ]
-        for template in default_templates:
-            db.add(template)
-        db.commit()
-    
-    db.close()
+    with startup_phase("lab-manager", "scheduler"):
+        scheduler.start()
+    # The database may come up after us; readiness checks keep retrying
+    await asyncio.to_thread(prepare_database)
+    logger.info(f"Lab Manager started in {time.perf_counter() - STARTED:.2f}s")
 
 @app.on_event("shutdown")
 async def shutdown_event():
@@ -1,19 +1,37 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Index, inspect, text
 from sqlalchemy.sql import func
-from database import Base
+from database import Base, schema_migrations
 
 class Lab(Base):
     __tablename__ = "labs"
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, nullable=False)
-    container_id = Column(Integer, nullable=True)
+    container_id = Column(String, nullable=True)  # Docker container ID
     name = Column(String, nullable=False)
     expires_at = Column(DateTime(timezone=True), nullable=False)
     persistent = Column(Boolean, default=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     status = Column(String, nullable=False, default="creating")  # creating, running, stopped, expired
 
+    # One per sort order of a user's lab listing; id breaks ties for keyset pagination
+    __table_args__ = (
+        Index("ix_labs_user_created", "user_id", "created_at", "id"),
+        Index("ix_labs_user_expires", "user_id", "expires_at", "id"),
+        Index("ix_labs_user_name", "user_id", "name", "id"),
+    )
+
+def _container_id_as_string(connection):
+    """labs.container_id used to be an Integer column, which can't hold Docker IDs"""
+    # SQLite stores what it is given whatever the declared type; its databases are local and throwaway
+    if connection.dialect.name != "postgresql":
+        return
+    columns = {column["name"]: column for column in inspect(connection).get_columns("labs")}
+    if not isinstance(columns["container_id"]["type"], String):
+        connection.execute(text("ALTER TABLE labs ALTER COLUMN container_id TYPE VARCHAR USING container_id::varchar"))
+
+schema_migrations.append(_container_id_as_string)
+
 class LabTemplate(Base):
     __tablename__ = "lab_templates"
 
@@ -32,3 +50,10 @@ class ScheduledTask(Base):
     execute_at = Column(DateTime(timezone=True), nullable=False)
     status = Column(String, default="pending")  # pending, completed, failed
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class SeedVersion(Base):
+    __tablename__ = "seed_versions"
+
+    name = Column(String, primary_key=True)  # e.g. lab_templates
+    version = Column(Integer, nullable=False)
+    applied_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
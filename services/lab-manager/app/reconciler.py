@@ -0,0 +1,238 @@
+from sqlalchemy import and_, or_, func
+from sqlalchemy.orm import Session
+from typing import List, Dict, Any, Tuple
+from datetime import datetime, timedelta
+from database import SessionLocal
+from models import Lab
+from metrics import BACKGROUND_EVENTS
+from resilience import get_upstream
+from lab_service import LabService
+import asyncio
+import logging
+import httpx
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+CONTAINER_SERVICE_URL = os.getenv("CONTAINER_SERVICE_URL", "http://container-manager:8003")
+RECONCILE_INTERVAL_SECONDS = int(os.getenv("RECONCILE_INTERVAL_SECONDS", "60"))
+# Every Nth pass re-checks all labs, not just the ones that changed
+RECONCILE_FULL_EVERY = int(os.getenv("RECONCILE_FULL_EVERY", "10"))
+RECONCILE_BATCH_SIZE = int(os.getenv("RECONCILE_BATCH_SIZE", "500"))
+RECONCILE_DELETE_CONCURRENCY = int(os.getenv("RECONCILE_DELETE_CONCURRENCY", "4"))
+# Safety valve: orphans removed per pass
+RECONCILE_MAX_DELETES = int(os.getenv("RECONCILE_MAX_DELETES", "50"))
+# Labs still "creating" this long after creation are not yet expected to have a container
+RECONCILE_CREATE_GRACE_SECONDS = int(os.getenv("RECONCILE_CREATE_GRACE_SECONDS", "300"))
+# Containers with no lab row: "adopt" (track and schedule expiry), "remove" or "ignore"
+RECONCILE_UNTRACKED = os.getenv("RECONCILE_UNTRACKED", "adopt")
+
+# Labs that are over; a container left behind by an expired lab is an orphan
+ENDED_STATUSES = ("expired", "error")
+DOCKER_TO_LAB_STATUS = {"running": "running", "paused": "running", "restarting": "running",
+                        "created": "stopped", "exited": "stopped", "dead": "stopped", "removing": "stopped"}
+
+Key = Tuple[str, str]
+
+
+class Reconciler:
+    """Brings lab rows and Docker containers back in line, matching them by (user_id, name).
+
+    Each pass takes one inventory of all lab containers and a projection of live lab rows,
+    diffs both against the previous pass and only examines labs whose container or row
+    changed since, so a quiet system costs two reads per pass. Fixes are applied in
+    batches: rows without a container are marked missing, row statuses follow their
+    container, containers left behind by expired labs are removed and untracked
+    containers are adopted.
+    """
+
+    def __init__(self, container_service_url: str = CONTAINER_SERVICE_URL):
+        self.container_service_url = container_service_url
+        self.container_service = get_upstream("lab-manager", "container-manager")
+        self._containers: Dict[Key, Tuple[str, str]] = {}
+        self._labs: Dict[Key, Tuple] = {}
+        self.passes = 0
+        self.last_pass: Dict[str, Any] = {}
+
+    def run(self):
+        """Scheduler entry point"""
+        db = SessionLocal()
+        try:
+            asyncio.run(self.reconcile(db))
+        except Exception as e:
+            logger.error(f"Reconciliation pass failed: {e}")
+        finally:
+            db.close()
+
+    async def reconcile(self, db: Session) -> Dict[str, Any]:
+        started = time.perf_counter()
+        async with httpx.AsyncClient() as client:
+            response = await self.container_service.request(
+                client, "GET", f"{self.container_service_url}/labs/inventory"
+            )
+            response.raise_for_status()
+            inventory = response.json()
+
+            containers: Dict[Key, Dict[str, Any]] = {}
+            for container in inventory["data"]:
+                containers.setdefault((container["user_id"], container["name"]), container)
+            labs: Dict[Key, List] = {}
+            for row in db.query(Lab.id, Lab.user_id, Lab.name, Lab.status, Lab.created_at).filter(
+                    ~Lab.status.in_(ENDED_STATUSES)):
+                labs.setdefault((str(row.user_id), row.name), []).append(row)
+
+            current_containers = {key: (c["container_id"], c["status"]) for key, c in containers.items()}
+            current_labs = {key: tuple(sorted((row.id, row.status) for row in rows)) for key, rows in labs.items()}
+            full = self.passes % RECONCILE_FULL_EVERY == 0
+            if full:
+                changed = set(current_containers) | set(current_labs)
+            else:
+                changed = {key for key in set(current_containers) | set(self._containers)
+                           if current_containers.get(key) != self._containers.get(key)}
+                changed |= {key for key in set(current_labs) | set(self._labs)
+                            if current_labs.get(key) != self._labs.get(key)}
+
+            updates: Dict[str, List[int]] = {}
+            unmatched: List[Dict[str, Any]] = []
+            grace_cutoff = datetime.utcnow() - timedelta(seconds=RECONCILE_CREATE_GRACE_SECONDS)
+            for key in changed:
+                container = containers.get(key)
+                rows = labs.get(key, [])
+                if container:
+                    if not rows:
+                        unmatched.append(container)
+                        continue
+                    status = DOCKER_TO_LAB_STATUS.get(container["status"], "stopped")
+                    for row in rows:
+                        if row.status != status:
+                            updates.setdefault(status, []).append(row.id)
+                elif inventory.get("complete"):
+                    for row in rows:
+                        created_at = row.created_at.replace(tzinfo=None) if row.created_at else None
+                        if row.status == "creating" and created_at and created_at > grace_cutoff:
+                            continue
+                        if row.status != "missing":
+                            updates.setdefault("missing", []).append(row.id)
+
+            for status, lab_ids in updates.items():
+                self._update_status(db, lab_ids, status)
+
+            orphans, untracked = self._split_unmatched(db, unmatched)
+            to_remove = orphans + (untracked if RECONCILE_UNTRACKED == "remove" else [])
+            failed = await self._remove(client, to_remove)
+            adopted = self._adopt(db, untracked) if RECONCILE_UNTRACKED == "adopt" else 0
+
+        # Anything not fixed this pass looks changed on the next one
+        for container in failed:
+            current_containers.pop((container["user_id"], container["name"]), None)
+        self._containers = current_containers
+        self._labs = current_labs
+        self.passes += 1
+
+        self.last_pass = {
+            "at": datetime.utcnow().isoformat(),
+            "full": full,
+            "containers": len(containers),
+            "labs": sum(len(rows) for rows in labs.values()),
+            "examined": len(changed),
+            "status_updates": {status: len(lab_ids) for status, lab_ids in updates.items()},
+            "removed": len(to_remove) - len(failed),
+            "adopted": adopted,
+            "inventory_complete": bool(inventory.get("complete")),
+            "duration_ms": round((time.perf_counter() - started) * 1000, 1)
+        }
+        if updates or to_remove or adopted:
+            logger.info(f"Reconciliation: {self.last_pass}")
+        return self.last_pass
+
+    def _update_status(self, db: Session, lab_ids: List[int], status: str):
+        for start in range(0, len(lab_ids), RECONCILE_BATCH_SIZE):
+            batch = lab_ids[start:start + RECONCILE_BATCH_SIZE]
+            db.query(Lab).filter(Lab.id.in_(batch)).update({Lab.status: status}, synchronize_session=False)
+            db.commit()
+        BACKGROUND_EVENTS.labels("lab-manager", f"reconcile_{status}").inc(len(lab_ids))
+
+    def _split_unmatched(self, db: Session, unmatched: List[Dict[str, Any]]):
+        """Containers without a live row: orphans if created before a matching lab expired, otherwise untracked"""
+        expired: Dict[Key, datetime] = {}
+        for start in range(0, len(unmatched), RECONCILE_BATCH_SIZE):
+            batch = [c for c in unmatched[start:start + RECONCILE_BATCH_SIZE] if c["user_id"].isdigit()]
+            if not batch:
+                continue
+            rows = db.query(Lab.user_id, Lab.name, func.max(Lab.expires_at)).filter(
+                Lab.status == "expired",
+                or_(*(and_(Lab.user_id == int(c["user_id"]), Lab.name == c["name"]) for c in batch))
+            ).group_by(Lab.user_id, Lab.name)
+            for user_id, name, expires_at in rows:
+                expired[(str(user_id), name)] = expires_at.replace(tzinfo=None)
+
+        orphans, untracked = [], []
+        for container in unmatched:
+            expires_at = expired.get((container["user_id"], container["name"]))
+            try:
+                created_at = datetime.fromisoformat(container["created_at"]).replace(tzinfo=None)
+            except ValueError:
+                created_at = None
+            # A container created after the lab expired belongs to a newer lab of the same name
+            if expires_at and created_at and created_at <= expires_at:
+                orphans.append(container)
+            else:
+                untracked.append(container)
+        return orphans, untracked
+
+    async def _remove(self, client: httpx.AsyncClient, containers: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Remove containers with bounded concurrency; returns the ones that could not be removed"""
+        semaphore = asyncio.Semaphore(RECONCILE_DELETE_CONCURRENCY)
+        failed = list(containers[RECONCILE_MAX_DELETES:])
+
+        async def remove(container):
+            async with semaphore:
+                try:
+                    response = await self.container_service.request(
+                        client, "DELETE", f"{self.container_service_url}/delete-lab/{container['container_id']}",
+                        timeout=60
+                    )
+                    response.raise_for_status()
+                    BACKGROUND_EVENTS.labels("lab-manager", "reconcile_orphan_removed").inc()
+                    logger.info(f"Removed orphaned container {container['container_id']} ({container['name']})")
+                except Exception as e:
+                    failed.append(container)
+                    logger.warning(f"Failed to remove orphaned container {container['container_id']}: {e}")
+
+        await asyncio.gather(*(remove(container) for container in containers[:RECONCILE_MAX_DELETES]))
+        return failed
+
+    def _adopt(self, db: Session, containers: List[Dict[str, Any]]) -> int:
+        """Track containers created outside lab-manager so they get expiry like any other lab"""
+        lab_service = LabService()
+        adopted = 0
+        for container in containers:
+            # lab-manager keys labs by numeric user ID
+            if not container["user_id"].isdigit():
+                continue
+            try:
+                created_at = datetime.fromisoformat(container["created_at"])
+            except ValueError:
+                created_at = datetime.utcnow()
+            hours = int(container["duration_hours"]) if container["duration_hours"].isdigit() else 24
+            lab = Lab(
+                user_id=int(container["user_id"]),
+                name=container["name"],
+                expires_at=created_at + timedelta(hours=hours),
+                persistent=container["persistent"],
+                status=DOCKER_TO_LAB_STATUS.get(container["status"], "stopped")
+            )
+            db.add(lab)
+            db.flush()
+            lab_service.schedule_lab_expiry(db, lab.id, lab.expires_at)
+            adopted += 1
+        if adopted:
+            BACKGROUND_EVENTS.labels("lab-manager", "reconcile_adopted").inc(adopted)
+        return adopted
+
+    def status(self) -> Dict[str, Any]:
+        return {"passes": self.passes, "last_pass": self.last_pass}
+
+
+reconciler = Reconciler()
@@ -1,14 +1,16 @@
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.interval import IntervalTrigger
 from sqlalchemy.orm import Session
-from datetime import datetime
+from datetime import datetime, timezone
 from database import SessionLocal
 from models import ScheduledTask, Lab
 from lab_service import LabService
+from metrics import SCHEDULER_LAG
+from resilience import UpstreamUnavailable
+from reconciler import reconciler, RECONCILE_INTERVAL_SECONDS
 import asyncio
 import logging
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class Scheduler:
@@ -25,6 +27,16 @@ class Scheduler:
             id='check_expired_labs',
             name='Check for expired labs'
         )
+
+        if RECONCILE_INTERVAL_SECONDS > 0:
+            self.scheduler.add_job(
+                func=reconciler.run,
+                trigger=IntervalTrigger(seconds=RECONCILE_INTERVAL_SECONDS),
+                id='reconcile_labs',
+                name='Reconcile labs with Docker',
+                max_instances=1,
+                coalesce=True
+            )
         
         self.scheduler.start()
         logger.info("Scheduler started")
@@ -47,11 +59,19 @@ class Scheduler:
             ).all()
 
             for task in tasks:
+                # Aware values are converted rather than stripped; naive ones (SQLite) were written as UTC
+                execute_at = (task.execute_at.astimezone(timezone.utc) if task.execute_at.tzinfo
+                              else task.execute_at.replace(tzinfo=timezone.utc))
+                lag = (datetime.now(timezone.utc) - execute_at).total_seconds()
+                SCHEDULER_LAG.labels("lab-manager", task.task_type).observe(max(0.0, lag))
                 try:
                     # Run the expiry task
                     asyncio.run(self.lab_service.expire_lab(db, task.target_id))
                     task.status = "completed"
                     logger.info(f"Expired lab {task.target_id}")
+                except UpstreamUnavailable as e:
+                    # Stays pending and is picked up again on the next pass
+                    logger.warning(f"Deferring expiry of lab {task.target_id}: {e}")
                 except Exception as e:
                     task.status = "failed"
                     logger.error(f"Failed to expire lab {task.target_id}: {e}")
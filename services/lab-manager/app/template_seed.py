@@ -0,0 +1,73 @@
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from typing import Dict, Any
+from models import LabTemplate, SeedVersion
+from template_catalog import TEMPLATE_MANIFEST
+import logging
+import json
+
+logger = logging.getLogger(__name__)
+
+SEED_NAME = "lab_templates"
+FIELDS = ("description", "image", "default_duration_hours")
+
+
+def load_manifest(path: str = TEMPLATE_MANIFEST) -> Dict[str, Any]:
+    with open(path) as f:
+        return json.load(f)
+
+
+def seed_templates(db: Session, manifest: Dict[str, Any] = None) -> bool:
+    """Mirror the template manifest into lab_templates; returns False when already at its version.
+
+    Templates are matched by name, so existing rows keep their IDs. New names are
+    inserted and changed rows updated in one bulk statement each, and names no longer
+    in the manifest are removed. The version row is locked for the duration, so only
+    one replica seeds a given version.
+    """
+    manifest = manifest or load_manifest()
+    version = int(manifest["version"])
+
+    # Every starting replica reads this row; only a version bump does more
+    current = db.query(SeedVersion.version).filter(SeedVersion.name == SEED_NAME).scalar()
+    if current is not None and current >= version:
+        return False
+
+    if current is None:
+        try:
+            db.add(SeedVersion(name=SEED_NAME, version=0))
+            db.commit()
+        except IntegrityError:
+            # Another replica created it first
+            db.rollback()
+    seed = db.query(SeedVersion).filter(SeedVersion.name == SEED_NAME).with_for_update().one()
+    if seed.version >= version:
+        db.rollback()
+        return False
+
+    templates = {template["name"]: template for template in manifest["templates"]}
+    existing = {row.name: row for row in db.query(LabTemplate.id, LabTemplate.name, *(getattr(LabTemplate, field) for field in FIELDS))}
+
+    inserts = [
+        {"name": name, **{field: template.get(field) for field in FIELDS}}
+        for name, template in templates.items() if name not in existing
+    ]
+    updates = [
+        {"id": row.id, **{field: templates[name].get(field) for field in FIELDS}}
+        for name, row in existing.items()
+        if name in templates and any(getattr(row, field) != templates[name].get(field) for field in FIELDS)
+    ]
+    removed = [row.id for name, row in existing.items() if name not in templates]
+
+    if inserts:
+        db.bulk_insert_mappings(LabTemplate, inserts)
+    if updates:
+        db.bulk_update_mappings(LabTemplate, updates)
+    if removed:
+        db.query(LabTemplate).filter(LabTemplate.id.in_(removed)).delete(synchronize_session=False)
+    seed.version = version
+    db.commit()
+
+    logger.info(f"Seeded lab templates to version {version}: "
+                f"{len(inserts)} added, {len(updates)} updated, {len(removed)} removed")
+    return True
@@ -0,0 +1,146 @@
+from logging.handlers import QueueHandler, QueueListener
+from opentelemetry import trace
+from datetime import datetime, timezone
+import logging
+import random
+import atexit
+import queue
+import json
+import sys
+import os
+
+# Shared logging setup, copied into every service image.
+
+# Root level, plus per-logger overrides such as "routes=WARNING,httpx=WARNING"
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = os.getenv("LOG_LEVELS", "httpx=WARNING,httpcore=WARNING")
+# "json" (default) or "text"
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+# Fraction of records logged with extra=SAMPLED that are kept
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.01"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_MAX_BODY_BYTES = int(os.getenv("LOG_MAX_BODY_BYTES", "512"))
+
+# Pass as extra= on high-volume success paths
+SAMPLED = {"sampled": True}
+
+# Attributes every LogRecord has; anything else came in through extra=
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "sampled"}
+
+_listener = None
+dropped_records = 0
+
+
+def truncate_body(body) -> str:
+    """Render a request/response body for logs, capped at LOG_MAX_BODY_BYTES"""
+    if body is None:
+        return ""
+    if isinstance(body, str):
+        body = body.encode("utf-8", "replace")
+    text = body[:LOG_MAX_BODY_BYTES].decode("utf-8", "replace")
+    if len(body) > LOG_MAX_BODY_BYTES:
+        text += f"... ({len(body)} bytes)"
+    return text
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with the service name, trace ids and extra= fields"""
+
+    def __init__(self, service: str):
+        super().__init__()
+        self.service = service
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "service": self.service,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only LOG_SAMPLE_RATE of the records marked with extra=SAMPLED"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, "sampled", False) and record.levelno <= logging.INFO:
+            return random.random() < LOG_SAMPLE_RATE
+        return True
+
+
+class _SampleSuccessfulAccess(logging.Filter):
+    """Mark uvicorn access-log lines for non-error responses as sampled"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        args = record.args if isinstance(record.args, tuple) else ()
+        if len(args) >= 5 and isinstance(args[4], int) and args[4] < 400:
+            record.sampled = True
+        return True
+
+
+class AsyncQueueHandler(QueueHandler):
+    """Hand records to the writer thread without blocking; drop them when the queue is full"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Resolve anything that depends on the calling thread; formatting happens on the writer thread
+        record.msg = record.getMessage()
+        record.args = None
+        span_context = trace.get_current_span().get_span_context()
+        if span_context.is_valid:
+            record.trace_id = format(span_context.trace_id, "032x")
+            record.span_id = format(span_context.span_id, "016x")
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        global dropped_records
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            dropped_records += 1
+
+
+def _parse_levels(value: str):
+    for item in filter(None, value.split(",")):
+        name, _, level = item.partition("=")
+        yield name.strip(), level.strip().upper()
+
+
+def setup_logging(service: str):
+    """Route all logging through a bounded queue to a single stdout writer thread"""
+    global _listener
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    if LOG_FORMAT == "json":
+        stream_handler.setFormatter(JsonFormatter(service))
+    else:
+        stream_handler.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+
+    queue_handler = AsyncQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+    queue_handler.addFilter(SamplingFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(LOG_LEVEL)
+    # uvicorn installs its own synchronous handlers; send its records (access log included) through the queue
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers.clear()
+        uvicorn_logger.propagate = True
+    logging.getLogger("uvicorn.access").addFilter(_SampleSuccessfulAccess())
+    for name, level in _parse_levels(LOG_LEVELS):
+        logging.getLogger(name).setLevel(level)
+
+    _listener = QueueListener(queue_handler.queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
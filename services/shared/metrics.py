@@ -0,0 +1,208 @@
+from prometheus_client import Counter, Gauge, Histogram, CollectorRegistry, CONTENT_TYPE_LATEST, generate_latest, multiprocess
+from fastapi import FastAPI, Response
+from contextlib import contextmanager
+from functools import wraps
+import logging
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+# Shared instrumentation layer, copied into every service image.
+# Label values are always drawn from small fixed sets (route templates,
+# method names, status classes, upstream names) to keep cardinality bounded.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+KNOWN_METHODS = {"GET", "POST", "PUT", "PATCH", "DELETE", "HEAD", "OPTIONS"}
+
+HTTP_REQUEST_DURATION = Histogram(
+    "fluxlabs_http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["service", "method", "route", "status"],
+    buckets=LATENCY_BUCKETS
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    "fluxlabs_http_requests_in_flight",
+    "HTTP requests currently being served",
+    ["service"],
+    # Summed over live workers when PROMETHEUS_MULTIPROC_DIR is set
+    multiprocess_mode="livesum"
+)
+UPSTREAM_REQUEST_DURATION = Histogram(
+    "fluxlabs_upstream_request_duration_seconds",
+    "Latency of calls to other FluxLabs services",
+    ["service", "upstream", "method", "status"],
+    buckets=LATENCY_BUCKETS
+)
+DOCKER_API_DURATION = Histogram(
+    "fluxlabs_docker_api_duration_seconds",
+    "Latency of DockerClient operations",
+    ["operation", "outcome"],
+    buckets=LATENCY_BUCKETS
+)
+DB_POOL_CONNECTIONS = Gauge(
+    "fluxlabs_db_pool_connections",
+    "SQLAlchemy connection pool state",
+    ["service", "state"]
+)
+SCHEDULER_LAG = Histogram(
+    "fluxlabs_scheduler_lag_seconds",
+    "Delay between a task's execute_at and when it actually ran",
+    ["service", "task_type"],
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600)
+)
+BACKGROUND_EVENTS = Counter(
+    "fluxlabs_background_events_total",
+    "Background state transitions (idle suspend/resume, ...)",
+    ["service", "event"]
+)
+SERVICE_STATE = Gauge(
+    "fluxlabs_service_state",
+    "Service-specific state gauges (active exec sessions, suspended labs, ...)",
+    ["service", "name"]
+)
+RATE_LIMITED = Counter(
+    "fluxlabs_rate_limited_total",
+    "Requests rejected with 429 by route class and reason (rate or concurrency)",
+    ["service", "route_class", "reason"]
+)
+CIRCUIT_BREAKER_STATE = Gauge(
+    "fluxlabs_circuit_breaker_state",
+    "Upstream circuit breaker state (0 closed, 1 half-open, 2 open)",
+    ["service", "upstream"],
+    # Breakers are per worker; report the worst one
+    multiprocess_mode="livemax"
+)
+UPSTREAM_EVENTS = Counter(
+    "fluxlabs_upstream_events_total",
+    "Upstream call retries, exhausted retry budgets and short-circuited calls",
+    ["service", "upstream", "event"]
+)
+LAB_RESUME_DURATION = Histogram(
+    "fluxlabs_lab_resume_duration_seconds",
+    "Time to resume a suspended lab",
+    ["action"],
+    buckets=LATENCY_BUCKETS
+)
+
+STARTUP_PHASE_DURATION = Gauge(
+    "fluxlabs_startup_phase_seconds",
+    "Time spent in each startup phase of the most recent start",
+    ["service", "phase"],
+    multiprocess_mode="max"
+)
+
+
+def status_class(status_code: int) -> str:
+    return f"{status_code // 100}xx"
+
+
+class PrometheusMiddleware:
+    """ASGI middleware recording per-route latency and in-flight requests"""
+
+    def __init__(self, app, service: str):
+        self.app = app
+        self.service = service
+        self.in_flight = HTTP_REQUESTS_IN_FLIGHT.labels(service)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        self.in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.in_flight.dec()
+            # The router stores the matched route in the scope; use its template, never the raw path.
+            # Catch-all handlers that dispatch further can set scope["route_template"] instead.
+            route = scope.get("route")
+            method = scope["method"] if scope["method"] in KNOWN_METHODS else "OTHER"
+            HTTP_REQUEST_DURATION.labels(
+                self.service,
+                method,
+                scope.get("route_template") or getattr(route, "path", "unmatched"),
+                status_class(status["code"])
+            ).observe(time.perf_counter() - started)
+
+
+def observe_upstream(service: str, upstream: str, method: str, status_code: int, seconds: float):
+    """Record one call to another service; status_code 0 means a transport error"""
+    status = status_class(status_code) if status_code else "error"
+    UPSTREAM_REQUEST_DURATION.labels(service, upstream, method, status).observe(seconds)
+
+
+def observe_docker_call(func):
+    """Decorator timing a DockerClient operation under its method name"""
+    operation = func.__name__
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            result = func(*args, **kwargs)
+            # Several DockerClient methods report failure in-band
+            if result is False or (isinstance(result, dict) and "error" in result):
+                outcome = "error"
+            else:
+                outcome = "ok"
+            return result
+        finally:
+            DOCKER_API_DURATION.labels(operation, outcome).observe(time.perf_counter() - started)
+    return wrapper
+
+
+@contextmanager
+def startup_phase(service: str, phase: str):
+    """Time one step of service startup; the breakdown is logged and exported"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        STARTUP_PHASE_DURATION.labels(service, phase).set(seconds)
+        logger.info(f"Startup phase {phase} took {seconds * 1000:.0f}ms")
+
+
+def register_db_pool(service: str, engine):
+    """Export SQLAlchemy pool counters, read at scrape time"""
+    pool = engine.pool
+    for state, reader in (
+        ("size", getattr(pool, "size", None)),
+        ("checked_out", getattr(pool, "checkedout", None)),
+        ("checked_in", getattr(pool, "checkedin", None)),
+        ("overflow", getattr(pool, "overflow", None))
+    ):
+        if reader is not None:
+            DB_POOL_CONNECTIONS.labels(service, state).set_function(reader)
+
+
+def register_gauge(service: str, name: str, reader):
+    """Export a callable as a state gauge, read at scrape time"""
+    SERVICE_STATE.labels(service, name).set_function(reader)
+
+
+def setup_metrics(app: FastAPI, service: str, engine=None):
+    """Add request instrumentation and a /metrics endpoint to a service"""
+    app.add_middleware(PrometheusMiddleware, service=service)
+    if engine is not None:
+        register_db_pool(service, engine)
+
+    @app.get("/metrics", include_in_schema=False)
+    def metrics():
+        if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+            # Several worker processes: merge what every worker has written
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+            return Response(content=generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+        return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
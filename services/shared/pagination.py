@@ -0,0 +1,46 @@
+from typing import Optional, List, Any, Callable, Sequence, Tuple
+import heapq
+import base64
+import json
+import os
+
+# Keyset pagination shared by the listing endpoints of every service that pages.
+# A cursor is the sort key of the last item returned, so a page costs the same however deep it is
+# and items inserted meanwhile are neither skipped nor repeated.
+
+PAGE_DEFAULT_LIMIT = int(os.getenv("PAGE_DEFAULT_LIMIT", "50"))
+PAGE_MAX_LIMIT = int(os.getenv("PAGE_MAX_LIMIT", "200"))
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(sort: str, order: str, key: Sequence[Any]) -> str:
+    """Opaque cursor pointing just past the item with this sort key"""
+    payload = json.dumps({"s": sort, "o": order, "k": list(key)}, separators=(",", ":"), default=str)
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str, order: str) -> List[Any]:
+    """Sort key stored in a cursor; the cursor must come from a listing with the same sort"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        key = payload["k"]
+    except Exception:
+        raise InvalidCursor("Malformed cursor")
+    if payload.get("s") != sort or payload.get("o") != order:
+        raise InvalidCursor("Cursor belongs to a different sort order")
+    return key
+
+
+def paginate(items: List[Any], key: Callable[[Any], Tuple], limit: int,
+             after: Optional[Sequence[Any]] = None, descending: bool = False) -> Tuple[List[Any], bool]:
+    """One keyset page of in-memory items and whether more follow; keys must be unique"""
+    if after is not None:
+        after = tuple(after)
+        items = [item for item in items if (key(item) < after if descending else key(item) > after)]
+    # Only the page is sorted, not everything that matched
+    select = heapq.nlargest if descending else heapq.nsmallest
+    page = select(limit + 1, items, key=key)
+    return page[:limit], len(page) > limit
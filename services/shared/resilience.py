@@ -0,0 +1,232 @@
+from typing import Dict, Optional
+from metrics import observe_upstream, CIRCUIT_BREAKER_STATE, UPSTREAM_EVENTS
+import threading
+import asyncio
+import logging
+import random
+import httpx
+import time
+import os
+
+# Timeouts, circuit breakers and retry budgets for calls between services;
+# shared by every service that calls another service.
+
+logger = logging.getLogger(__name__)
+
+UPSTREAM_CONNECT_TIMEOUT_SECONDS = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT_SECONDS", "2"))
+UPSTREAM_READ_TIMEOUT_SECONDS = float(os.getenv("UPSTREAM_READ_TIMEOUT_SECONDS", "30"))
+# Per-upstream overrides as "name=connect:read,...", e.g. "auth-service=1:5,container-manager=2:120"
+UPSTREAM_TIMEOUTS = os.getenv("UPSTREAM_TIMEOUTS", "auth-service=1:5")
+# Consecutive failures that open a breaker, and how long it stays open before a probe
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+# Idempotent requests only: total attempts, base backoff, and retries allowed per request sent
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "3"))
+RETRY_BACKOFF_SECONDS = float(os.getenv("RETRY_BACKOFF_SECONDS", "0.1"))
+RETRY_BUDGET_RATIO = float(os.getenv("RETRY_BUDGET_RATIO", "0.1"))
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS"}
+RETRYABLE_STATUS_CODES = {502, 503, 504}
+
+
+def is_upstream_failure(response: httpx.Response) -> bool:
+    """Whether a response means the upstream is failing, as opposed to deliberately shedding load.
+
+    A 503 with Retry-After is an answer from a healthy upstream (admission control,
+    a full host) and neither trips the breaker nor is retried.
+    """
+    if response.status_code == 503:
+        return "retry-after" not in response.headers
+    return response.status_code in RETRYABLE_STATUS_CODES
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class UpstreamUnavailable(Exception):
+    """Raised without calling the upstream while its circuit breaker is open"""
+
+    def __init__(self, upstream: str, retry_after: float):
+        super().__init__(f"{upstream} is unavailable (circuit open)")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures, then lets a single probe through after a cool-down"""
+
+    def __init__(self, service: str, upstream: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.upstream = upstream
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._probe_started = 0.0
+        # Lab-manager's scheduler thread shares breakers with the request loop
+        self._lock = threading.Lock()
+        self._gauge = CIRCUIT_BREAKER_STATE.labels(service, upstream)
+        self._gauge.set(0)
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            logger.warning(f"Circuit breaker for {self.upstream}: {self.state} -> {state}")
+        self.state = state
+        self._gauge.set(_STATE_VALUES[state])
+
+    def retry_after(self) -> float:
+        return max(0.0, self.opened_at + self.reset_seconds - time.monotonic())
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and self.retry_after() > 0:
+                return False
+            # Cool-down over: exactly one caller probes, everyone else keeps failing fast.
+            # A probe that never reported back (cancelled) is abandoned after another cool-down.
+            if self._probing and time.monotonic() - self._probe_started < self.reset_seconds:
+                return False
+            self._set_state(HALF_OPEN)
+            self._probing = True
+            self._probe_started = time.monotonic()
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._probing = False
+            self._set_state(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._set_state(OPEN)
+
+    def to_dict(self) -> Dict:
+        return {"state": self.state, "failures": self.failures,
+                "retry_after_seconds": round(self.retry_after(), 1) if self.state != CLOSED else 0}
+
+
+class RetryBudget:
+    """Every request earns `ratio` of a retry; a retry spends one. Caps retries at ~ratio of traffic"""
+
+    def __init__(self, ratio: float = RETRY_BUDGET_RATIO, max_tokens: float = 10.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+def _parse_timeouts(value: str) -> Dict[str, httpx.Timeout]:
+    timeouts = {}
+    for item in filter(None, value.split(",")):
+        name, _, limits = item.partition("=")
+        connect, _, read = limits.partition(":")
+        connect_seconds = float(connect or UPSTREAM_CONNECT_TIMEOUT_SECONDS)
+        read_seconds = float(read or UPSTREAM_READ_TIMEOUT_SECONDS)
+        timeouts[name.strip()] = httpx.Timeout(read_seconds, connect=connect_seconds)
+    return timeouts
+
+
+_TIMEOUT_OVERRIDES = _parse_timeouts(UPSTREAM_TIMEOUTS)
+
+
+class Upstream:
+    """One downstream service as seen from this service: timeouts, breaker, retry budget and metrics"""
+
+    def __init__(self, service: str, name: str):
+        self.service = service
+        self.name = name
+        self.timeout = _TIMEOUT_OVERRIDES.get(
+            name, httpx.Timeout(UPSTREAM_READ_TIMEOUT_SECONDS, connect=UPSTREAM_CONNECT_TIMEOUT_SECONDS)
+        )
+        self.breaker = CircuitBreaker(service, name)
+        self.retry_budget = RetryBudget()
+
+    def _event(self, event: str):
+        UPSTREAM_EVENTS.labels(self.service, self.name, event).inc()
+
+    async def request(self, client: httpx.AsyncClient, method: str, url: str, timeout: Optional[float] = None,
+                      stream: bool = False, **kwargs) -> httpx.Response:
+        """Send a request through the breaker; retry idempotent methods on connection errors, 502, 504 and bare 503s.
+
+        With stream=True the body is left unread and the caller must close the response.
+        """
+        method = method.upper()
+        timeout = httpx.Timeout(timeout, connect=self.timeout.connect) if timeout else self.timeout
+        attempts = RETRY_MAX_ATTEMPTS if method in IDEMPOTENT_METHODS else 1
+        self.retry_budget.deposit()
+
+        for attempt in range(1, attempts + 1):
+            if not self.breaker.allow():
+                self._event("short_circuited")
+                raise UpstreamUnavailable(self.name, self.breaker.retry_after())
+
+            started = time.perf_counter()
+            try:
+                request = client.build_request(method, url, timeout=timeout, **kwargs)
+                response = await client.send(request, stream=stream)
+            except httpx.RequestError:
+                observe_upstream(self.service, self.name, method, 0, time.perf_counter() - started)
+                self.breaker.record_failure()
+                if not await self._should_retry(attempt, attempts):
+                    raise
+                continue
+
+            observe_upstream(self.service, self.name, method, response.status_code, time.perf_counter() - started)
+            if not is_upstream_failure(response):
+                self.breaker.record_success()
+                return response
+            self.breaker.record_failure()
+            if not await self._should_retry(attempt, attempts):
+                return response
+            await response.aclose()
+
+    async def _should_retry(self, attempt: int, attempts: int) -> bool:
+        if attempt >= attempts:
+            return False
+        if not self.retry_budget.withdraw():
+            self._event("retry_budget_exhausted")
+            return False
+        self._event("retried")
+        # Full jitter keeps retries from many callers from lining up
+        await asyncio.sleep(random.uniform(0, RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1)))
+        return True
+
+    def to_dict(self) -> Dict:
+        return {"breaker": self.breaker.to_dict()}
+
+
+_upstreams: Dict[str, Upstream] = {}
+
+
+def get_upstream(service: str, name: str) -> Upstream:
+    if name not in _upstreams:
+        _upstreams[name] = Upstream(service, name)
+    return _upstreams[name]
+
+
+def upstream_health() -> Dict[str, Dict]:
+    """Breaker state of every upstream this service has called, for /health"""
+    return {name: upstream.to_dict() for name, upstream in _upstreams.items()}
+
+
+def degraded() -> bool:
+    return any(upstream.breaker.state != CLOSED for upstream in _upstreams.values())
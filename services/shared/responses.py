@@ -0,0 +1,11 @@
+from fastapi.responses import JSONResponse
+from typing import Any
+import orjson
+
+
+class OrjsonResponse(JSONResponse):
+    """JSONResponse rendered with orjson, replacing FastAPI's deprecated ORJSONResponse"""
+
+    def render(self, content: Any) -> bytes:
+        # Non-string keys are stringified as the stdlib encoder does
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
@@ -0,0 +1,109 @@
+from typing import Optional, Dict, List, Any, Callable
+from types import MappingProxyType
+import threading
+import hashlib
+import logging
+import json
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+# Shared template catalog, kept once in services/shared with the templates.json manifest
+# and copied next to the app of every service that uses it when its image is built.
+TEMPLATE_MANIFEST = os.getenv("TEMPLATE_MANIFEST", os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates.json"))
+# How often the manifest's mtime is checked for changes; 0 disables reloading
+TEMPLATE_RELOAD_SECONDS = float(os.getenv("TEMPLATE_RELOAD_SECONDS", "5"))
+
+
+def default_serializer(templates: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {"data": templates}
+
+
+class CatalogSnapshot:
+    """One immutable version of the catalog with its lookup indexes and response body"""
+
+    def __init__(self, manifest: Dict[str, Any], serialize: Callable[[List[Dict[str, Any]]], Any]):
+        self.version = int(manifest["version"])
+        self.manifest = manifest
+        templates = [MappingProxyType(dict(template)) for template in manifest["templates"]]
+        self.templates = tuple(templates)
+        self.by_id = MappingProxyType({template["id"]: template for template in templates})
+        # First template wins when several share an image
+        by_image: Dict[str, Any] = {}
+        for template in templates:
+            by_image.setdefault(template["image"], template)
+        self.by_image = MappingProxyType(by_image)
+        # /templates is served from these bytes as-is
+        self.body = json.dumps(serialize([dict(template) for template in templates]), separators=(",", ":")).encode()
+        self.etag = f'"{self.version}-{hashlib.sha1(self.body).hexdigest()[:16]}"'
+
+
+class TemplateCatalog:
+    """Lab templates loaded once from the manifest and swapped atomically when it changes.
+
+    Readers take `catalog.snapshot` (or use get/by_image) and never block; the manifest's
+    mtime is checked at most every TEMPLATE_RELOAD_SECONDS on access. Subscribers are
+    called with each new snapshot, so dependent state is refreshed on change rather
+    than on every request.
+    """
+
+    def __init__(self, path: str = TEMPLATE_MANIFEST, reload_seconds: float = TEMPLATE_RELOAD_SECONDS,
+                 serialize: Callable[[List[Dict[str, Any]]], Any] = default_serializer):
+        self.path = path
+        self.reload_seconds = reload_seconds
+        self.serialize = serialize
+        self._subscribers: List[Callable[[CatalogSnapshot], None]] = []
+        self._lock = threading.Lock()
+        self._mtime = os.path.getmtime(path)
+        self._checked_at = time.monotonic()
+        self._snapshot = self._load()
+        logger.info(f"Loaded {len(self._snapshot.templates)} templates (version {self._snapshot.version}) from {path}")
+
+    def _load(self) -> CatalogSnapshot:
+        with open(self.path) as manifest_file:
+            return CatalogSnapshot(json.load(manifest_file), self.serialize)
+
+    def subscribe(self, callback: Callable[[CatalogSnapshot], None]):
+        """Call callback with every new snapshot"""
+        self._subscribers.append(callback)
+
+    def _notify(self, snapshot: CatalogSnapshot):
+        for callback in self._subscribers:
+            try:
+                callback(snapshot)
+            except Exception as e:
+                logger.error(f"Template catalog subscriber failed on version {snapshot.version}: {e}")
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if not self.reload_seconds or now - self._checked_at < self.reload_seconds:
+            return
+        with self._lock:
+            if now - self._checked_at < self.reload_seconds:
+                return
+            self._checked_at = now
+            try:
+                mtime = os.path.getmtime(self.path)
+                if mtime == self._mtime:
+                    return
+                snapshot = self._load()
+            except Exception as e:
+                # Keep serving the last good catalog
+                logger.error(f"Failed to reload template manifest {self.path}: {e}")
+                return
+            self._mtime = mtime
+            self._snapshot = snapshot
+            logger.info(f"Reloaded {len(snapshot.templates)} templates (version {snapshot.version}) from {self.path}")
+        self._notify(snapshot)
+
+    @property
+    def snapshot(self) -> CatalogSnapshot:
+        self._maybe_reload()
+        return self._snapshot
+
+    def get(self, template_id: str) -> Optional[Dict[str, Any]]:
+        return self.snapshot.by_id.get(template_id)
+
+    def by_image(self, image: str) -> Optional[Dict[str, Any]]:
+        return self.snapshot.by_image.get(image)
@@ -0,0 +1,109 @@
+from opentelemetry import trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, SpanExporter, SpanExportResult, ConsoleSpanExporter
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+from fastapi import FastAPI
+from functools import wraps
+import threading
+import logging
+import json
+import os
+
+# Shared tracing setup, copied into every service image.
+
+logger = logging.getLogger(__name__)
+
+# "none" (default), "otlp", "file" or "console"
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "none")
+TRACING_FILE = os.getenv("TRACING_FILE", "")
+TRACING_SAMPLE_RATIO = float(os.getenv("TRACING_SAMPLE_RATIO", "1.0"))
+
+tracer = trace.get_tracer("fluxlabs")
+
+
+class JsonFileSpanExporter(SpanExporter):
+    """Append finished spans as JSON lines, for offline analysis without a collector"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans) -> SpanExportResult:
+        lines = []
+        for span in spans:
+            context = span.get_span_context()
+            lines.append(json.dumps({
+                "service": span.resource.attributes.get("service.name"),
+                "name": span.name,
+                "trace_id": format(context.trace_id, "032x"),
+                "span_id": format(context.span_id, "016x"),
+                "parent_id": format(span.parent.span_id, "016x") if span.parent else None,
+                "kind": span.kind.name,
+                "start_ns": span.start_time,
+                "duration_ms": round((span.end_time - span.start_time) / 1e6, 3),
+                "status": span.status.status_code.name,
+                "attributes": {k: v if isinstance(v, (str, int, float, bool)) else str(v)
+                               for k, v in (span.attributes or {}).items()}
+            }))
+        try:
+            with self._lock, open(self.path, "a") as trace_file:
+                trace_file.write("\n".join(lines) + "\n")
+        except OSError as e:
+            logger.warning(f"Failed to write traces to {self.path}: {e}")
+            return SpanExportResult.FAILURE
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self):
+        pass
+
+
+def _build_exporter(service: str):
+    if TRACING_EXPORTER == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        # Endpoint comes from OTEL_EXPORTER_OTLP_ENDPOINT
+        return OTLPSpanExporter()
+    if TRACING_EXPORTER == "file":
+        return JsonFileSpanExporter(TRACING_FILE or f"/tmp/fluxlabs-traces-{service}.jsonl")
+    if TRACING_EXPORTER == "console":
+        return ConsoleSpanExporter()
+    return None
+
+
+def setup_tracing(app: FastAPI, service: str, engine=None, httpx_client: bool = False):
+    """Install a tracer provider and instrument FastAPI, httpx and SQLAlchemy as requested"""
+    exporter = _build_exporter(service)
+    if exporter is None:
+        return
+
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": service}),
+        sampler=ParentBased(TraceIdRatioBased(TRACING_SAMPLE_RATIO))
+    )
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+
+    from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+    FastAPIInstrumentor.instrument_app(app, tracer_provider=provider, excluded_urls="health,metrics")
+
+    if httpx_client:
+        # Injects traceparent into every outgoing httpx request
+        from opentelemetry.instrumentation.httpx import HTTPXClientInstrumentor
+        HTTPXClientInstrumentor().instrument(tracer_provider=provider)
+
+    if engine is not None:
+        from opentelemetry.instrumentation.sqlalchemy import SQLAlchemyInstrumentor
+        SQLAlchemyInstrumentor().instrument(engine=engine, tracer_provider=provider)
+
+    logger.info(f"Tracing enabled for {service} ({TRACING_EXPORTER} exporter)")
+
+
+def trace_call(name: str):
+    """Decorator running a function inside a span"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with tracer.start_as_current_span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
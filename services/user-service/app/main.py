@@ -1,37 +1,29 @@
 from fastapi import FastAPI, Depends, HTTPException, Header
+from responses import OrjsonResponse
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from typing import Optional
-from database import get_database, engine, Base
+from database import get_database, engine, ensure_schema, database_ready
 from crud import (
     get_user_profile, create_user_profile, update_user_profile,
     get_user_settings, create_user_settings, update_user_settings
 )
+from metrics import setup_metrics, startup_phase
+from log_config import setup_logging
+from tracing import setup_tracing
+from resilience import get_upstream, upstream_health, degraded, UpstreamUnavailable
 import httpx
 import uvicorn
 import os
 import logging
-import sys
 
 # Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+setup_logging("user-service")
 logger = logging.getLogger(__name__)
 
-# Create tables
-try:
-    Base.metadata.create_all(bind=engine)
-    logger.info("Database tables created successfully")
-except Exception as e:
-    logger.error(f"Failed to create database tables: {e}")
-    raise
-
-app = FastAPI(title="User Service", version="1.0.0")
+app = FastAPI(title="User Service", version="1.0.0", default_response_class=OrjsonResponse)
+setup_metrics(app, "user-service", engine=engine)
+setup_tracing(app, "user-service", engine=engine, httpx_client=True)
 
 AUTH_SERVICE_URL = os.getenv("AUTH_SERVICE_URL", "http://auth-service:8001")
 
@@ -61,8 +53,8 @@ async def verify_token(authorization: str = Header(None)):
     token = authorization.split(" ")[1]
     async with httpx.AsyncClient() as client:
         try:
-            response = await client.post(
-                f"{AUTH_SERVICE_URL}/verify",
+            response = await get_upstream("user-service", "auth-service").request(
+                client, "POST", f"{AUTH_SERVICE_URL}/verify",
                 headers={"Authorization": f"Bearer {token}"}
             )
             if response.status_code != 200:
@@ -70,6 +62,8 @@ async def verify_token(authorization: str = Header(None)):
             
             data = response.json()
             return data["email"]
+        except UpstreamUnavailable as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(int(e.retry_after) + 1)})
         except Exception:
             raise HTTPException(status_code=401, detail="Token verification failed")
 
@@ -112,7 +106,25 @@ def update_settings(user_id: int, settings_data: UserSettingsUpdate, db: Session
 
 @app.get("/health")
 def health_check():
-    return {"status": "healthy"}
+    return {"status": "degraded" if degraded() else "healthy", "upstreams": upstream_health()}
+
+@app.get("/health/live")
+def liveness_check():
+    """The process is up and serving; never touches dependencies"""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+def readiness_check():
+    """Ready once the database answers and the tables exist"""
+    if not database_ready():
+        return OrjsonResponse(status_code=503, content={"status": "not ready", "database": False})
+    return {"status": "ready", "database": True}
+
+@app.on_event("startup")
+def startup_event():
+    # Tables are created here, or on first use if the database is not up yet
+    with startup_phase("user-service", "schema"):
+        ensure_schema()
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8002)